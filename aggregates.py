@@ -0,0 +1,754 @@
+"""
+aggregates.py
+-------------
+Pre-aggregated statistics tables for GPTLeague, maintained incrementally as
+games are inserted so stats pages never have to rescan every game.
+
+- `faction_cube`: per (season, system, faction, points_band, location, month)
+  totals of games, wins, draws, losses and battle ready armies.
+- `faction_matchups`: sparse faction-vs-faction matrix per (season, system)
+  holding games, wins, draws and losses for each ordered faction pair.
+- `head_to_head`: per (season, system, player, opponent) games, wins, draws,
+  losses and last_played, stored from both players' side so head-to-head
+  lookups and per-player opponent sets are index lookups.
+- `player_daily_totals` / `location_daily_totals`: cumulative (prefix-sum) totals
+  per player or location and system up to each day with games, so any
+  [from, to] window is the difference of two lookups.
+- `game_fingerprints`: one row per game keyed by (system, day, unordered player
+  pair, result from the lower player id's side) so a resubmitted result is
+  found with an index lookup before it is inserted again.
+
+Call `record_game()` (or `record_games()` for a batch) in the same transaction
+that inserts a game and its participants. `rebuild_aggregates()` recomputes
+everything from scratch, including seasons in cold storage.
+"""
+
+import sqlite3
+import logging
+
+from archive import attach_archives
+
+logger = logging.getLogger(__name__)
+
+
+AGGREGATE_SCHEMA = {
+    'faction_cube': """
+        CREATE TABLE IF NOT EXISTS faction_cube (
+            season_id INTEGER NOT NULL,
+            system_id INTEGER NOT NULL,
+            faction_id INTEGER NOT NULL,
+            points_band TEXT NOT NULL,
+            location_id INTEGER NOT NULL DEFAULT 0,   -- 0 when the game has no location
+            month TEXT NOT NULL,                      -- 'YYYY-MM' of played_on
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            battle_ready INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (season_id, system_id, faction_id, points_band, location_id, month)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_faction_cube_month ON faction_cube(month, system_id);
+    """,
+    'faction_matchups': """
+        CREATE TABLE IF NOT EXISTS faction_matchups (
+            season_id INTEGER NOT NULL,
+            system_id INTEGER NOT NULL,
+            faction_id INTEGER NOT NULL,
+            opponent_faction_id INTEGER NOT NULL,
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (season_id, system_id, faction_id, opponent_faction_id)
+        ) WITHOUT ROWID;
+    """,
+    'head_to_head': """
+        CREATE TABLE IF NOT EXISTS head_to_head (
+            season_id INTEGER NOT NULL,
+            system_id INTEGER NOT NULL,
+            player_id INTEGER NOT NULL,
+            opponent_id INTEGER NOT NULL,
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            last_played TEXT,
+            PRIMARY KEY (season_id, system_id, player_id, opponent_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_head_to_head_player ON head_to_head(player_id, season_id);
+    """,
+    'player_daily_totals': """
+        CREATE TABLE IF NOT EXISTS player_daily_totals (
+            system_id INTEGER NOT NULL,
+            player_id INTEGER NOT NULL,
+            day TEXT NOT NULL,                        -- 'YYYY-MM-DD'; totals include this day
+            points INTEGER NOT NULL DEFAULT 0,        -- Option A points, no opponent limit
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (system_id, player_id, day)
+        ) WITHOUT ROWID;
+    """,
+    'location_daily_totals': """
+        CREATE TABLE IF NOT EXISTS location_daily_totals (
+            system_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            day TEXT NOT NULL,                        -- 'YYYY-MM-DD'; totals include this day
+            games INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (system_id, location_id, day)
+        ) WITHOUT ROWID;
+    """,
+    'game_fingerprints': """
+        CREATE TABLE IF NOT EXISTS game_fingerprints (
+            system_id INTEGER NOT NULL,
+            day TEXT NOT NULL,                        -- 'YYYY-MM-DD' of played_on
+            player_low INTEGER NOT NULL,              -- lower player_id of the pair
+            player_high INTEGER NOT NULL,
+            low_result TEXT NOT NULL,                 -- player_low's result
+            game_id INTEGER NOT NULL,
+            PRIMARY KEY (system_id, day, player_low, player_high, low_result, game_id)
+        ) WITHOUT ROWID;
+    """,
+}
+
+
+# One row per participant of the selected games, shaped for the cube.
+# `{games}` / `{participants}` are the base tables or the league_* views.
+_FACTION_CUBE_SELECT = """
+    SELECT g.season_id, g.system_id, gp.faction_id, g.points_band,
+           COALESCE(g.location_id, 0), substr(g.played_on, 1, 7),
+           COUNT(*),
+           SUM(gp.result = 'win'),
+           SUM(gp.result = 'draw'),
+           SUM(gp.result = 'loss'),
+           SUM(gp.painting_battle_ready != 0)
+    FROM {games} g
+    JOIN {participants} gp ON gp.game_id = g.game_id
+    WHERE gp.faction_id IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+_FACTION_CUBE_COLUMNS = """
+    (season_id, system_id, faction_id, points_band, location_id, month,
+     games, wins, draws, losses, battle_ready)
+"""
+
+# One row per ordered faction pair of the selected games, from each side's view.
+_FACTION_MATCHUPS_SELECT = """
+    SELECT g.season_id, g.system_id, gp1.faction_id, gp2.faction_id,
+           COUNT(*),
+           SUM(gp1.result = 'win'),
+           SUM(gp1.result = 'draw'),
+           SUM(gp1.result = 'loss')
+    FROM {games} g
+    JOIN {participants} gp1 ON gp1.game_id = g.game_id
+    JOIN {participants} gp2 ON gp2.game_id = g.game_id AND gp2.player_id != gp1.player_id
+    WHERE gp1.faction_id IS NOT NULL AND gp2.faction_id IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4
+"""
+
+_FACTION_MATCHUPS_COLUMNS = """
+    (season_id, system_id, faction_id, opponent_faction_id, games, wins, draws, losses)
+"""
+
+# One row per ordered player pair of the selected games, from each side's view.
+_HEAD_TO_HEAD_SELECT = """
+    SELECT g.season_id, g.system_id, gp1.player_id, gp2.player_id,
+           COUNT(*),
+           SUM(gp1.result = 'win'),
+           SUM(gp1.result = 'draw'),
+           SUM(gp1.result = 'loss'),
+           MAX(g.played_on)
+    FROM {games} g
+    JOIN {participants} gp1 ON gp1.game_id = g.game_id
+    JOIN {participants} gp2 ON gp2.game_id = g.game_id AND gp2.player_id != gp1.player_id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+"""
+
+_HEAD_TO_HEAD_COLUMNS = """
+    (season_id, system_id, player_id, opponent_id, games, wins, draws, losses, last_played)
+"""
+
+# Option A scoring (see stats.overall): big games 4/2/1, small games 2/1/0.
+_OPTION_A_POINTS = """
+    CASE WHEN g.points_band IN ('1000', '1500', '2000')
+         THEN CASE gp.result WHEN 'win' THEN 4 WHEN 'draw' THEN 2 ELSE 1 END
+         ELSE CASE gp.result WHEN 'win' THEN 2 WHEN 'draw' THEN 1 ELSE 0 END
+    END
+"""
+
+# Per-day deltas for the prefix-sum tables. Columns are named so the same
+# select feeds both the running totals of a rebuild and the incremental update.
+_PLAYER_DAY_SELECT = f"""
+    SELECT g.system_id, gp.player_id, DATE(g.played_on) AS day,
+           SUM({_OPTION_A_POINTS}) AS points,
+           COUNT(*) AS games,
+           SUM(gp.result = 'win') AS wins,
+           SUM(gp.result = 'draw') AS draws,
+           SUM(gp.result = 'loss') AS losses
+    FROM {{games}} g
+    JOIN {{participants}} gp ON gp.game_id = g.game_id
+    WHERE {{where}}
+    GROUP BY 1, 2, 3
+"""
+
+_LOCATION_DAY_SELECT = """
+    SELECT g.system_id, g.location_id, DATE(g.played_on) AS day,
+           COUNT(*) AS games
+    FROM {games} g
+    WHERE g.location_id IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3
+"""
+
+# One row per two-player game of the selection, players in id order.
+_GAME_FINGERPRINT_SELECT = """
+    SELECT g.system_id, DATE(g.played_on), gp1.player_id, gp2.player_id, gp1.result, g.game_id
+    FROM {games} g
+    JOIN {participants} gp1 ON gp1.game_id = g.game_id
+    JOIN {participants} gp2 ON gp2.game_id = g.game_id AND gp2.player_id > gp1.player_id
+    WHERE {where}
+"""
+
+# Result of the other player
+_OPPOSITE_RESULT = {'win': 'loss', 'loss': 'win', 'draw': 'draw'}
+
+# table -> (key columns, measure columns, per-day delta select)
+_PREFIX_TABLES = {
+    'player_daily_totals': (
+        ('system_id', 'player_id'),
+        ('points', 'games', 'wins', 'draws', 'losses'),
+        _PLAYER_DAY_SELECT
+    ),
+    'location_daily_totals': (
+        ('system_id', 'location_id'),
+        ('games',),
+        _LOCATION_DAY_SELECT
+    ),
+}
+
+
+def ensure_aggregate_tables(connection):
+    """
+    Create any missing aggregate tables and backfill them from existing games.
+
+    Args:
+        connection (sqlite3.Connection): Active database connection.
+    """
+    cursor = connection.cursor()
+    existing = {row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    ).fetchall()}
+    missing = [table for table in AGGREGATE_SCHEMA if table not in existing]
+    for table in missing:
+        cursor.executescript(AGGREGATE_SCHEMA[table])
+    if missing:
+        logger.info(f"Created aggregate tables: {', '.join(missing)}")
+        rebuild_aggregates(connection, missing)
+        connection.commit()
+
+
+def record_game(game_id, connection):
+    """
+    Add one newly inserted game to every aggregate table.
+
+    Args:
+        game_id (int): The game identifier; its participants must already exist.
+        connection (sqlite3.Connection): Active database connection. The caller commits.
+    """
+    record_games([game_id], connection)
+
+
+def record_games(game_ids, connection):
+    """
+    Add a batch of newly inserted games to every aggregate table with one
+    set-based statement per table.
+
+    Args:
+        game_ids (list): Game identifiers; their participants must already exist.
+        connection (sqlite3.Connection): Active database connection. The caller commits.
+    """
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS temp.recorded_games")
+    cursor.execute("CREATE TEMP TABLE recorded_games (game_id INTEGER PRIMARY KEY)")
+    cursor.executemany("INSERT OR IGNORE INTO temp.recorded_games (game_id) VALUES (?)",
+                       [(game_id,) for game_id in game_ids])
+    where = "g.game_id IN (SELECT game_id FROM temp.recorded_games)"
+
+    select = _FACTION_CUBE_SELECT.format(
+        games='games', participants='game_participants', where=where
+    )
+    cursor.execute(f"""
+        INSERT INTO faction_cube {_FACTION_CUBE_COLUMNS}
+        {select}
+        ON CONFLICT (season_id, system_id, faction_id, points_band, location_id, month) DO UPDATE SET
+            games = games + excluded.games,
+            wins = wins + excluded.wins,
+            draws = draws + excluded.draws,
+            losses = losses + excluded.losses,
+            battle_ready = battle_ready + excluded.battle_ready
+    """)
+
+    select = _FACTION_MATCHUPS_SELECT.format(
+        games='games', participants='game_participants', where=where
+    )
+    cursor.execute(f"""
+        INSERT INTO faction_matchups {_FACTION_MATCHUPS_COLUMNS}
+        {select}
+        ON CONFLICT (season_id, system_id, faction_id, opponent_faction_id) DO UPDATE SET
+            games = games + excluded.games,
+            wins = wins + excluded.wins,
+            draws = draws + excluded.draws,
+            losses = losses + excluded.losses
+    """)
+
+    select = _HEAD_TO_HEAD_SELECT.format(
+        games='games', participants='game_participants', where=where
+    )
+    cursor.execute(f"""
+        INSERT INTO head_to_head {_HEAD_TO_HEAD_COLUMNS}
+        {select}
+        ON CONFLICT (season_id, system_id, player_id, opponent_id) DO UPDATE SET
+            games = games + excluded.games,
+            wins = wins + excluded.wins,
+            draws = draws + excluded.draws,
+            losses = losses + excluded.losses,
+            last_played = MAX(COALESCE(last_played, ''), excluded.last_played)
+    """)
+
+    for table in _PREFIX_TABLES:
+        _record_prefix(cursor, table, where)
+
+    select = _GAME_FINGERPRINT_SELECT.format(
+        games='games', participants='game_participants', where=where
+    )
+    cursor.execute(f"INSERT OR IGNORE INTO game_fingerprints {select}")
+
+    cursor.execute("DROP TABLE temp.recorded_games")
+
+
+def _key_match(keys, left, right):
+    return ' AND '.join(f"{left}.{key} = {right}.{key}" for key in keys)
+
+
+def _record_prefix(cursor, table, where):
+    """
+    Add the selected games to a prefix-sum table: seed a row for each new day
+    from the latest earlier total, then add to every day the sum of the new
+    games' deltas on or before it.
+    """
+    keys, measures, select = _PREFIX_TABLES[table]
+    delta = select.format(games='games', participants='game_participants', where=where)
+    key_columns = ', '.join(keys)
+
+    cursor.execute("DROP TABLE IF EXISTS temp.prefix_delta")
+    cursor.execute(f"CREATE TEMP TABLE prefix_delta AS {delta}")
+
+    cursor.execute(f"""
+        INSERT INTO {table} ({key_columns}, day, {', '.join(measures)})
+        SELECT {', '.join(f'd.{key}' for key in keys)}, d.day,
+               {', '.join(f'COALESCE(p.{m}, 0)' for m in measures)}
+        FROM temp.prefix_delta d
+        LEFT JOIN {table} p ON {_key_match(keys, 'p', 'd')}
+            AND p.day = (SELECT MAX(t.day) FROM {table} t WHERE {_key_match(keys, 't', 'd')} AND t.day < d.day)
+        WHERE 1
+        ON CONFLICT ({key_columns}, day) DO NOTHING
+    """)
+
+    cursor.execute("DROP TABLE IF EXISTS temp.prefix_cumulative")
+    cursor.execute(f"""
+        CREATE TEMP TABLE prefix_cumulative AS
+        SELECT {', '.join(f't.{key}' for key in keys)}, t.day,
+               {', '.join(f'SUM(d.{m}) AS {m}' for m in measures)}
+        FROM {table} t
+        JOIN temp.prefix_delta d ON {_key_match(keys, 't', 'd')} AND d.day <= t.day
+        GROUP BY {', '.join(f't.{key}' for key in keys)}, t.day
+    """)
+    cursor.execute(f"""
+        UPDATE {table} AS t SET {', '.join(f'{m} = t.{m} + c.{m}' for m in measures)}
+        FROM temp.prefix_cumulative c
+        WHERE {_key_match(keys, 't', 'c')} AND t.day = c.day
+    """)
+
+    cursor.execute("DROP TABLE temp.prefix_delta")
+    cursor.execute("DROP TABLE temp.prefix_cumulative")
+
+
+def _rebuild_prefix(cursor, table):
+    """Recompute a prefix-sum table as running totals over every game."""
+    keys, measures, select = _PREFIX_TABLES[table]
+    delta = select.format(games='league_games', participants='league_game_participants', where='1')
+    key_columns = ', '.join(keys)
+    cursor.execute(f"DELETE FROM {table}")
+    cursor.execute(f"""
+        INSERT INTO {table} ({key_columns}, day, {', '.join(measures)})
+        SELECT {key_columns}, day, {', '.join(f'SUM({m}) OVER w' for m in measures)}
+        FROM ({delta})
+        WINDOW w AS (PARTITION BY {key_columns} ORDER BY day)
+    """)
+
+
+def rebuild_aggregates(connection, tables=None):
+    """
+    Recompute aggregate tables from every game, including cold storage.
+
+    Args:
+        connection (sqlite3.Connection): Active database connection. The caller commits.
+        tables (list): Aggregate tables to rebuild; all of them when omitted.
+    """
+    tables = tables or list(AGGREGATE_SCHEMA)
+    cursor = connection.cursor()
+    attach_archives(connection, '0000-01-01', '9999-12-31')
+
+    if 'faction_cube' in tables:
+        cursor.execute("DELETE FROM faction_cube")
+        select = _FACTION_CUBE_SELECT.format(
+            games='league_games', participants='league_game_participants', where='1'
+        )
+        cursor.execute(f"INSERT INTO faction_cube {_FACTION_CUBE_COLUMNS} {select}")
+
+    if 'faction_matchups' in tables:
+        cursor.execute("DELETE FROM faction_matchups")
+        select = _FACTION_MATCHUPS_SELECT.format(
+            games='league_games', participants='league_game_participants', where='1'
+        )
+        cursor.execute(f"INSERT INTO faction_matchups {_FACTION_MATCHUPS_COLUMNS} {select}")
+
+    if 'head_to_head' in tables:
+        cursor.execute("DELETE FROM head_to_head")
+        select = _HEAD_TO_HEAD_SELECT.format(
+            games='league_games', participants='league_game_participants', where='1'
+        )
+        cursor.execute(f"INSERT INTO head_to_head {_HEAD_TO_HEAD_COLUMNS} {select}")
+
+    for table in _PREFIX_TABLES:
+        if table in tables:
+            _rebuild_prefix(cursor, table)
+
+    if 'game_fingerprints' in tables:
+        cursor.execute("DELETE FROM game_fingerprints")
+        select = _GAME_FINGERPRINT_SELECT.format(
+            games='league_games', participants='league_game_participants', where='1'
+        )
+        cursor.execute(f"INSERT INTO game_fingerprints {select}")
+
+    logger.info(f"Rebuilt aggregate tables: {', '.join(tables)}")
+
+
+def faction_rollup(cursor, start_month, end_month, points_band=None, location_id=None, month=None,
+                   end_date=None):
+    """
+    Roll the faction cube up to one row per (system, faction).
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor with row_factory = sqlite3.Row.
+        start_month (str): First month ('YYYY-MM') to include.
+        end_month (str): Last month ('YYYY-MM') to include.
+        points_band (str): Only include this points band.
+        location_id (int): Only include this location (0 for games without one).
+        month (str): Only include this month.
+        end_date (str): Stop at this date ('YYYY-MM-DD') within end_month. The cube
+            only has whole months, so end_month is then counted from the games.
+
+    Returns:
+        list: Rows with system_name, faction_name, games, wins, draws, losses, battle_ready.
+    """
+    source = "faction_cube"
+    params = []
+    if end_date:
+        live = _FACTION_CUBE_SELECT.format(
+            games='games', participants='game_participants', where="g.played_on >= ? AND g.played_on <= ?"
+        )
+        source = f"""(
+            SELECT season_id, system_id, faction_id, points_band, location_id, month,
+                   games, wins, draws, losses, battle_ready
+            FROM faction_cube WHERE month < ?
+            UNION ALL
+            {live}
+        )"""
+        params += [end_month, f"{end_month}-01", end_date]
+
+    where = ["c.month BETWEEN ? AND ?"]
+    params += [start_month, end_month]
+    if points_band:
+        where.append("c.points_band = ?")
+        params.append(points_band)
+    if location_id is not None:
+        where.append("c.location_id = ?")
+        params.append(location_id)
+    if month:
+        where.append("c.month = ?")
+        params.append(month)
+
+    return cursor.execute(f"""
+        SELECT s.system_name, f.faction_name,
+               SUM(c.games) AS games,
+               SUM(c.wins) AS wins,
+               SUM(c.draws) AS draws,
+               SUM(c.losses) AS losses,
+               SUM(c.battle_ready) AS battle_ready
+        FROM {source} c
+        JOIN factions f ON f.faction_id = c.faction_id
+        JOIN systems s ON s.system_id = c.system_id
+        WHERE {' AND '.join(where)}
+        GROUP BY c.system_id, c.faction_id
+        ORDER BY s.system_name, f.faction_name
+    """, params).fetchall()
+
+
+def faction_matchups(cursor, season_id=None, system_id=None):
+    """
+    Read the faction-vs-faction matrix, summed over seasons when season_id is None.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor with row_factory = sqlite3.Row.
+        season_id (int): Only include this season.
+        system_id (int): Only include this system.
+
+    Returns:
+        list: Rows with system_id, system_name, faction_id, faction_name,
+              opponent_faction_id, opponent_name, games, wins, draws, losses.
+    """
+    where = ["1"]
+    params = []
+    if season_id is not None:
+        where.append("m.season_id = ?")
+        params.append(season_id)
+    if system_id is not None:
+        where.append("m.system_id = ?")
+        params.append(system_id)
+
+    return cursor.execute(f"""
+        SELECT m.system_id, s.system_name,
+               m.faction_id, f.faction_name,
+               m.opponent_faction_id, o.faction_name AS opponent_name,
+               SUM(m.games) AS games,
+               SUM(m.wins) AS wins,
+               SUM(m.draws) AS draws,
+               SUM(m.losses) AS losses
+        FROM faction_matchups m
+        JOIN systems s ON s.system_id = m.system_id
+        JOIN factions f ON f.faction_id = m.faction_id
+        JOIN factions o ON o.faction_id = m.opponent_faction_id
+        WHERE {' AND '.join(where)}
+        GROUP BY m.system_id, m.faction_id, m.opponent_faction_id
+        ORDER BY s.system_name, f.faction_name, o.faction_name
+    """, params).fetchall()
+
+
+def head_to_head(cursor, player_id, opponent_id, season_id=None, system_id=None):
+    """
+    Head-to-head record of player_id against opponent_id.
+
+    Returns:
+        sqlite3.Row: games, wins, draws, losses and last_played (zeros when never played).
+    """
+    where = ["player_id = ?", "opponent_id = ?"]
+    params = [player_id, opponent_id]
+    if season_id is not None:
+        where.append("season_id = ?")
+        params.append(season_id)
+    if system_id is not None:
+        where.append("system_id = ?")
+        params.append(system_id)
+
+    return cursor.execute(f"""
+        SELECT COALESCE(SUM(games), 0) AS games,
+               COALESCE(SUM(wins), 0) AS wins,
+               COALESCE(SUM(draws), 0) AS draws,
+               COALESCE(SUM(losses), 0) AS losses,
+               MAX(last_played) AS last_played
+        FROM head_to_head
+        WHERE {' AND '.join(where)}
+    """, params).fetchone()
+
+
+def opponent_records(cursor, player_id, season_id=None):
+    """
+    Every opponent player_id has faced, with the head-to-head record per system.
+
+    Returns:
+        list: Rows with system_name, opponent_id, opponent_name, games, wins,
+              draws, losses and last_played, most recently played first.
+    """
+    where = ["h.player_id = ?"]
+    params = [player_id]
+    if season_id is not None:
+        where.append("h.season_id = ?")
+        params.append(season_id)
+
+    return cursor.execute(f"""
+        SELECT s.system_name, h.opponent_id, u.user_name AS opponent_name,
+               SUM(h.games) AS games,
+               SUM(h.wins) AS wins,
+               SUM(h.draws) AS draws,
+               SUM(h.losses) AS losses,
+               MAX(h.last_played) AS last_played
+        FROM head_to_head h
+        JOIN systems s ON s.system_id = h.system_id
+        JOIN users u ON u.user_id = h.opponent_id
+        WHERE {' AND '.join(where)}
+        GROUP BY h.system_id, h.opponent_id
+        ORDER BY last_played DESC
+    """, params).fetchall()
+
+
+def unplayed_opponents(cursor, player_id, season_id):
+    """
+    Club members of a season that player_id has not played yet that season.
+
+    Returns:
+        list: Rows with user_id and user_name, ordered by user_name.
+    """
+    return cursor.execute("""
+        SELECT u.user_id, u.user_name
+        FROM club_memberships cm
+        JOIN users u ON u.user_id = cm.user_id
+        WHERE cm.season_id = ? AND cm.is_member = 1 AND cm.user_id != ?
+          AND NOT EXISTS (
+              SELECT 1 FROM head_to_head h
+              WHERE h.player_id = ? AND h.season_id = cm.season_id AND h.opponent_id = cm.user_id
+          )
+        ORDER BY u.user_name
+    """, (season_id, player_id, player_id)).fetchall()
+
+
+def _window_select(table, where='1'):
+    """
+    SELECT over a prefix-sum table returning, per key, the totals inside
+    [start, end] as cumulative(end) - cumulative(start - 1 day).
+
+    Placeholders: the `where` parameters, then end day, then start day.
+    """
+    keys, measures, _ = _PREFIX_TABLES[table]
+    key_columns = ', '.join(keys)
+    key_match = _key_match(keys, 't', 'k')
+    return f"""
+        WITH k AS (
+            SELECT DISTINCT {key_columns} FROM {table} WHERE {where}
+        ), bounds AS (
+            SELECT {key_columns},
+                   (SELECT MAX(t.day) FROM {table} t WHERE {key_match} AND t.day <= ?) AS end_day,
+                   (SELECT MAX(t.day) FROM {table} t WHERE {key_match} AND t.day < ?) AS before_day
+            FROM k
+        )
+        SELECT {', '.join(f'b.{key}' for key in keys)},
+               {', '.join(f'hi.{m} - COALESCE(lo.{m}, 0) AS {m}' for m in measures)}
+        FROM bounds b
+        JOIN {table} hi ON {_key_match(keys, 'hi', 'b')} AND hi.day = b.end_day
+        LEFT JOIN {table} lo ON {_key_match(keys, 'lo', 'b')} AND lo.day = b.before_day
+        WHERE hi.games > COALESCE(lo.games, 0)
+    """
+
+
+def player_window_totals(cursor, start_date, end_date, player_id=None):
+    """
+    Per-player, per-system totals for games played between start_date and end_date.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor with row_factory = sqlite3.Row.
+        start_date (str): First day of the window ('YYYY-MM-DD', time part ignored).
+        end_date (str): Last day of the window, inclusive.
+        player_id (int): Only include this player.
+
+    Returns:
+        list: Rows with system_id, system_name, player_id, user_name, full_name,
+              points, games, wins, draws, losses, best points first per system.
+    """
+    where, params = "1", []
+    if player_id is not None:
+        where, params = "player_id = ?", [player_id]
+    window = _window_select('player_daily_totals', where)
+
+    return cursor.execute(f"""
+        SELECT w.system_id, s.system_name, w.player_id, u.user_name, u.full_name,
+               w.points, w.games, w.wins, w.draws, w.losses
+        FROM ({window}) w
+        JOIN systems s ON s.system_id = w.system_id
+        JOIN users u ON u.user_id = w.player_id
+        ORDER BY s.system_name, w.points DESC, w.games
+    """, params + [end_date[:10], start_date[:10]]).fetchall()
+
+
+def location_window_totals(cursor, start_date, end_date):
+    """
+    Games per location and system played between start_date and end_date.
+
+    Returns:
+        list: Rows with system_id, system_name, store_name and games_played,
+              busiest store first per system.
+    """
+    window = _window_select('location_daily_totals')
+
+    return cursor.execute(f"""
+        SELECT w.system_id, s.system_name, l.name AS store_name, w.games AS games_played
+        FROM ({window}) w
+        JOIN systems s ON s.system_id = w.system_id
+        JOIN locations l ON l.location_id = w.location_id
+        ORDER BY s.system_name, games_played DESC
+    """, [end_date[:10], start_date[:10]]).fetchall()
+
+
+def game_fingerprint(system_id, played_on, player_id, opponent_id, result):
+    """
+    Normalize a result to its `game_fingerprints` key.
+
+    Args:
+        played_on (str): 'YYYY-MM-DD ...'; only the day is used.
+        result (str): player_id's result ('win', 'draw' or 'loss').
+
+    Returns:
+        tuple: (system_id, day, player_low, player_high, low_result)
+    """
+    player_id, opponent_id = int(player_id), int(opponent_id)
+    if player_id > opponent_id:
+        player_id, opponent_id, result = opponent_id, player_id, _OPPOSITE_RESULT[result]
+    return (int(system_id), played_on[:10], player_id, opponent_id, result)
+
+
+def find_duplicate_games(cursor, system_id, played_on, player_id, opponent_id, result):
+    """
+    Games not flagged ignored with the same system, day, players and result.
+
+    Returns:
+        list: (game_id, played_on) tuples, oldest first.
+    """
+    return [tuple(row) for row in cursor.execute("""
+        SELECT g.game_id, g.played_on
+        FROM game_fingerprints f
+        JOIN games g ON g.game_id = f.game_id
+        WHERE f.system_id = ? AND f.day = ? AND f.player_low = ? AND f.player_high = ?
+          AND f.low_result = ? AND COALESCE(g.ignored, 0) = 0
+        ORDER BY g.game_id
+    """, game_fingerprint(system_id, played_on, player_id, opponent_id, result)).fetchall()]
+
+
+def load_fingerprints(cursor):
+    """
+    Fingerprints of every game not flagged ignored, for checking a batch in memory.
+
+    Returns:
+        dict: `game_fingerprint()` key -> game_id of the first matching game.
+    """
+    fingerprints = {}
+    for row in cursor.execute("""
+        SELECT f.system_id, f.day, f.player_low, f.player_high, f.low_result, f.game_id
+        FROM game_fingerprints f
+        JOIN games g ON g.game_id = f.game_id
+        WHERE COALESCE(g.ignored, 0) = 0
+        ORDER BY f.game_id DESC
+    """):
+        fingerprints[tuple(row[:5])] = row[5]
+    return fingerprints
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    with sqlite3.connect("GPTLeague.db") as conn:
+        ensure_aggregate_tables(conn)
+        rebuild_aggregates(conn)
+        conn.commit()
@@ -0,0 +1,336 @@
+"""
+archive.py
+----------
+Cold storage for archived seasons.
+
+An archived season's games, game_participants and rating_changes rows can be
+moved out of GPTLeague.db into a per-season SQLite file under `archives/`.
+Read routes call `attach_archives()` which ATTACHes the relevant files
+read-only and exposes `league_games`, `league_game_participants` and
+`league_rating_changes` TEMP views that UNION the hot tables with the cold
+ones, plus `league_rating_history` over them in the layout of the
+`rating_history` view, so historical years and 'All' queries keep working
+unchanged.
+
+Moves are storage changes only: the change log entries their copies and
+deletes produce are discarded in the same transaction, so mirrors keep the
+season (see changes.py).
+
+Usage:
+    python archive.py list
+    python archive.py archive 2025 [--vacuum]
+    python archive.py restore 2025
+"""
+
+import re
+import sys
+import sqlite3
+import logging
+import argparse
+from pathlib import Path
+
+from changes import current_seq, discard_changes, ensure_change_log
+from compaction import RATING_HISTORY_SELECT, compact_file
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+ARCHIVE_DIR = "archives"
+
+# Tables moved to cold storage, in insert order (parents first).
+ARCHIVED_TABLES = ['games', 'game_participants', 'rating_changes']
+
+
+def ensure_archive_table(cursor):
+    """Create the season_archives registry if it does not exist yet."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS season_archives (
+            season_id INTEGER PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            first_played TEXT,
+            last_played TEXT,
+            games INTEGER NOT NULL DEFAULT 0,
+            archived_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY (season_id) REFERENCES seasons(season_id)
+        )
+    """)
+
+
+def archive_path(year):
+    """Return the cold storage file path for a season year."""
+    return Path(ARCHIVE_DIR) / f"season_{year}.db"
+
+
+def _archive_uri(file_name, read_only=True):
+    uri = Path(file_name).resolve().as_uri()
+    return f"{uri}?mode=ro" if read_only else f"{uri}?mode=rwc"
+
+
+def _table_columns(cursor, schema, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _create_table_in(cursor, schema, table):
+    """Create `table` in the attached `schema` using the DDL of main.<table>."""
+    ddl = cursor.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+    ddl = re.sub(
+        r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?["`\[]?\w+["`\]]?',
+        f'CREATE TABLE IF NOT EXISTS {schema}.{table}',
+        ddl,
+        count=1,
+        flags=re.IGNORECASE
+    )
+    cursor.execute(ddl)
+
+
+def _copy_season(cursor, src, dst, season_id):
+    """Copy one season's rows for ARCHIVED_TABLES from schema `src` to `dst`."""
+    for table in ARCHIVED_TABLES:
+        columns = ','.join(_table_columns(cursor, 'main', table))
+        if table == 'games':
+            where = "season_id = ?"
+        else:
+            where = f"game_id IN (SELECT game_id FROM {src}.games WHERE season_id = ?)"
+        cursor.execute(
+            f"INSERT INTO {dst}.{table} ({columns}) SELECT {columns} FROM {src}.{table} WHERE {where}",
+            (season_id,)
+        )
+
+
+def _delete_season(cursor, schema, season_id):
+    """Delete one season's rows for ARCHIVED_TABLES from `schema` (children first)."""
+    for table in reversed(ARCHIVED_TABLES):
+        if table == 'games':
+            where = "season_id = ?"
+        else:
+            where = f"game_id IN (SELECT game_id FROM {schema}.games WHERE season_id = ?)"
+        cursor.execute(f"DELETE FROM {schema}.{table} WHERE {where}", (season_id,))
+
+
+def archive_season(year, db_path=DB_NAME):
+    """
+    Move an archived season's games into its cold storage file.
+
+    Args:
+        year (int): The season year; the season must have status 'archived'.
+        db_path (str): Path of the hot database.
+
+    Returns:
+        int: Number of games moved.
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        ensure_archive_table(cursor)
+        ensure_change_log(cursor)
+        connection.commit()
+
+        season_row = cursor.execute(
+            "SELECT season_id, status FROM seasons WHERE year = ?", (year,)
+        ).fetchone()
+        if not season_row:
+            raise ValueError(f"Season {year} not found")
+        season_id, status = season_row
+        if status != 'archived':
+            raise ValueError(f"Season {year} is '{status}', only archived seasons can be moved to cold storage")
+
+        pending = cursor.execute(
+            "SELECT COUNT(*) FROM main.games WHERE season_id = ?", (season_id,)
+        ).fetchone()[0]
+        if not pending:
+            logger.info(f"Season {year}: no games in the hot database, nothing to archive")
+            return 0
+
+        file_path = archive_path(year)
+        file_path.parent.mkdir(exist_ok=True)
+        cursor.execute("ATTACH DATABASE ? AS cold", (_archive_uri(file_path, read_only=False),))
+
+        try:
+            for table in ARCHIVED_TABLES:
+                _create_table_in(cursor, 'cold', table)
+
+            connection.execute("BEGIN IMMEDIATE")
+            moved = cursor.execute(
+                "SELECT COUNT(*) FROM main.games WHERE season_id = ?", (season_id,)
+            ).fetchone()[0]
+            logged_seq = current_seq(cursor)
+            _copy_season(cursor, 'main', 'cold', season_id)
+            _delete_season(cursor, 'main', season_id)
+            discard_changes(cursor, logged_seq)
+
+            first_played, last_played, games = cursor.execute(
+                "SELECT MIN(played_on), MAX(played_on), COUNT(*) FROM cold.games"
+            ).fetchone()
+            cursor.execute("""
+                INSERT INTO season_archives (season_id, file_name, first_played, last_played, games, archived_at)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+                ON CONFLICT(season_id) DO UPDATE SET
+                    file_name = excluded.file_name,
+                    first_played = excluded.first_played,
+                    last_played = excluded.last_played,
+                    games = excluded.games,
+                    archived_at = excluded.archived_at
+            """, (season_id, str(file_path), first_played, last_played, games))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE cold")
+
+        logger.info(f"Season {year}: moved {moved} games to {file_path}")
+        return moved
+    finally:
+        connection.close()
+
+
+def restore_season(year, db_path=DB_NAME):
+    """
+    Move a season's games from its cold storage file back into the hot database.
+
+    Returns:
+        int: Number of games restored.
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        ensure_archive_table(cursor)
+        ensure_change_log(cursor)
+        connection.commit()
+        archive_row = cursor.execute("""
+            SELECT sa.season_id, sa.file_name
+            FROM season_archives sa
+            JOIN seasons s ON s.season_id = sa.season_id
+            WHERE s.year = ?
+        """, (year,)).fetchone()
+        if not archive_row:
+            raise ValueError(f"Season {year} is not in cold storage")
+        season_id, file_name = archive_row
+
+        # Files archived before the compact tables existed
+        compact_file(file_name)
+        cursor.execute("ATTACH DATABASE ? AS cold", (_archive_uri(file_name, read_only=False),))
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            restored = cursor.execute(
+                "SELECT COUNT(*) FROM cold.games WHERE season_id = ?", (season_id,)
+            ).fetchone()[0]
+            logged_seq = current_seq(cursor)
+            _copy_season(cursor, 'cold', 'main', season_id)
+            discard_changes(cursor, logged_seq)
+            cursor.execute("DELETE FROM season_archives WHERE season_id = ?", (season_id,))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE cold")
+
+        Path(file_name).unlink()
+        logger.info(f"Season {year}: restored {restored} games from {file_name}")
+        return restored
+    finally:
+        connection.close()
+
+
+def attach_archives(connection, start_date, end_date):
+    """
+    Attach cold storage files overlapping [start_date, end_date] and create
+    the `league_*` TEMP views over the hot and cold tables.
+
+    Read routes query `league_games`, `league_game_participants` and
+    `league_rating_history` instead of the base tables. When no archive
+    overlaps the range the views only read from the hot database.
+
+    Returns:
+        list: Schema aliases that were attached.
+    """
+    cursor = connection.cursor()
+    try:
+        archives = cursor.execute("""
+            SELECT season_id, file_name
+            FROM season_archives
+            WHERE first_played <= ? AND last_played >= ?
+            ORDER BY season_id
+        """, (end_date, start_date)).fetchall()
+    except sqlite3.OperationalError:
+        archives = []
+
+    attach_limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(archives) > attach_limit:
+        logger.warning(f"{len(archives)} archives overlap {start_date}..{end_date}, only attaching {attach_limit}")
+        archives = archives[:attach_limit]
+
+    already_attached = {row[1] for row in cursor.execute("PRAGMA database_list").fetchall()}
+    attached = []
+    for archive in archives:
+        season_id, file_name = archive[0], archive[1]
+        alias = f"season_{season_id}"
+        if alias in already_attached:
+            attached.append(alias)
+            continue
+        if not Path(file_name).exists():
+            logger.warning(f"Cold storage file missing for season {season_id}: {file_name}")
+            continue
+        cursor.execute(f"ATTACH DATABASE ? AS {alias}", (_archive_uri(file_name),))
+        attached.append(alias)
+
+    for table in ARCHIVED_TABLES:
+        columns = ','.join(_table_columns(cursor, 'main', table))
+        selects = [f"SELECT {columns} FROM main.{table}"]
+        selects += [f"SELECT {columns} FROM {alias}.{table}" for alias in attached]
+        cursor.execute(f"DROP VIEW IF EXISTS temp.league_{table}")
+        cursor.execute(f"CREATE TEMP VIEW league_{table} AS {' UNION ALL '.join(selects)}")
+
+    history = RATING_HISTORY_SELECT.format(
+        rating_changes="league_rating_changes", games="league_games", game_participants="league_game_participants"
+    )
+    cursor.execute("DROP VIEW IF EXISTS temp.league_rating_history")
+    cursor.execute(f"CREATE TEMP VIEW league_rating_history AS {history}")
+
+    return attached
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Move archived seasons to and from cold storage.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List seasons in cold storage")
+    archive_parser = subparsers.add_parser("archive", help="Move an archived season to cold storage")
+    archive_parser.add_argument("year", type=int)
+    archive_parser.add_argument("--vacuum", action="store_true", help="VACUUM the hot database afterwards")
+    restore_parser = subparsers.add_parser("restore", help="Move a season back into the hot database")
+    restore_parser.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "list":
+            with sqlite3.connect(DB_NAME) as conn:
+                ensure_archive_table(conn.cursor())
+                rows = conn.execute("""
+                    SELECT s.year, sa.file_name, sa.games, sa.archived_at
+                    FROM season_archives sa
+                    JOIN seasons s ON s.season_id = sa.season_id
+                    ORDER BY s.year
+                """).fetchall()
+            if not rows:
+                logger.info("No seasons in cold storage")
+            for year, file_name, games, archived_at in rows:
+                logger.info(f"  {year}: {games} games in {file_name} (archived {archived_at})")
+        elif args.command == "archive":
+            archive_season(args.year)
+            if args.vacuum:
+                with sqlite3.connect(DB_NAME) as conn:
+                    conn.execute("VACUUM")
+                logger.info("✓ Hot database vacuumed")
+        elif args.command == "restore":
+            restore_season(args.year)
+    except ValueError as e:
+        logger.error(f"✗ {e}")
+        sys.exit(1)
@@ -0,0 +1,381 @@
+"""
+backups.py
+----------
+Scheduled, rotating backups of GPTLeague.db with page-level deduplication.
+
+Each backup takes a consistent snapshot with the online backup API
+(`exports.snapshot_database()`), splits it into database pages and stores
+every page under `backups/pages/` named by its SHA-256, compressed. A
+backup's manifest under `backups/manifests/` lists its page hashes in order,
+so a page that did not change since the previous backup is not written
+again: an hourly backup costs roughly the pages touched in that hour.
+
+Seasons moved to cold storage live in their own files (`archive.py`), so
+every file listed in the snapshot's `season_archives` table is snapshotted
+into the same page store and listed under the manifest's "archives". Those
+files rarely change, so after the first backup they cost no new pages.
+
+`rotate_backups()` keeps the newest backup of each of the last KEEP_HOURLY
+hours, KEEP_DAILY days and KEEP_WEEKLY weeks, deletes the other manifests and
+then the pages no kept manifest refers to. `restore_backup()` reassembles any
+kept backup into a database file, with its archive files beside it.
+
+Backups run from the CLI (e.g. cron) or, when BACKUP_INTERVAL_MINUTES is set,
+on a background thread started by the server; enable the thread in one
+process only.
+
+Usage:
+    python backups.py backup
+    python backups.py list
+    python backups.py restore 20260301_190000 restored.db [--force]
+    python backups.py run [--interval 60]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import closing
+
+from exports import snapshot_archives, snapshot_database
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+BACKUP_DIR = "backups"
+
+# Minutes between scheduled backups on the server thread; 0 disables it
+BACKUP_INTERVAL_MINUTES = int(os.getenv("BACKUP_INTERVAL_MINUTES", "0"))
+
+# Rotation: newest backup per hour / day / ISO week to keep
+KEEP_HOURLY = 24
+KEEP_DAILY = 7
+KEEP_WEEKLY = 8
+
+# Unreferenced pages touched this recently are kept, in case a backup is still writing
+PAGE_GRACE_SECONDS = 60 * 60
+
+_backup_lock = threading.Lock()
+
+
+def _pages_dir(backup_dir):
+    return Path(backup_dir) / "pages"
+
+
+def _manifests_dir(backup_dir):
+    return Path(backup_dir) / "manifests"
+
+
+def _page_path(backup_dir, digest):
+    return _pages_dir(backup_dir) / digest[:2] / digest
+
+
+def _store_page(backup_dir, page):
+    """Store a page unless it is already present. Returns (digest, written)."""
+    digest = hashlib.sha256(page).hexdigest()
+    path = _page_path(backup_dir, digest)
+    if path.exists():
+        # Refresh the mtime so a concurrent rotation does not collect it
+        os.utime(path)
+        return digest, False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(zlib.compress(page))
+    os.replace(tmp_path, path)
+    return digest, True
+
+
+def _store_file(backup_dir, path, page_size):
+    """Store every page of the file at `path`. Returns (page digests, pages written)."""
+    pages = []
+    new_pages = 0
+    with open(path, "rb") as snapshot:
+        while page := snapshot.read(page_size):
+            digest, written = _store_page(backup_dir, page)
+            pages.append(digest)
+            new_pages += written
+    return pages, new_pages
+
+
+def _page_size(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def _summary(manifest):
+    """A manifest without its page lists."""
+    manifest.pop("pages")
+    for archive in manifest.get("archives", []):
+        archive.pop("pages")
+    return manifest
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """
+    Manifests of all stored backups, newest first.
+
+    Returns:
+        list: Manifest dicts without their page lists.
+    """
+    manifests = []
+    for path in _manifests_dir(backup_dir).glob("*.json"):
+        manifests.append(_summary(json.loads(path.read_text())))
+    return sorted(manifests, key=lambda manifest: manifest["created_at"], reverse=True)
+
+
+def take_backup(db_path=DB_NAME, backup_dir=BACKUP_DIR):
+    """
+    Snapshot `db_path` and its cold storage files and add their changed pages
+    and a manifest to the store. Archive file names are relative to the
+    directory of `db_path`, as `season_archives` records them.
+
+    Returns:
+        dict: Manifest summary: name, created_at, page_size, page_count, size, new_pages,
+              archives (file_name, page_size, page_count, size).
+    """
+    created = datetime.now()
+    name = created.strftime("%Y%m%d_%H%M%S")
+    manifests_dir = _manifests_dir(backup_dir)
+    manifests_dir.mkdir(parents=True, exist_ok=True)
+    while (manifests_dir / f"{name}.json").exists():
+        name += "_1"
+
+    with _backup_lock, tempfile.TemporaryDirectory(prefix="snapshot_", dir=backup_dir) as tmp:
+        snapshot_path = os.path.join(tmp, "snapshot.db")
+        size = snapshot_database(snapshot_path, db_path)
+        page_size = _page_size(snapshot_path)
+        pages, new_pages = _store_file(backup_dir, snapshot_path, page_size)
+
+        archives = []
+        for file_name, archive_snapshot in snapshot_archives(snapshot_path, tmp, db_path):
+            archive_size = os.path.getsize(archive_snapshot)
+            archive_page_size = _page_size(archive_snapshot)
+            archive_pages, written = _store_file(backup_dir, archive_snapshot, archive_page_size)
+            new_pages += written
+            archives.append({
+                "file_name": file_name,
+                "page_size": archive_page_size,
+                "page_count": len(archive_pages),
+                "size": archive_size,
+                "pages": archive_pages,
+            })
+
+    manifest = {
+        "name": name,
+        "created_at": created.isoformat(timespec="seconds"),
+        "page_size": page_size,
+        "page_count": len(pages),
+        "size": size,
+        "new_pages": new_pages,
+        "pages": pages,
+        "archives": archives,
+    }
+    tmp_path = manifests_dir / f"{name}.json.tmp"
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, manifests_dir / f"{name}.json")
+
+    logger.info(f"Backup {name}: {len(pages)} pages and {len(archives)} archive file(s), "
+                f"{new_pages} new page(s)")
+    return _summary(manifest)
+
+
+def backups_to_keep(created_times):
+    """
+    Apply the rotation policy.
+
+    Args:
+        created_times (dict): backup name -> creation datetime.
+
+    Returns:
+        set: Names of the backups to keep.
+    """
+    newest_first = sorted(created_times.items(), key=lambda item: item[1], reverse=True)
+    policy = [
+        (KEEP_HOURLY, lambda t: (t.date(), t.hour)),
+        (KEEP_DAILY, lambda t: t.date()),
+        (KEEP_WEEKLY, lambda t: t.isocalendar()[:2]),
+    ]
+    keep = set()
+    for count, bucket in policy:
+        buckets = set()
+        for name, created in newest_first:
+            if len(buckets) >= count:
+                break
+            key = bucket(created)
+            if key not in buckets:
+                buckets.add(key)
+                keep.add(name)
+    return keep
+
+
+def rotate_backups(backup_dir=BACKUP_DIR):
+    """
+    Delete backups outside the rotation policy, then pages no kept backup uses.
+
+    Returns:
+        tuple: (backups deleted, pages deleted)
+    """
+    manifests_dir = _manifests_dir(backup_dir)
+    with _backup_lock:
+        paths = {path.stem: path for path in manifests_dir.glob("*.json")}
+        manifests = {name: json.loads(path.read_text()) for name, path in paths.items()}
+        keep = backups_to_keep({
+            name: datetime.fromisoformat(manifest["created_at"]) for name, manifest in manifests.items()
+        })
+
+        deleted_backups = 0
+        for name in set(paths) - keep:
+            paths[name].unlink()
+            deleted_backups += 1
+
+        referenced = set()
+        for name in keep:
+            referenced.update(manifests[name]["pages"])
+            for archive in manifests[name].get("archives", []):
+                referenced.update(archive["pages"])
+
+        deleted_pages = 0
+        cutoff = time.time() - PAGE_GRACE_SECONDS
+        for path in _pages_dir(backup_dir).glob("*/*"):
+            if path.name not in referenced and path.stat().st_mtime < cutoff:
+                path.unlink()
+                deleted_pages += 1
+
+    if deleted_backups or deleted_pages:
+        logger.info(f"Rotated backups: {deleted_backups} backup(s) and {deleted_pages} page(s) deleted")
+    return deleted_backups, deleted_pages
+
+
+def _reassemble(backup_dir, pages, path):
+    """Write the stored `pages` to `path` and check the result."""
+    with open(path, "wb") as out:
+        for digest in pages:
+            out.write(zlib.decompress(_page_path(backup_dir, digest).read_bytes()))
+        out.flush()
+        os.fsync(out.fileno())
+
+    with closing(sqlite3.connect(path)) as conn:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != "ok":
+        raise ValueError(f"Restored database failed integrity check: {result}")
+
+
+def restore_backup(name, target_path, backup_dir=BACKUP_DIR, force=False):
+    """
+    Reassemble backup `name` into `target_path`, and its cold storage files
+    at their recorded paths relative to the target's directory.
+
+    Every file is written beside its destination and only moved into place
+    once all of them pass PRAGMA integrity_check. Do not restore over the
+    live database while the server is running.
+
+    Raises:
+        FileNotFoundError: No such backup, or a page is missing from the store.
+        FileExistsError: The target or an archive file exists and `force` is not set.
+        ValueError: A reassembled database fails the integrity check.
+    """
+    manifest_path = _manifests_dir(backup_dir) / f"{name}.json"
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"No backup named {name}")
+    manifest = json.loads(manifest_path.read_text())
+    target = Path(target_path)
+    # (destination, pages), database first
+    files = [(target, manifest["pages"])]
+    files += [(target.parent / archive["file_name"], archive["pages"]) for archive in manifest.get("archives", [])]
+    for path, _ in files:
+        if path.exists() and not force:
+            raise FileExistsError(f"{path} exists; use --force to overwrite it")
+
+    tmp_paths = [path.with_name(path.name + ".restoring") for path, _ in files]
+    try:
+        for (path, pages), tmp_path in zip(files, tmp_paths):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _reassemble(backup_dir, pages, tmp_path)
+        for (path, _), tmp_path in zip(files, tmp_paths):
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path in tmp_paths:
+            tmp_path.unlink(missing_ok=True)
+
+    logger.info(f"Backup {name} restored to {target}"
+                + (f" with {len(files) - 1} archive file(s)" if len(files) > 1 else ""))
+    return target
+
+
+def run_backup(db_path=DB_NAME, backup_dir=BACKUP_DIR):
+    """Take a backup and apply the rotation policy."""
+    manifest = take_backup(db_path, backup_dir)
+    rotate_backups(backup_dir)
+    return manifest
+
+
+def _backup_loop(interval_minutes, stop):
+    while not stop.wait(interval_minutes * 60):
+        try:
+            run_backup()
+        except Exception as e:
+            logger.error(f"Scheduled backup failed: {str(e)}")
+
+
+def start_backup_scheduler(interval_minutes=BACKUP_INTERVAL_MINUTES):
+    """
+    Run `run_backup()` every `interval_minutes` on a daemon thread; no-op when 0.
+
+    Returns:
+        threading.Event: Set it to stop the scheduler, or None when disabled.
+    """
+    if interval_minutes <= 0:
+        return None
+    stop = threading.Event()
+    threading.Thread(target=_backup_loop, args=(interval_minutes, stop), name="backup-scheduler",
+                     daemon=True).start()
+    logger.info(f"Backup scheduler started: every {interval_minutes} minute(s)")
+    return stop
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Rotating page-deduplicated backups of the league database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backup", help="Take a backup now and apply the rotation policy")
+    subparsers.add_parser("list", help="List stored backups")
+    restore_parser = subparsers.add_parser("restore", help="Reassemble a backup into a database file")
+    restore_parser.add_argument("name")
+    restore_parser.add_argument("target")
+    restore_parser.add_argument("--force", action="store_true", help="Overwrite the target if it exists")
+    run_parser = subparsers.add_parser("run", help="Take backups on a schedule until interrupted")
+    run_parser.add_argument("--interval", type=int, default=BACKUP_INTERVAL_MINUTES or 60,
+                            help="Minutes between backups (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "backup":
+            run_backup()
+        elif args.command == "list":
+            for manifest in list_backups():
+                logger.info(f"{manifest['name']}  {manifest['size']:>12} bytes  "
+                            f"{manifest['new_pages']:>8} new of {manifest['page_count']} pages  "
+                            f"{len(manifest.get('archives', []))} archive file(s)")
+        elif args.command == "restore":
+            restore_backup(args.name, args.target, force=args.force)
+        elif args.command == "run":
+            run_backup()
+            _backup_loop(args.interval, threading.Event())
+    except (FileNotFoundError, FileExistsError, ValueError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,305 @@
+"""
+batch_import.py
+---------------
+Set-based ingestion of batch game and user uploads.
+
+Reference data (systems, locations, users, factions) is loaded into hash maps
+once per upload, every CSV row is validated against them, and the valid rows
+are inserted with executemany in a single transaction. Aggregates are updated
+with one `record_games()` call and ratings are recalculated once per affected
+(season, system) instead of after every row.
+
+Batch user uploads hash their temporary passwords on a thread pool
+(`hash_passwords()`) and insert users, roles and memberships the same way
+(`import_users()`).
+"""
+
+import os
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from aggregates import record_games, game_fingerprint, load_fingerprints
+from helpers import hash_password
+from ratings import update_ratings_for_season
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = {"system_name", "date", "player_one", "player_two", "p1_faction",
+                    "p2_faction", "result", "location", "points_band"}
+
+# Threads hashing temporary passwords; bcrypt releases the GIL while hashing
+PASSWORD_HASH_WORKERS = os.cpu_count() or 2
+
+# CSV result -> (player one result, player two result)
+RESULTS = {
+    "Player 1 Wins": ("win", "loss"),
+    "Player 2 Wins": ("loss", "win"),
+    "Drawn": ("draw", "draw"),
+}
+
+
+def ensure_import_indexes(cursor):
+    """Index the user name columns that uploads and logins look players up by."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_name ON users(user_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name)")
+
+
+def load_lookups(cursor):
+    """
+    Load the reference tables an upload is validated against.
+
+    Returns:
+        dict: `systems` name -> (system_id, category), `locations` name -> location_id,
+              `users` user_name or full_name -> user_id,
+              `factions` (system_id, faction_name) -> faction_id,
+              `fingerprints` of recorded games -> game_id, and an empty
+              `batch_fingerprints` that `validate_row()` fills with the upload's rows.
+    """
+    users = {}
+    # user_name wins over another user's identical full_name
+    for user_id, full_name in cursor.execute("SELECT user_id, full_name FROM users ORDER BY user_id DESC"):
+        users[full_name] = user_id
+    for user_id, user_name in cursor.execute("SELECT user_id, user_name FROM users ORDER BY user_id DESC"):
+        users[user_name] = user_id
+
+    return {
+        "systems": {
+            name: (system_id, category)
+            for system_id, name, category in cursor.execute(
+                "SELECT system_id, system_name, category FROM systems"
+            )
+        },
+        "locations": {
+            name: location_id
+            for location_id, name in cursor.execute("SELECT location_id, name FROM locations")
+        },
+        "users": users,
+        "factions": {
+            (system_id, name): faction_id
+            for faction_id, system_id, name in cursor.execute(
+                "SELECT faction_id, system_id, faction_name FROM factions"
+            )
+        },
+        "fingerprints": load_fingerprints(cursor),
+        "batch_fingerprints": {},
+    }
+
+
+def validate_row(idx, row, lookups):
+    """
+    Validate one CSV row and resolve its names to ids.
+
+    Returns:
+        dict: Preview row with the cleaned fields, the resolved ids when valid,
+              an `errors` list (empty when the row can be imported) and a
+              `warnings` list naming a likely duplicate game or earlier row.
+    """
+    preview_row = {"row": idx, "errors": [], "warnings": []}
+    errors = preview_row["errors"]
+
+    # System
+    system_name = (row.get("system_name") or "").strip()
+    system = lookups["systems"].get(system_name)
+    if not system:
+        errors.append(f"System '{system_name}' not found")
+    else:
+        preview_row["system_name"] = system_name
+        preview_row["system_id"], preview_row["category"] = system
+
+    # Date
+    date_str = (row.get("date") or "").strip()
+    try:
+        preview_row["played_on"] = datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d 12:00:00")
+        preview_row["date"] = date_str
+    except ValueError:
+        errors.append(f"Invalid date format: {date_str} (use YYYY-MM-DD)")
+
+    # Players
+    p1_name = (row.get("player_one") or "").strip()
+    p2_name = (row.get("player_two") or "").strip()
+    preview_row["player_one"] = p1_name
+    preview_row["player_two"] = p2_name
+    if p1_name == p2_name:
+        errors.append("Player 1 and Player 2 cannot be the same")
+    for key, name in (("p1_id", p1_name), ("p2_id", p2_name)):
+        user_id = lookups["users"].get(name)
+        if user_id is None:
+            errors.append(f"Player '{name}' not found")
+        else:
+            preview_row[key] = user_id
+
+    # Factions
+    preview_row["p1_faction"] = (row.get("p1_faction") or "").strip()
+    preview_row["p2_faction"] = (row.get("p2_faction") or "").strip()
+    if system:
+        for key, name in (("p1_faction_id", preview_row["p1_faction"]), ("p2_faction_id", preview_row["p2_faction"])):
+            faction_id = lookups["factions"].get((system[0], name))
+            if faction_id is None:
+                errors.append(f"Faction '{name}' not found for {system_name}")
+            else:
+                preview_row[key] = faction_id
+
+    # Result
+    result = (row.get("result") or "").strip()
+    preview_row["result"] = result
+    if result not in RESULTS:
+        errors.append(f"Invalid result: {result} (must be 'Player 1 Wins', 'Player 2 Wins', or 'Drawn')")
+
+    # Location
+    location_name = (row.get("location") or "").strip()
+    location_id = lookups["locations"].get(location_name)
+    if location_id is None:
+        errors.append(f"Location '{location_name}' not found")
+    else:
+        preview_row["location"] = location_name
+        preview_row["location_id"] = location_id
+
+    preview_row["points_band"] = (row.get("points_band") or "").strip()
+    preview_row["notes"] = (row.get("notes") or "").strip()
+
+    # Same system, day, players and result as a recorded game or an earlier row
+    if not errors:
+        fingerprint = game_fingerprint(preview_row["system_id"], preview_row["played_on"],
+                                       preview_row["p1_id"], preview_row["p2_id"], RESULTS[result][0])
+        game_id = lookups["fingerprints"].get(fingerprint)
+        first_row = lookups["batch_fingerprints"].setdefault(fingerprint, idx)
+        if game_id is not None:
+            preview_row["warnings"].append(f"Possible duplicate of game #{game_id}")
+        elif first_row != idx:
+            preview_row["warnings"].append(f"Possible duplicate of row {first_row}")
+    return preview_row
+
+
+def validate_rows(rows, lookups, start=1):
+    """Validate CSV rows; `start` is the row number of the first one."""
+    return [validate_row(idx, row, lookups) for idx, row in enumerate(rows, start)]
+
+
+def row_errors(preview_rows):
+    """Flatten preview errors into 'Row N: message' strings."""
+    return [f"Row {row['row']}: {error}" for row in preview_rows for error in row["errors"]]
+
+
+def next_game_id(cursor):
+    """First free games.game_id, honouring AUTOINCREMENT's high-water mark."""
+    return cursor.execute("""
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'games'), 0),
+            COALESCE((SELECT MAX(game_id) FROM games), 0)
+        ) + 1
+    """).fetchone()[0]
+
+
+def import_games(connection, preview_rows, season_id, skip_duplicates=True):
+    """
+    Insert every valid preview row in one transaction.
+
+    Args:
+        connection (sqlite3.Connection): Connection with no open transaction.
+        preview_rows (iterable): Validated preview rows, e.g. from `validate_rows()`
+            or a generator over a staged upload; rows with errors are skipped.
+        season_id (int): Season the games are recorded against.
+        skip_duplicates (bool): Also skip rows flagged as possible duplicates.
+
+    Returns:
+        int: Number of games inserted.
+    """
+    cursor = connection.cursor()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        first_id = next_game_id(cursor)
+        valid = (
+            row for row in preview_rows
+            if not row["errors"] and not (skip_duplicates and row.get("warnings"))
+        )
+        games = []
+        participants = []
+        affected = {}
+        for game_id, row in enumerate(valid, first_id):
+            p1_result, p2_result = RESULTS[row["result"]]
+            games.append((game_id, season_id, row["system_id"], row["played_on"],
+                          row["location_id"], row["points_band"], row["notes"]))
+            participants.append((game_id, row["p1_id"], row["p1_faction_id"], p1_result, 0))
+            participants.append((game_id, row["p2_id"], row["p2_faction_id"], p2_result, 0))
+            affected[(season_id, row["system_id"])] = row["category"]
+
+        if not games:
+            connection.rollback()
+            return 0
+
+        cursor.executemany(
+            "INSERT INTO games (game_id, season_id, system_id, played_on, location_id, points_band, notes) VALUES (?,?,?,?,?,?,?)",
+            games
+        )
+        cursor.executemany(
+            "INSERT INTO game_participants (game_id, player_id, faction_id, result, painting_battle_ready) VALUES (?,?,?,?,?)",
+            participants
+        )
+
+        record_games([game[0] for game in games], connection)
+
+        for (game_season_id, system_id), category in affected.items():
+            update_ratings_for_season(game_season_id, system_id, category, connection)
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    logger.info(f"Batch import: {len(games)} games, ratings recalculated for {len(affected)} season/system(s)")
+    return len(games)
+
+
+def hash_passwords(passwords, workers=PASSWORD_HASH_WORKERS):
+    """
+    Hash passwords in parallel.
+
+    Yields:
+        bytes: The bcrypt hash of each password, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") as pool:
+        yield from pool.map(hash_password, passwords)
+
+
+def import_users(connection, users, season_id):
+    """
+    Insert new players in one transaction.
+
+    Args:
+        connection (sqlite3.Connection): Connection with no open transaction.
+        users (list): Dicts with `username`, `email`, `full_name` and `password_hash`;
+            duplicates must already have been filtered out.
+        season_id (int): Season the users are enrolled in as club members.
+
+    Returns:
+        int: Number of users inserted.
+    """
+    if not users:
+        return 0
+
+    cursor = connection.cursor()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        first_id = cursor.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+        user_ids = range(first_id, first_id + len(users))
+        cursor.executemany(
+            "INSERT INTO users (user_id, user_name, email, full_name, password_hash, is_active) VALUES (?,?,?,?,?,1)",
+            [(user_id, user["username"], user["email"], user["full_name"], user["password_hash"])
+             for user_id, user in zip(user_ids, users)]
+        )
+        cursor.executemany(
+            "INSERT INTO user_roles (user_id, role) VALUES (?, 'player')",
+            [(user_id,) for user_id in user_ids]
+        )
+        cursor.executemany(
+            "INSERT INTO club_memberships (season_id, user_id, is_member) VALUES (?,?,1)",
+            [(season_id, user_id) for user_id in user_ids]
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    logger.info(f"Batch import: {len(users)} users")
+    return len(users)
@@ -0,0 +1,224 @@
+"""
+changes.py
+----------
+Trigger-maintained change log for incremental syncs.
+
+Triggers on the tables in TRACKED_TABLES append one `change_log` row per
+inserted, updated or deleted row: (seq, table_name, row_key, operation).
+`seq` is AUTOINCREMENT, so it only ever grows and is never reused. A mirror
+keeps the last sequence number it applied and asks for the rows changed
+since then (`/admin/changes?since=N` or `python changes.py export --since N`),
+so a sync costs the number of changed rows instead of the database size.
+
+Each changed row is emitted once with its current contents, or with no row
+when it has since been deleted. Changes made before the log existed are not
+in it: seed a new mirror from a full export, then sync from the sequence
+number reported at that time (`python changes.py seq`).
+
+Moving a season to or from cold storage (`archive.py`) is not a change to the
+league's data, so it is not logged: the mirror keeps the season's games and
+participants as they were when it was archived, and a restore does not send
+them again. Archived seasons are read-only, so a mirror never
+needs to look in the cold storage files.
+
+Usage:
+    python changes.py seq
+    python changes.py export --since 120 [--format csv] [--output changes.csv]
+    python changes.py prune --before 120
+"""
+
+import io
+import csv
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+
+# Tracked table -> primary key columns
+TRACKED_TABLES = {
+    "games": ["game_id"],
+    "game_participants": ["game_id", "player_id"],
+    "users": ["user_id"],
+    "club_memberships": ["membership_id"],
+    "system_memberships": ["membership_id"],
+    "player_ratings": ["season_id", "system_id", "player_id"],
+    "league_settings": ["setting_id"],
+}
+
+CHANGE_FORMATS = ("ndjson", "csv")
+
+# Changed rows written per CSV chunk
+CHANGE_CHUNK_ROWS = 500
+
+
+def _key_sql(prefix, columns):
+    return "json_array(" + ", ".join(f"{prefix}.{column}" for column in columns) + ")"
+
+
+def ensure_change_log(cursor):
+    """Create the change_log table and the triggers that fill it."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,                        -- JSON array of primary key values
+            operation TEXT NOT NULL CHECK (operation IN ('insert','update','delete')),
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for table, key in TRACKED_TABLES.items():
+        new_key, old_key = _key_sql("NEW", key), _key_sql("OLD", key)
+        key_changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in key)
+        cursor.executescript(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key, operation) VALUES ('{table}', {new_key}, 'insert');
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key, operation) VALUES ('{table}', {new_key}, 'update');
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_rekey AFTER UPDATE ON {table}
+            WHEN {key_changed}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key, operation) VALUES ('{table}', {old_key}, 'delete');
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key, operation) VALUES ('{table}', {old_key}, 'delete');
+            END;
+        """)
+
+
+def current_seq(cursor):
+    """Highest sequence number in the change log (0 when empty)."""
+    return cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def discard_changes(cursor, after_seq):
+    """Delete change log entries newer than `after_seq` (a storage move's). Returns the number deleted."""
+    return cursor.execute("DELETE FROM change_log WHERE seq > ?", (after_seq,)).rowcount
+
+
+def prune_changes(cursor, before_seq):
+    """Delete change log entries older than `before_seq`. Returns the number deleted."""
+    return cursor.execute("DELETE FROM change_log WHERE seq < ?", (before_seq,)).rowcount
+
+
+def iter_changes(connection, since_seq, until_seq):
+    """
+    Rows changed after `since_seq`, up to and including `until_seq`, in sequence order.
+
+    Each row appears once, at the sequence number of its latest change, with
+    its current contents looked up by primary key. Apply anything but a
+    delete as an upsert.
+
+    Yields:
+        dict: seq, table, operation, key (list) and row (dict, or None when deleted).
+    """
+    cursor = connection.cursor()
+    latest = cursor.execute("""
+        SELECT c.seq, c.table_name, c.row_key, c.operation
+        FROM change_log c
+        JOIN (
+            SELECT MAX(seq) AS seq FROM change_log
+            WHERE seq > ? AND seq <= ?
+            GROUP BY table_name, row_key
+        ) l ON l.seq = c.seq
+        ORDER BY c.seq
+    """, (since_seq, until_seq)).fetchall()
+
+    lookups = {
+        table: f"SELECT * FROM {table} WHERE " + " AND ".join(f"{column} = ?" for column in key)
+        for table, key in TRACKED_TABLES.items()
+    }
+    for seq, table, row_key, operation in latest:
+        key = json.loads(row_key)
+        found = cursor.execute(lookups[table], key)
+        row = found.fetchone()
+        if row is not None:
+            row = dict(zip([description[0] for description in found.description], row))
+        yield {
+            "seq": seq,
+            "table": table,
+            "operation": operation if row is not None else "delete",
+            "key": key,
+            "row": row,
+        }
+
+
+def _json_default(value):
+    # bcrypt hashes may be stored as bytes
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "backslashreplace")
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def changes_stream(since_seq, until_seq, output_format="ndjson", db_path=DB_NAME):
+    """
+    Changed rows as NDJSON lines or CSV (seq, table, operation, key, row as JSON).
+
+    Yields:
+        str: The next chunk of output text.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        if output_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["seq", "table", "operation", "key", "row"])
+            for count, change in enumerate(iter_changes(conn, since_seq, until_seq), 1):
+                writer.writerow([
+                    change["seq"], change["table"], change["operation"], json.dumps(change["key"]),
+                    json.dumps(change["row"], default=_json_default) if change["row"] is not None else ""
+                ])
+                if count % CHANGE_CHUNK_ROWS == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for change in iter_changes(conn, since_seq, until_seq):
+                yield json.dumps(change, default=_json_default) + "\n"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Export rows changed since a change log sequence number.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("seq", help="Print the current change log sequence number")
+    export_parser = subparsers.add_parser("export", help="Export rows changed since a sequence number")
+    export_parser.add_argument("--since", type=int, required=True)
+    export_parser.add_argument("--format", choices=CHANGE_FORMATS, default="ndjson")
+    export_parser.add_argument("--output", help="Output file (default: stdout)")
+    prune_parser = subparsers.add_parser("prune", help="Delete change log entries older than a sequence number")
+    prune_parser.add_argument("--before", type=int, required=True)
+    args = parser.parse_args()
+
+    with sqlite3.connect(DB_NAME) as conn:
+        ensure_change_log(conn.cursor())
+        seq = current_seq(conn.cursor())
+        if args.command == "prune":
+            logger.info(f"Pruned {prune_changes(conn.cursor(), args.before)} change log entries")
+    conn.close()
+
+    if args.command == "seq":
+        print(seq)
+    elif args.command == "export":
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for chunk in changes_stream(args.since, seq, args.format):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+        logger.info(f"Exported changes {args.since + 1}..{seq}; next export: --since {seq}")
@@ -0,0 +1,294 @@
+"""
+compaction.py
+-------------
+Compact storage for ratings, rating history and game participants.
+
+The original tables were rowid tables with composite primary keys, so every
+row was stored twice (table and primary key index), and ratings were REAL
+values in INTEGER-declared columns. `compact_tables()` rebuilds them:
+
+- `ratings` -> `player_ratings` WITHOUT ROWID, keyed (season_id, system_id,
+  player_id) to match the standings queries, rating as integer hundredths.
+- `rating_history` -> `rating_changes` WITHOUT ROWID, keyed (game_id,
+  player_id), ratings as integer hundredths and expected_score as integer
+  ten-thousandths. system_id (from games) and actual_score (from the
+  participant's result) are no longer stored.
+- `game_participants` is rebuilt WITHOUT ROWID with the same columns; its
+  own indexes and triggers are recreated.
+
+`ratings` and `rating_history` remain as views with the old columns and
+REAL values, so read queries are unchanged; writes go to the new tables.
+`ensure_compact_storage()` runs the migration once on existing databases and
+on the season files in cold storage. Pages freed by the rebuild are reclaimed
+by the maintenance thread's incremental vacuum, or at once with --vacuum.
+
+Usage:
+    python compaction.py migrate [--vacuum]
+    python compaction.py stats
+"""
+
+import re
+import sqlite3
+import logging
+import argparse
+from pathlib import Path
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+
+# Stored rating = round(rating * RATING_SCALE); expected score likewise
+RATING_SCALE = 100
+EXPECTED_SCORE_SCALE = 10000
+
+COMPACT_TABLES = ['game_participants', 'player_ratings', 'rating_changes']
+
+PLAYER_RATINGS_SQL = """
+    CREATE TABLE IF NOT EXISTS player_ratings (
+        season_id INTEGER NOT NULL,
+        system_id INTEGER NOT NULL,
+        player_id INTEGER NOT NULL,
+        rating INTEGER NOT NULL,                  -- hundredths of a rating point
+        last_updated TEXT,
+        PRIMARY KEY (season_id, system_id, player_id),
+        FOREIGN KEY (season_id) REFERENCES seasons(season_id),
+        FOREIGN KEY (system_id) REFERENCES systems(system_id),
+        FOREIGN KEY (player_id) REFERENCES users(user_id)
+    ) WITHOUT ROWID
+"""
+
+RATING_CHANGES_SQL = """
+    CREATE TABLE IF NOT EXISTS rating_changes (
+        game_id INTEGER NOT NULL,
+        player_id INTEGER NOT NULL,
+        old_rating INTEGER NOT NULL,             -- hundredths of a rating point
+        new_rating INTEGER NOT NULL,             -- hundredths of a rating point
+        k_factor_used INTEGER NOT NULL,
+        expected_score INTEGER NOT NULL,         -- ten-thousandths
+        PRIMARY KEY (game_id, player_id),
+        FOREIGN KEY (game_id) REFERENCES games(game_id),
+        FOREIGN KEY (player_id) REFERENCES users(user_id)
+    ) WITHOUT ROWID
+"""
+
+RATINGS_VIEW_SQL = f"""
+    CREATE VIEW IF NOT EXISTS ratings AS
+    SELECT player_id, season_id, system_id,
+           rating / {RATING_SCALE}.0 AS current_rating, last_updated
+    FROM player_ratings
+"""
+
+# Also used by archive.attach_archives() over the league_* views
+RATING_HISTORY_SELECT = f"""
+    SELECT rc.game_id, rc.player_id, g.system_id,
+           rc.old_rating / {RATING_SCALE}.0 AS old_rating,
+           rc.new_rating / {RATING_SCALE}.0 AS new_rating,
+           rc.k_factor_used,
+           rc.expected_score / {EXPECTED_SCORE_SCALE}.0 AS expected_score,
+           CASE gp.result WHEN 'win' THEN 1.0 WHEN 'loss' THEN 0.0 ELSE 0.5 END AS actual_score
+    FROM {{rating_changes}} rc
+    JOIN {{games}} g ON g.game_id = rc.game_id
+    LEFT JOIN {{game_participants}} gp ON gp.game_id = rc.game_id AND gp.player_id = rc.player_id
+"""
+
+RATING_HISTORY_VIEW_SQL = "CREATE VIEW IF NOT EXISTS rating_history AS " + RATING_HISTORY_SELECT.format(
+    rating_changes="rating_changes", games="games", game_participants="game_participants"
+)
+
+
+def _object_type(cursor, name):
+    row = cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _without_rowid(cursor, table):
+    return cursor.execute(
+        "SELECT sql LIKE '%WITHOUT ROWID%' FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+
+
+def _compact_ratings(cursor):
+    """Move the `ratings` table into `player_ratings`."""
+    cursor.execute(PLAYER_RATINGS_SQL)
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO player_ratings (season_id, system_id, player_id, rating, last_updated)
+        SELECT season_id, system_id, player_id, CAST(ROUND(current_rating * {RATING_SCALE}) AS INTEGER),
+               last_updated
+        FROM ratings
+    """)
+    cursor.execute("DROP TABLE ratings")
+
+
+def _compact_rating_history(cursor):
+    """Move the `rating_history` table into `rating_changes`."""
+    cursor.execute(RATING_CHANGES_SQL)
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO rating_changes (game_id, player_id, old_rating, new_rating,
+                                               k_factor_used, expected_score)
+        SELECT game_id, player_id,
+               CAST(ROUND(old_rating * {RATING_SCALE}) AS INTEGER),
+               CAST(ROUND(new_rating * {RATING_SCALE}) AS INTEGER),
+               k_factor_used,
+               CAST(ROUND(expected_score * {EXPECTED_SCORE_SCALE}) AS INTEGER)
+        FROM rating_history
+    """)
+    cursor.execute("DROP TABLE rating_history")
+
+
+def _rebuild_without_rowid(cursor, table):
+    """Rebuild `table` as WITHOUT ROWID with the same columns, indexes and triggers."""
+    ddl = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+    dependents = [
+        row[0] for row in cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+    ]
+    ddl = re.sub(
+        r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?["`\[]?\w+["`\]]?',
+        f'CREATE TABLE {table}_compact',
+        ddl,
+        count=1,
+        flags=re.IGNORECASE
+    )
+    cursor.execute(f"{ddl.rstrip().rstrip(';')} WITHOUT ROWID")
+    cursor.execute(f"INSERT INTO {table}_compact SELECT * FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_compact RENAME TO {table}")
+    for sql in dependents:
+        cursor.execute(sql)
+
+
+def compact_tables(connection):
+    """
+    Migrate whichever of the three tables in `connection`'s main database
+    still use the old layout. Works on the hot database and on cold storage
+    files alike; already compact tables are left alone.
+
+    Returns:
+        list: Names of the tables that were migrated.
+    """
+    cursor = connection.cursor()
+    pending = []
+    if _object_type(cursor, 'game_participants') == 'table' and not _without_rowid(cursor, 'game_participants'):
+        pending.append('game_participants')
+    if _object_type(cursor, 'ratings') == 'table':
+        pending.append('ratings')
+    if _object_type(cursor, 'rating_history') == 'table':
+        pending.append('rating_history')
+    if not pending:
+        return []
+
+    connection.commit()
+    foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+    cursor.execute("PRAGMA foreign_keys = OFF")
+    # Renaming must not rewrite (or validate) views that refer to the tables
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        for table in pending:
+            if table == 'game_participants':
+                _rebuild_without_rowid(cursor, table)
+            elif table == 'ratings':
+                _compact_ratings(cursor)
+            else:
+                _compact_rating_history(cursor)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+        cursor.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    return pending
+
+
+def _archive_files(cursor):
+    try:
+        return [row[0] for row in cursor.execute("SELECT file_name FROM season_archives").fetchall()]
+    except sqlite3.OperationalError:
+        return []
+
+
+def compact_file(file_name):
+    """Migrate a cold storage file. Returns the names of the tables that were migrated."""
+    with closing(sqlite3.connect(file_name)) as conn:
+        return compact_tables(conn)
+
+
+def ensure_compact_storage(connection):
+    """
+    Migrate the hot database and every cold storage file to the compact
+    tables, then create the `ratings` and `rating_history` views.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the hot database.
+    """
+    migrated = compact_tables(connection)
+    if migrated:
+        logger.info(f"Compacted tables: {', '.join(migrated)}")
+
+    cursor = connection.cursor()
+    cursor.execute(PLAYER_RATINGS_SQL)
+    cursor.execute(RATING_CHANGES_SQL)
+    cursor.execute(RATINGS_VIEW_SQL)
+    cursor.execute(RATING_HISTORY_VIEW_SQL)
+    connection.commit()
+
+    for file_name in _archive_files(cursor):
+        if not Path(file_name).exists():
+            continue
+        migrated = compact_file(file_name)
+        if migrated:
+            logger.info(f"Compacted tables in {file_name}: {', '.join(migrated)}")
+
+
+def table_sizes(db_path=DB_NAME):
+    """
+    Pages used by each of the compacted tables and their indexes (dbstat).
+
+    Returns:
+        dict: table name -> pages; empty without dbstat.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        try:
+            rows = conn.execute("""
+                SELECT m.tbl_name, COUNT(*)
+                FROM dbstat d
+                JOIN sqlite_master m ON m.name = d.name
+                GROUP BY m.tbl_name
+            """).fetchall()
+        except sqlite3.Error:
+            return {}
+    sizes = dict(rows)
+    return {table: sizes.get(table, 0) for table in COMPACT_TABLES + ['ratings', 'rating_history']
+            if table in sizes}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Migrate ratings and game participants to compact tables.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Migrate the database and cold storage files")
+    migrate_parser.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    subparsers.add_parser("stats", help="Show pages used by the rating and participant tables")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        before = table_sizes()
+        with closing(sqlite3.connect(DB_NAME)) as conn:
+            ensure_compact_storage(conn)
+            if args.vacuum:
+                conn.execute("VACUUM")
+        after = table_sizes()
+        logger.info(f"Pages before: {sum(before.values())}, after: {sum(after.values())}")
+    elif args.command == "stats":
+        for table, pages in table_sizes().items():
+            logger.info(f"  {table}: {pages} pages")
@@ -0,0 +1,293 @@
+"""
+exports.py
+----------
+Streaming database exports.
+
+`snapshot_database()` copies the live database with the SQLite online backup
+API, SNAPSHOT_STEP_PAGES pages per step, so writers are only blocked for one
+step at a time and the copy restarts if the database changes under it: the
+result is always a consistent point-in-time snapshot. `snapshot_zip_stream()`
+streams that file compressed, optionally with an SQL dump generated from the
+snapshot rather than from the live database. Seasons moved to cold storage
+live in their own files (`archive.py`); `snapshot_archives()` snapshots
+every file the snapshot's `season_archives` lists, and they are added at
+their relative paths (`archives/season_<year>.db`).
+
+`csv_zip_stream()` is a generator of ZIP bytes: each table is read
+EXPORT_CHUNK_ROWS rows at a time and written as CSV straight into a
+streamed ZIP entry, and whatever the compressor has produced is yielded
+after every chunk. The archive is never held in memory, so it can be
+returned as a chunked response and the download starts immediately.
+
+Chunks are read with keyset pagination (rowid, or the primary key of a
+WITHOUT ROWID table) so no statement stays open, and no read lock is held,
+while the client is slow to take the next chunk. The tables that `archive.py`
+moves to cold storage are read through its `league_*` views, so the CSVs
+include every season.
+"""
+
+import io
+import os
+import csv
+import sqlite3
+import logging
+import zipfile
+import tempfile
+from pathlib import Path
+from contextlib import closing
+
+from archive import ARCHIVED_TABLES, attach_archives
+
+logger = logging.getLogger(__name__)
+
+# Rows read and written per chunk
+EXPORT_CHUNK_ROWS = 1000
+
+# Pages copied per online backup step, and the pause between steps in seconds
+SNAPSHOT_STEP_PAGES = 256
+SNAPSHOT_STEP_SLEEP = 0.01
+
+# Bytes of the snapshot file compressed per chunk
+SNAPSHOT_READ_BYTES = 256 * 1024
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only, unseekable sink for `zipfile`; `drain()` returns what was written so far."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_tables(cursor):
+    """Names of all user tables, skipping SQLite internal tables."""
+    return [
+        row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+    ]
+
+
+def _primary_key(cursor, table):
+    """Primary key columns of `table`, to page a view over it (views have no rowid)."""
+    columns = cursor.execute(f'PRAGMA main.table_info("{table}")').fetchall()
+    return [f'"{col[1]}"' for col in sorted((c for c in columns if c[5]), key=lambda c: c[5])]
+
+
+def _table_key(cursor, table):
+    """Columns to page `table` by: rowid, or the primary key of a WITHOUT ROWID table."""
+    has_rowid = cursor.execute(
+        "SELECT sql NOT LIKE '%WITHOUT ROWID%' FROM sqlite_master WHERE type='table' AND name = ?",
+        (table,)
+    ).fetchone()[0]
+    if has_rowid:
+        return ["rowid"]
+    return _primary_key(cursor, table)
+
+
+def iter_table_chunks(connection, table, chunk_rows=EXPORT_CHUNK_ROWS, source=None):
+    """
+    Read a table in key order, `chunk_rows` rows at a time.
+
+    Args:
+        source (str): View with the same columns to read instead, e.g. `league_games`;
+            paged by the table's primary key.
+
+    Yields:
+        tuple: (column names, list of row tuples) per non-empty chunk.
+    """
+    cursor = connection.cursor()
+    key = _primary_key(cursor, table) if source else _table_key(cursor, table)
+    source = source or table
+    key_list = ", ".join(key)
+    placeholders = ", ".join("?" for _ in key)
+    columns = None
+    last = None
+    while True:
+        where = f"WHERE ({key_list}) > ({placeholders})" if last is not None else ""
+        cursor.execute(
+            f'SELECT {key_list}, * FROM "{source}" {where} ORDER BY {key_list} LIMIT ?',
+            (*(last or ()), chunk_rows)
+        )
+        if columns is None:
+            columns = [description[0] for description in cursor.description][len(key):]
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last = rows[-1][:len(key)]
+        yield columns, [row[len(key):] for row in rows]
+        if len(rows) < chunk_rows:
+            return
+
+
+def csv_zip_stream(readme, db_path="GPTLeague.db", chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Stream every table as `<table>.csv` in a ZIP archive, plus README.txt.
+    ARCHIVED_TABLES include the seasons in cold storage.
+
+    Args:
+        readme (callable): Called with the exported table names, returns the README text.
+        db_path (str): Database to export.
+        chunk_rows (int): Rows read and written per chunk.
+
+    Yields:
+        bytes: The next piece of the archive.
+    """
+    stream = ZipStream()
+    with closing(sqlite3.connect(db_path)) as conn:
+        tables = export_tables(conn.cursor())
+        attach_archives(conn, '0000-01-01', '9999-12-31')
+        exported = []
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for table_name in tables:
+                try:
+                    source = f"league_{table_name}" if table_name in ARCHIVED_TABLES else None
+                    chunks = iter_table_chunks(conn, table_name, chunk_rows, source)
+                    first = next(chunks, None)
+                    if first is None:
+                        continue
+
+                    with io.TextIOWrapper(zip_file.open(f"{table_name}.csv", "w"),
+                                          encoding="utf-8", newline="") as entry:
+                        csv_writer = csv.writer(entry)
+                        csv_writer.writerow(first[0])
+                        csv_writer.writerows(first[1])
+                        for _, rows in chunks:
+                            entry.flush()
+                            yield stream.drain()
+                            csv_writer.writerows(rows)
+                    exported.append(table_name)
+                except sqlite3.Error as e:
+                    logger.warning(f"Error exporting table {table_name}: {str(e)}")
+                    continue
+                yield stream.drain()
+
+            zip_file.writestr("README.txt", readme(exported))
+    yield stream.drain()
+
+
+def snapshot_database(target_path, db_path="GPTLeague.db", pages=SNAPSHOT_STEP_PAGES):
+    """
+    Copy `db_path` to `target_path` with the online backup API, `pages` pages per step.
+
+    Returns:
+        int: Size of the snapshot in bytes.
+    """
+    with closing(sqlite3.connect(db_path)) as source, closing(sqlite3.connect(target_path)) as target:
+        source.backup(target, pages=pages, sleep=SNAPSHOT_STEP_SLEEP)
+    return os.path.getsize(target_path)
+
+
+def archive_files(db_path):
+    """Cold storage files registered in `db_path` (none before archive.py was first used)."""
+    with closing(sqlite3.connect(db_path)) as conn:
+        try:
+            return [row[0] for row in conn.execute("SELECT file_name FROM season_archives ORDER BY season_id")]
+        except sqlite3.OperationalError:
+            return []
+
+
+def snapshot_archives(snapshot_path, target_dir, db_path="GPTLeague.db"):
+    """
+    Snapshot the cold storage files registered in a snapshot of `db_path` into `target_dir`.
+
+    File names are relative to the directory of `db_path`, as `season_archives`
+    records them; a missing file is logged and skipped.
+
+    Returns:
+        list: (file name, snapshot path) per archive file.
+    """
+    snapshots = []
+    for number, file_name in enumerate(archive_files(snapshot_path)):
+        source = Path(db_path).parent / file_name
+        if not source.exists():
+            logger.warning(f"Cold storage file missing, not included: {source}")
+            continue
+        archive_snapshot = os.path.join(target_dir, f"archive_{number}.db")
+        snapshot_database(archive_snapshot, str(source))
+        snapshots.append((file_name, archive_snapshot))
+    return snapshots
+
+
+def archive_dump_name(file_name):
+    """Entry name of an archive file's SQL dump: archives/season_2025.db -> archives/season_2025.sql."""
+    return Path(file_name).with_suffix(".sql").as_posix()
+
+
+def _zip_file(zip_file, stream, entry_name, path):
+    """Write the file at `path` into a ZIP entry, yielding the compressed bytes as they come."""
+    with open(path, "rb") as source, zip_file.open(entry_name, "w", force_zip64=True) as entry:
+        while data := source.read(SNAPSHOT_READ_BYTES):
+            entry.write(data)
+            yield stream.drain()
+
+
+def write_sql_dump(zip_file, entry_name, snapshot_path, header=""):
+    """
+    Write an SQL text dump of a snapshot into a ZIP entry, one statement at a time.
+
+    Yields:
+        int: Statements written so far, every 5000 statements.
+    """
+    with closing(sqlite3.connect(snapshot_path)) as conn, \
+            io.TextIOWrapper(zip_file.open(entry_name, "w"), encoding="utf-8") as dump_file:
+        dump_file.write(header)
+        for count, line in enumerate(conn.iterdump(), 1):
+            dump_file.write(f"{line}\n")
+            if count % 5000 == 0:
+                yield count
+
+
+def snapshot_zip_stream(readme, db_name, dump_name=None, db_path="GPTLeague.db"):
+    """
+    Stream a consistent snapshot of the database and its cold storage files
+    in a ZIP archive, plus README.txt.
+
+    Args:
+        readme (callable): Called with the archive's entry names and the cold storage
+            file names, returns the README text.
+        db_name (str): Entry name of the database file.
+        dump_name (str): Entry name of an SQL dump of the snapshot; no dump when None.
+            Archive files are dumped to `archive_dump_name()` too.
+        db_path (str): Database to snapshot.
+
+    Yields:
+        bytes: The next piece of the archive.
+    """
+    stream = ZipStream()
+    with tempfile.TemporaryDirectory(prefix="export_") as tmp:
+        snapshot_path = os.path.join(tmp, "snapshot.db")
+        size = snapshot_database(snapshot_path, db_path)
+        archives = snapshot_archives(snapshot_path, tmp, db_path)
+        logger.info(f"Snapshot of {db_path} taken ({size} bytes, {len(archives)} archive file(s))")
+
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            yield from _zip_file(zip_file, stream, db_name, snapshot_path)
+            entries = [db_name]
+            for file_name, archive_snapshot in archives:
+                yield from _zip_file(zip_file, stream, file_name, archive_snapshot)
+                entries.append(file_name)
+
+            if dump_name:
+                for _ in write_sql_dump(zip_file, dump_name, snapshot_path):
+                    yield stream.drain()
+                entries.append(dump_name)
+                for file_name, archive_snapshot in archives:
+                    for _ in write_sql_dump(zip_file, archive_dump_name(file_name), archive_snapshot):
+                        yield stream.drain()
+                    entries.append(archive_dump_name(file_name))
+
+            zip_file.writestr("README.txt", readme(entries, [file_name for file_name, _ in archives]))
+        yield stream.drain()
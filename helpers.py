@@ -1,3 +1,4 @@
+import os
 import bcrypt
 import re
 import sqlite3
@@ -5,9 +6,13 @@ import logging
 
 from flask import redirect, render_template, session
 from functools import wraps
+from read_snapshot import read_connection
 
 logger = logging.getLogger(__name__)
 
+# bcrypt work factor for new hashes; older hashes are rehashed on their next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 def apology(message, code=400):
     """Render message as an apology to user."""
     def escape(s):
@@ -24,9 +29,13 @@ def apology(message, code=400):
 
 def hash_password(password):
     # Hash a password for the first time
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     return hashed_password
 
+def password_rounds(hashed_password):
+    """Return the bcrypt cost a hash was created with ('$2b$12$...' -> 12)."""
+    return int(hashed_password.split(b'$')[2])
+
 def check_password(password, hashed_password):
     # Check hashed password against entered password
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
@@ -82,7 +91,7 @@ def CURRENT_YEAR():
     The application uses `GPTLeague.db` and `seasons` elsewhere; prefer that.
     """
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             cursor = connection.cursor()
             year = cursor.execute("SELECT year FROM seasons ORDER BY year DESC LIMIT 1").fetchone()
             return year[0] if year else None
@@ -91,7 +100,7 @@ def CURRENT_YEAR():
         return None
 def season(year):
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             cursor = connection.cursor()
             season = cursor.execute("SELECT season_id,start_date,end_date FROM seasons WHERE year = ?", (year,)).fetchone()
             if season:
@@ -105,10 +114,30 @@ def season(year):
         logger.error(f"Database error in season: {str(e)}")
         return None
 
+def ensure_league_settings_table(cursor):
+    """Create league_settings, replacing the old key/value table that had no setting_key column."""
+    try:
+        cursor.execute("SELECT setting_key FROM league_settings LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("DROP TABLE IF EXISTS league_settings")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS league_settings (
+            setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            season_id INTEGER,
+            setting_key TEXT NOT NULL,
+            setting_value TEXT NOT NULL,
+            description TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(season_id, setting_key),
+            FOREIGN KEY(season_id) REFERENCES seasons(season_id)
+        )
+    """)
+
 def all_seasons():
     """Return all active and archived seasons ordered by year descending."""
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
             return cursor.execute(
@@ -118,24 +147,51 @@ def all_seasons():
         logger.error(f"Database error in all_seasons: {str(e)}")
         return []
 
+def authenticate(connection, username, password):
+    """
+    Verify a login with one query on the caller's connection.
+
+    When the password matches but the stored hash was made with a cost other
+    than BCRYPT_ROUNDS, the password is rehashed at the configured cost.
+
+    Returns:
+        dict: `user_id` and `roles` (set) on success, otherwise None.
+    """
+    row = connection.execute("""
+        SELECT u.user_id, u.password_hash, GROUP_CONCAT(r.role)
+        FROM users u
+        LEFT JOIN user_roles r ON r.user_id = u.user_id
+        WHERE u.user_name = ?
+        GROUP BY u.user_id
+    """, (username,)).fetchone()
+    if not row:
+        return None
+
+    user_id, stored_hash, roles = row
+    # sqlite may return the stored hash as text or bytes
+    if isinstance(stored_hash, str):
+        stored_hash = stored_hash.encode('utf-8')
+    if not check_password(password, stored_hash):
+        return None
+
+    if password_rounds(stored_hash) != BCRYPT_ROUNDS:
+        connection.execute(
+            "UPDATE users SET password_hash = ? WHERE user_id = ?",
+            (hash_password(password), user_id)
+        )
+        connection.commit()
+        logger.info(f"Rehashed password for user {user_id} at cost {BCRYPT_ROUNDS}")
+
+    return {"user_id": user_id, "roles": set(roles.split(',')) if roles else set()}
+
 def check_account(username, password):
-    """Verify username/password against `users.hash` in GPTLeague.db.
+    """Verify username/password against `users.password_hash` in GPTLeague.db.
 
-    This function normalizes to the `username` column (server.py uses
-    `username`) and reads the `hash` column. It returns `True` for a
-    successful match, `False` for failure.
+    Returns `True` for a successful match, `False` for failure.
     """
     try:
         with sqlite3.connect('GPTLeague.db') as connection:
-            cursor = connection.cursor()
-            row = cursor.execute("SELECT password_hash FROM users WHERE user_name = ?", (username,)).fetchone()
-            if not row:
-                return False
-            stored_hash = row[0]
-            # sqlite may return the stored hash as text or bytes
-            if isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-            return check_password(password, stored_hash)
+            return authenticate(connection, username, password) is not None
     except Exception as e:
         logger.error(f"Database error in check_account: {str(e)}")
         return False
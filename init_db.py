@@ -2,6 +2,11 @@
 Database initialization script for DTC League application.
 This script initializes the SQLite database with the proper schema for production use.
 It preserves reference data by exporting to CSV for migration to production servers.
+
+Usage:
+    python init_db.py                 # round-trip reference data through data_exports/*.csv
+    python init_db.py --fast-reset    # copy reference data straight from the backup instead
+    python init_db.py --verify [--deep]  # only verify the existing database
 """
 import sqlite3
 import os
@@ -9,8 +14,13 @@ import sys
 import logging
 import csv
 import shutil
+import argparse
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from session_store import SESSIONS_DB, clear_sessions
+from backups import take_backup
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,45 +33,53 @@ SCHEMA_FILE = "schema.sql"
 EXPORT_DIR = "data_exports"
 REFERENCE_TABLES = ['elo_rules', 'factions', 'league_settings', 'locations', 'seasons', 'systems']
 
+# Rows written per chunk when exporting
+EXPORT_CHUNK_ROWS = 5000
+
 def create_export_dir():
     """Create the data exports directory if it doesn't exist"""
     export_path = Path(__file__).parent / EXPORT_DIR
     export_path.mkdir(exist_ok=True)
     return export_path
 
+def _export_table(db_path, export_path, table):
+    """Write one table to `<table>.csv`; returns the row count, or None if it failed."""
+    try:
+        with sqlite3.connect(str(db_path)) as conn:
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            col_names = [description[0] for description in cursor.description]
+            row_count = 0
+
+            csv_path = export_path / f"{table}.csv"
+            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(col_names)
+                while rows := cursor.fetchmany(EXPORT_CHUNK_ROWS):
+                    writer.writerows(rows)
+                    row_count += len(rows)
+
+            # Keep the previous behaviour of not leaving files for empty tables
+            if not row_count:
+                csv_path.unlink()
+            return row_count
+
+    except Exception as e:
+        logger.warning(f"  Could not export {table}: {e}")
+        return None
+
 def export_reference_tables(db_path):
-    """Export reference tables to CSV files"""
+    """Export reference tables to CSV files, one file per table written concurrently"""
     export_path = create_export_dir()
     
     try:
-        with sqlite3.connect(str(db_path)) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            for table in REFERENCE_TABLES:
-                try:
-                    # Get all rows from the table
-                    cursor.execute(f"SELECT * FROM {table}")
-                    rows = cursor.fetchall()
-                    
-                    if rows:
-                        # Get column names
-                        col_names = [description[0] for description in cursor.description]
-                        
-                        # Write to CSV
-                        csv_path = export_path / f"{table}.csv"
-                        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                            writer = csv.writer(f)
-                            writer.writerow(col_names)
-                            for row in rows:
-                                writer.writerow(row)
-                        
-                        logger.info(f"✓ Exported {table}: {len(rows)} rows → {csv_path.name}")
-                    else:
-                        logger.info(f"  {table}: (no data)")
-                        
-                except Exception as e:
-                    logger.warning(f"  Could not export {table}: {e}")
+        with ThreadPoolExecutor(max_workers=len(REFERENCE_TABLES)) as pool:
+            counts = pool.map(lambda table: _export_table(db_path, export_path, table), REFERENCE_TABLES)
+
+            for table, row_count in zip(REFERENCE_TABLES, counts):
+                if row_count:
+                    logger.info(f"✓ Exported {table}: {row_count} rows → {table}.csv")
+                elif row_count == 0:
+                    logger.info(f"  {table}: (no data)")
             
         return True
         
@@ -70,10 +88,12 @@ def export_reference_tables(db_path):
         return False
 
 def import_reference_tables(db_path, export_path):
-    """Import reference tables from CSV files"""
+    """Import reference tables from CSV files, one transaction per table"""
     try:
-        with sqlite3.connect(str(db_path)) as conn:
+        with sqlite3.connect(str(db_path), isolation_level=None) as conn:
             cursor = conn.cursor()
+            # Reference tables load in name order, not dependency order
+            cursor.execute("PRAGMA foreign_keys = OFF")
             
             for table in REFERENCE_TABLES:
                 csv_path = export_path / f"{table}.csv"
@@ -91,17 +111,16 @@ def import_reference_tables(db_path, export_path):
                         placeholders = ','.join(['?' for _ in col_names])
                         insert_sql = f"INSERT INTO {table} ({','.join(col_names)}) VALUES ({placeholders})"
                         
-                        # Insert rows
-                        row_count = 0
-                        for row in reader:
-                            if row:  # Skip empty rows
-                                cursor.execute(insert_sql, row)
-                                row_count += 1
-                        
-                        conn.commit()
+                        # Insert all rows in one transaction, skipping empty rows
+                        cursor.execute("BEGIN")
+                        cursor.executemany(insert_sql, (row for row in reader if row))
+                        row_count = cursor.rowcount
+                        cursor.execute("COMMIT")
                         logger.info(f"✓ Imported {table}: {row_count} rows")
                         
                 except Exception as e:
+                    if conn.in_transaction:
+                        cursor.execute("ROLLBACK")
                     logger.warning(f"  Error importing {table}: {e}")
             
         return True
@@ -110,6 +129,42 @@ def import_reference_tables(db_path, export_path):
         logger.error(f"✗ Error importing reference tables: {e}")
         return False
 
+def copy_reference_tables(db_path, source_path):
+    """Copy reference tables straight from another database (--fast-reset)"""
+    try:
+        with sqlite3.connect(str(db_path), isolation_level=None) as conn:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA foreign_keys = OFF")
+            cursor.execute("ATTACH DATABASE ? AS source", (str(source_path),))
+            
+            for table in REFERENCE_TABLES:
+                # Copy the columns both schemas have, so added or dropped columns don't break a reset
+                new_cols = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})")]
+                old_cols = {row[1] for row in cursor.execute(f"PRAGMA source.table_info({table})")}
+                col_names = [col for col in new_cols if col in old_cols]
+                if not col_names:
+                    logger.info(f"  {table}: not in both databases, skipping")
+                    continue
+                
+                try:
+                    cols = ','.join(col_names)
+                    cursor.execute("BEGIN")
+                    cursor.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM source.{table}")
+                    row_count = cursor.rowcount
+                    cursor.execute("COMMIT")
+                    logger.info(f"✓ Copied {table}: {row_count} rows")
+                except Exception as e:
+                    if conn.in_transaction:
+                        cursor.execute("ROLLBACK")
+                    logger.warning(f"  Error copying {table}: {e}")
+            
+            cursor.execute("DETACH DATABASE source")
+        return True
+        
+    except Exception as e:
+        logger.error(f"✗ Error copying reference tables: {e}")
+        return False
+
 def init_database():
     """Initialize the database from schema.sql"""
     
@@ -155,7 +210,14 @@ def init_database():
         return False
 
 def cleanup_temp_sessions():
-    """Remove temporary session files"""
+    """Remove stored sessions, including files left by the old filesystem backend"""
+    try:
+        if Path(SESSIONS_DB).exists():
+            clear_sessions()
+            logger.info("✓ Cleared stored sessions")
+    except Exception as e:
+        logger.warning(f"Could not clear stored sessions: {e}")
+
     session_dir = Path(__file__).parent / "flask_session"
     
     if session_dir.exists():
@@ -171,8 +233,88 @@ def cleanup_temp_sessions():
         except Exception as e:
             logger.warning(f"Could not clean up session files: {e}")
 
-def verify_database():
-    """Verify the database is properly set up"""
+# Set-based consistency checks for the fast tier: (description, query returning offending ids)
+CONSISTENCY_CHECKS = [
+    ("games without exactly two participants", """
+        SELECT g.game_id
+        FROM games g
+        LEFT JOIN game_participants gp ON gp.game_id = g.game_id
+        GROUP BY g.game_id
+        HAVING COUNT(gp.player_id) != 2
+    """),
+    ("participants of missing games", """
+        SELECT DISTINCT gp.game_id
+        FROM game_participants gp
+        WHERE NOT EXISTS (SELECT 1 FROM games g WHERE g.game_id = gp.game_id)
+    """),
+    ("participants with unknown faction ids", """
+        SELECT gp.game_id
+        FROM game_participants gp
+        WHERE gp.faction_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM factions f WHERE f.faction_id = gp.faction_id)
+    """),
+    ("games with unknown location ids", """
+        SELECT g.game_id
+        FROM games g
+        WHERE g.location_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM locations l WHERE l.location_id = g.location_id)
+    """),
+    # Games played at the same time may be rated in either order, so any of the latest will do
+    ("ratings that differ from the last rating_changes row", """
+        WITH last_played AS (
+            SELECT rc.player_id, g.season_id, g.system_id, MAX(g.played_on) AS played_on
+            FROM rating_changes rc
+            JOIN games g ON g.game_id = rc.game_id
+            GROUP BY rc.player_id, g.season_id, g.system_id
+        )
+        SELECT pr.player_id
+        FROM player_ratings pr
+        JOIN last_played lp
+          ON lp.player_id = pr.player_id AND lp.season_id = pr.season_id AND lp.system_id = pr.system_id
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM rating_changes rc
+            JOIN games g ON g.game_id = rc.game_id
+            WHERE rc.player_id = pr.player_id AND g.system_id = pr.system_id
+              AND g.season_id = pr.season_id AND g.played_on = lp.played_on
+              AND rc.new_rating = pr.rating
+        )
+    """),
+]
+
+def _check_consistency(cursor):
+    """Run CONSISTENCY_CHECKS; returns a list of problem descriptions"""
+    problems = []
+    for description, query in CONSISTENCY_CHECKS:
+        ids = [row[0] for row in cursor.execute(query).fetchall()]
+        if ids:
+            sample = ", ".join(str(i) for i in ids[:5])
+            problems.append(f"{len(ids)} {description} (e.g. {sample})")
+    return problems
+
+def _deep_integrity_check(cursor):
+    """PRAGMA integrity_check one table (and its indexes) at a time, logging progress"""
+    tables = [
+        row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
+        ).fetchall()
+    ]
+    problems = []
+    for done, table in enumerate(tables, 1):
+        results = [row[0] for row in cursor.execute(f'PRAGMA integrity_check("{table}")').fetchall()]
+        if results != ["ok"]:
+            problems.extend(f"{table}: {result}" for result in results)
+        logger.info(f"  [{done}/{len(tables)}] {table}: {'ok' if results == ['ok'] else 'PROBLEMS'}")
+    return problems
+
+def verify_database(deep=False):
+    """
+    Verify the database is properly set up.
+
+    The fast tier checks the required tables, runs PRAGMA quick_check and the
+    CONSISTENCY_CHECKS queries; it is cheap enough for every deploy. With
+    `deep`, a full integrity_check follows, run table by table with progress.
+    """
     try:
         with sqlite3.connect(DB_NAME) as conn:
             cursor = conn.cursor()
@@ -180,7 +322,7 @@ def verify_database():
             # Check required tables
             required_tables = [
                 'users', 'seasons', 'systems', 'games', 'game_participants',
-                'ratings', 'system_memberships', 'club_memberships', 'user_roles'
+                'player_ratings', 'system_memberships', 'club_memberships', 'user_roles'
             ]
             
             cursor.execute(
@@ -195,14 +337,30 @@ def verify_database():
             
             logger.info("✓ All required tables exist")
             
-            # Check database integrity
-            cursor.execute("PRAGMA integrity_check;")
+            # Structural check without the index cross-checks of integrity_check
+            cursor.execute("PRAGMA quick_check;")
             integrity = cursor.fetchone()[0]
             if integrity == "ok":
-                logger.info("✓ Database integrity check passed")
+                logger.info("✓ Database quick check passed")
             else:
                 logger.error(f"✗ Database integrity issue: {integrity}")
                 return False
+
+            problems = _check_consistency(cursor)
+            for problem in problems:
+                logger.error(f"✗ {problem}")
+            if problems:
+                return False
+            logger.info("✓ Games, participants, ratings and references are consistent")
+
+            if deep:
+                logger.info("Running full integrity check...")
+                problems = _deep_integrity_check(cursor)
+                for problem in problems[:20]:
+                    logger.error(f"✗ {problem}")
+                if problems:
+                    return False
+                logger.info("✓ Database integrity check passed")
             
         return True
         
@@ -211,6 +369,17 @@ def verify_database():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reset the league database, keeping reference data.")
+    parser.add_argument("--fast-reset", action="store_true",
+                        help="Copy reference tables from the backup with ATTACH instead of via CSV")
+    parser.add_argument("--verify", action="store_true",
+                        help="Only verify the existing database (quick check and consistency queries)")
+    parser.add_argument("--deep", action="store_true", help="Also run a full integrity check when verifying")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify_database(deep=args.deep) else 1)
+
     logger.info("=" * 60)
     logger.info("DTC League Database Initialization")
     logger.info("=" * 60)
@@ -222,8 +391,11 @@ if __name__ == "__main__":
     
     # Step 1: Export reference tables from existing database
     if db_path.exists():
-        logger.info("\n[1/4] Exporting reference tables...")
-        export_reference_tables(db_path)
+        if args.fast_reset:
+            logger.info("\n[1/4] (CSV export skipped: --fast-reset)")
+        else:
+            logger.info("\n[1/4] Exporting reference tables...")
+            export_reference_tables(db_path)
         
         # Step 2: Backup existing database
         logger.info("\n[2/4] Backing up existing database...")
@@ -234,6 +406,13 @@ if __name__ == "__main__":
                 backup_path = current_dir / f"{DB_NAME}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 logger.info(f"  Existing backup is locked, using timestamped backup instead")
         
+        try:
+            # Also keep it in the rotating backup store, where it survives the next reset
+            manifest = take_backup(db_path, current_dir / "backups")
+            logger.info(f"✓ Backup {manifest['name']} added to backups/")
+        except Exception as e:
+            logger.warning(f"⚠ Could not add to the backup store: {e}")
+
         try:
             shutil.copy(db_path, backup_path)
             logger.info(f"✓ Backup created: {backup_path.name}")
@@ -253,17 +432,20 @@ if __name__ == "__main__":
     if init_database():
         # Step 4: Import reference tables
         logger.info("\n[4/4] Importing reference tables...")
-        if export_path.exists() and any(export_path.glob("*.csv")):
+        if args.fast_reset and backup_path.exists():
+            copy_reference_tables(db_path, backup_path)
+        elif export_path.exists() and any(export_path.glob("*.csv")):
             import_reference_tables(db_path, export_path)
         
         # Cleanup temp sessions
         cleanup_temp_sessions()
         
         # Verify setup
-        if verify_database():
+        if verify_database(deep=args.deep):
             logger.info("=" * 60)
             logger.info("✓ Database setup completed successfully!")
-            logger.info(f"✓ Reference data exported to: {EXPORT_DIR}/")
+            if not args.fast_reset:
+                logger.info(f"✓ Reference data exported to: {EXPORT_DIR}/")
             if backup_path.exists():
                 logger.info(f"✓ Original database backed up: {backup_path.name}")
             logger.info("=" * 60)
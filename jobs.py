@@ -0,0 +1,222 @@
+"""
+jobs.py
+-------
+Lightweight in-process background jobs for long admin operations.
+
+Admin routes call `submit_job()` and redirect to `/admin/jobs/<job_id>`; the
+work runs on a small bounded thread pool and reports progress and log lines
+through the `JobContext` it is given. Job state lives in the `jobs` and
+`job_logs` tables of a sidecar database (`JOBS_DB`), so progress can be
+written while the job holds a write transaction on GPTLeague.db and any
+worker can render the progress page. Files a job produces (exports,
+temporary password lists) are written under `JOB_OUTPUT_DIR`.
+
+Jobs are not resumed: `ensure_job_tables()` marks queued or running jobs
+whose worker process no longer exists as failed.
+"""
+
+import os
+import sqlite3
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = "jobs.db"
+JOB_OUTPUT_DIR = "job_output"
+
+# Concurrent jobs per process; more are queued
+JOB_WORKERS = 2
+
+# Output files of finished jobs are deleted after this many hours
+JOB_OUTPUT_TTL_HOURS = 24
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def _connect():
+    return sqlite3.connect(JOBS_DB, timeout=30)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def ensure_job_tables():
+    """Create the job tables and fail jobs interrupted by a restart."""
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,                          -- e.g. 'game_import', 'export_csv'
+                description TEXT NOT NULL,
+                created_by INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued'
+                    CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+                progress INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                result_file TEXT,                            -- path under JOB_OUTPUT_DIR
+                worker_pid INTEGER,
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                started_at TEXT,
+                finished_at TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_logs (
+                log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                logged_at TEXT NOT NULL DEFAULT (datetime('now')),
+                level TEXT NOT NULL DEFAULT 'info',
+                message TEXT NOT NULL,
+                FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_logs_job ON job_logs(job_id, log_id)")
+        orphaned = [
+            job_id for job_id, pid in cursor.execute(
+                "SELECT job_id, worker_pid FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+            if not pid or not _process_alive(pid)
+        ]
+        cursor.executemany("""
+            UPDATE jobs
+            SET status = 'failed', message = 'Interrupted by a server restart', finished_at = datetime('now')
+            WHERE job_id = ?
+        """, [(job_id,) for job_id in orphaned])
+
+
+class JobContext:
+    """Handle passed to a running job for reporting progress, logs and output."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def _execute(self, sql, params):
+        with _connect() as conn:
+            conn.execute(sql, params)
+
+    def progress(self, done, total=None, message=None):
+        """Record `done` of `total` units of work, optionally with a status message."""
+        self._execute("""
+            UPDATE jobs
+            SET progress = ?, total = COALESCE(?, total), message = COALESCE(?, message)
+            WHERE job_id = ?
+        """, (done, total, message, self.job_id))
+
+    def log(self, message, level="info"):
+        """Append a line to the job's log."""
+        self._execute(
+            "INSERT INTO job_logs (job_id, level, message) VALUES (?, ?, ?)",
+            (self.job_id, level, message)
+        )
+
+    def output_path(self, file_name):
+        """Path for a file produced by this job; it becomes the job's download."""
+        directory = Path(JOB_OUTPUT_DIR)
+        directory.mkdir(exist_ok=True)
+        path = directory / f"job_{self.job_id}_{file_name}"
+        self._execute("UPDATE jobs SET result_file = ? WHERE job_id = ?", (str(path), self.job_id))
+        return path
+
+
+def purge_job_output(cursor):
+    """Delete output files of jobs that finished more than JOB_OUTPUT_TTL_HOURS ago."""
+    expired = cursor.execute("""
+        SELECT job_id, result_file FROM jobs
+        WHERE result_file IS NOT NULL AND finished_at <= datetime('now', ?)
+    """, (f"-{JOB_OUTPUT_TTL_HOURS} hours",)).fetchall()
+    for job_id, result_file in expired:
+        Path(result_file).unlink(missing_ok=True)
+    cursor.executemany(
+        "UPDATE jobs SET result_file = NULL WHERE job_id = ?", [(job_id,) for job_id, _ in expired]
+    )
+
+
+def submit_job(kind, description, created_by, func, *args, **kwargs):
+    """
+    Queue func(job, *args, **kwargs) on the job pool.
+
+    The function's return value (a short string) becomes the job's final
+    message; an exception marks the job failed.
+
+    Returns:
+        int: The new job id.
+    """
+    with _connect() as conn:
+        cursor = conn.cursor()
+        purge_job_output(cursor)
+        cursor.execute(
+            "INSERT INTO jobs (kind, description, created_by, worker_pid) VALUES (?, ?, ?, ?)",
+            (kind, description, created_by, os.getpid())
+        )
+        job_id = cursor.lastrowid
+
+    _executor.submit(_run_job, job_id, func, args, kwargs)
+    logger.info(f"Job {job_id} queued: {description}")
+    return job_id
+
+
+def _run_job(job_id, func, args, kwargs):
+    job = JobContext(job_id)
+    job._execute(
+        "UPDATE jobs SET status = 'running', started_at = datetime('now') WHERE job_id = ?",
+        (job_id,)
+    )
+    try:
+        message = func(job, *args, **kwargs)
+        job._execute("""
+            UPDATE jobs
+            SET status = 'succeeded', message = COALESCE(?, message), finished_at = datetime('now')
+            WHERE job_id = ?
+        """, (message, job_id))
+        logger.info(f"Job {job_id} finished: {message}")
+    except Exception as e:
+        logger.exception(f"Job {job_id} failed")
+        job.log(str(e), "error")
+        job._execute("""
+            UPDATE jobs
+            SET status = 'failed', message = ?, finished_at = datetime('now')
+            WHERE job_id = ?
+        """, (str(e), job_id))
+
+
+def get_job(job_id):
+    """Return the jobs row for job_id as a dict, or None."""
+    with _connect() as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def job_log_lines(job_id, after=0):
+    """Return log lines of a job newer than log_id `after`, as dicts."""
+    with _connect() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT log_id, logged_at, level, message
+            FROM job_logs
+            WHERE job_id = ? AND log_id > ?
+            ORDER BY log_id
+        """, (job_id, after)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def recent_jobs(limit=50):
+    """Return the most recent jobs as dicts, newest first."""
+    with _connect() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT * FROM jobs ORDER BY job_id DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [dict(row) for row in rows]
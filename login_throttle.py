@@ -0,0 +1,123 @@
+"""
+login_throttle.py
+-----------------
+Admission control for the password endpoints (/login, /claim_account,
+/reset_password).
+
+bcrypt work from requests runs inside `bcrypt_slot()`, which admits at most
+BCRYPT_CONCURRENCY hashes at a time per process and gives up after
+BCRYPT_QUEUE_TIMEOUT seconds, so a login flood cannot occupy every worker.
+Failed attempts are counted per username and per client IP; past a few free
+attempts the key is locked out with exponential backoff. Throttled requests
+are rejected before any hashing. Counters are kept in memory and evicted
+after THROTTLE_TTL_SECONDS without activity.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Concurrent bcrypt operations per process, and how long a request waits for one
+BCRYPT_CONCURRENCY = int(os.getenv("BCRYPT_CONCURRENCY", "2"))
+BCRYPT_QUEUE_TIMEOUT = 5
+
+# Failures allowed before backoff starts; an IP may be shared by several players
+USERNAME_FREE_ATTEMPTS = 5
+IP_FREE_ATTEMPTS = 20
+
+# Lockout doubles from BACKOFF_BASE_SECONDS per extra failure, up to BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 15 * 60
+
+# Counters idle this long are forgotten; at most THROTTLE_MAX_KEYS are kept
+THROTTLE_TTL_SECONDS = 60 * 60
+THROTTLE_MAX_KEYS = 10000
+
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_CONCURRENCY)
+
+
+class BcryptBusy(Exception):
+    """No bcrypt slot became free within BCRYPT_QUEUE_TIMEOUT."""
+
+
+@contextmanager
+def bcrypt_slot():
+    """Run the enclosed bcrypt work once a slot is free; raises BcryptBusy on timeout."""
+    if not _bcrypt_slots.acquire(timeout=BCRYPT_QUEUE_TIMEOUT):
+        logger.warning("bcrypt queue full, rejecting request")
+        raise BcryptBusy()
+    try:
+        yield
+    finally:
+        _bcrypt_slots.release()
+
+
+class AttemptThrottle:
+    """Failed-attempt counters with exponential backoff, keyed by username or IP."""
+
+    def __init__(self, free_attempts):
+        self.free_attempts = free_attempts
+        self._entries = OrderedDict()  # key -> [failures, blocked_until, last_seen]
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Entries are kept in last_seen order, so expired ones are at the front
+        while self._entries:
+            key, (_, blocked_until, last_seen) = next(iter(self._entries.items()))
+            if len(self._entries) <= THROTTLE_MAX_KEYS and (
+                    now - last_seen < THROTTLE_TTL_SECONDS or blocked_until > now):
+                break
+            del self._entries[key]
+
+    def wait_seconds(self, key):
+        """Seconds until `key` may try again; 0 when it is not locked out."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if not entry or entry[1] <= now:
+                return 0
+            return int(entry[1] - now) + 1
+
+    def failure(self, key):
+        """Count a failed attempt and extend the lockout once past the free attempts."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.pop(key, [0, 0, now])
+            entry[0] += 1
+            entry[2] = now
+            if entry[0] >= self.free_attempts:
+                backoff = BACKOFF_BASE_SECONDS * 2 ** (entry[0] - self.free_attempts)
+                entry[1] = now + min(backoff, BACKOFF_MAX_SECONDS)
+            self._entries[key] = entry
+            self._evict(now)
+
+    def success(self, key):
+        """Forget a key after a successful attempt."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_username_throttle = AttemptThrottle(USERNAME_FREE_ATTEMPTS)
+_ip_throttle = AttemptThrottle(IP_FREE_ATTEMPTS)
+
+
+def throttle_wait(username, ip):
+    """Seconds the caller must wait before another attempt for this username/IP; 0 if none."""
+    return max(_username_throttle.wait_seconds(username), _ip_throttle.wait_seconds(ip))
+
+
+def record_attempt(username, ip, success):
+    """Record the outcome of a password check for this username/IP."""
+    if success:
+        # The IP counter is left to expire, so one valid account cannot reset it
+        _username_throttle.success(username)
+    else:
+        _username_throttle.failure(username)
+        _ip_throttle.failure(ip)
+        logger.warning(f"Failed password attempt for user {username} from {ip}")
@@ -0,0 +1,240 @@
+"""
+maintenance.py
+--------------
+Background upkeep of GPTLeague.db: planner statistics and free-page reclaim.
+
+Rating replays delete and re-insert rating_changes and player_ratings are
+rewritten with INSERT OR REPLACE, so the file collects free pages, and
+without ANALYZE the query planner has no statistics. A maintenance thread
+wakes every MAINTENANCE_INTERVAL_SECONDS and, once no request has been
+served for MAINTENANCE_IDLE_SECONDS:
+
+- runs ANALYZE (with PRAGMA analysis_limit) if `request_analyze()` was
+  called after a bulk write, otherwise PRAGMA optimize;
+- with auto_vacuum=INCREMENTAL, reclaims free pages VACUUM_STEP_PAGES at a
+  time with PRAGMA incremental_vacuum, stopping as soon as a request arrives.
+
+Existing databases are switched to incremental auto-vacuum with
+`enable_incremental_vacuum()` (a one-off full VACUUM) from the admin
+database page or `python maintenance.py enable-incremental-vacuum`;
+databases created from schema.sql start with it.
+
+Usage:
+    python maintenance.py stats
+    python maintenance.py analyze
+    python maintenance.py vacuum-step
+    python maintenance.py enable-incremental-vacuum
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+
+# Seconds between maintenance passes; 0 disables the thread
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "300"))
+
+# A pass only runs when no request has been served for this long
+MAINTENANCE_IDLE_SECONDS = 60
+
+# Pages freed per incremental_vacuum step
+VACUUM_STEP_PAGES = 200
+
+# Rows sampled per index by ANALYZE; keeps it fast on large tables
+ANALYSIS_LIMIT = 1000
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+_last_activity = time.monotonic()
+_analyze_pending = threading.Event()
+_maintenance_lock = threading.Lock()
+
+
+def note_activity():
+    """Record that a request was served, postponing idle-time maintenance."""
+    global _last_activity
+    _last_activity = time.monotonic()
+
+
+def _idle():
+    return time.monotonic() - _last_activity >= MAINTENANCE_IDLE_SECONDS
+
+
+def request_analyze():
+    """Ask for ANALYZE at the next idle pass, e.g. after a bulk import or rating replay."""
+    _analyze_pending.set()
+
+
+def analyze(connection):
+    """Refresh planner statistics for every table, sampling at most ANALYSIS_LIMIT rows per index."""
+    started = time.monotonic()
+    connection.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    connection.execute("ANALYZE")
+    connection.commit()
+    logger.info(f"ANALYZE finished in {time.monotonic() - started:.2f}s")
+
+
+def optimize(connection):
+    """PRAGMA optimize: re-analyze tables whose statistics the planner would benefit from."""
+    connection.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    connection.execute("PRAGMA optimize")
+
+
+def vacuum_step(connection, pages=VACUUM_STEP_PAGES):
+    """
+    Free up to `pages` pages with PRAGMA incremental_vacuum.
+
+    Returns:
+        int: Pages freed (0 unless auto_vacuum is INCREMENTAL).
+    """
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    # incremental_vacuum returns one row per step; it only runs when they are fetched
+    connection.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    connection.commit()
+    return before - connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def enable_incremental_vacuum(db_path=DB_NAME):
+    """
+    Switch the database to auto_vacuum=INCREMENTAL. Needs a full VACUUM, which
+    blocks writers until it finishes.
+
+    Returns:
+        bool: True if the mode was changed, False if it was already incremental.
+    """
+    with closing(sqlite3.connect(db_path, isolation_level=None)) as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        started = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    logger.info(f"Enabled incremental auto-vacuum in {time.monotonic() - started:.2f}s")
+    return True
+
+
+def database_stats(db_path=DB_NAME):
+    """
+    File and page statistics for the admin database page.
+
+    Returns:
+        dict: page_size, page_count, freelist_count, file_size, auto_vacuum,
+              analyzed (sqlite_stat1 present), analyze_pending and `tables`,
+              a list of (name, pages) largest first (empty without dbstat).
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        stats = {
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+            "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+            "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+            "auto_vacuum": AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0], "unknown"),
+            "analyzed": conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone() is not None,
+            "analyze_pending": _analyze_pending.is_set(),
+        }
+        try:
+            stats["tables"] = conn.execute(
+                "SELECT name, COUNT(*) AS pages FROM dbstat GROUP BY name ORDER BY pages DESC, name"
+            ).fetchall()
+        except sqlite3.Error:
+            # dbstat is a compile-time option
+            stats["tables"] = []
+    stats["file_size"] = os.path.getsize(db_path)
+    return stats
+
+
+def run_maintenance(db_path=DB_NAME, force=False):
+    """
+    One maintenance pass; skipped (or cut short) while requests are being served unless `force`.
+
+    Returns:
+        dict: analyzed (bool) and pages_freed.
+    """
+    result = {"analyzed": False, "pages_freed": 0}
+    if not _maintenance_lock.acquire(blocking=False):
+        return result
+    try:
+        with closing(sqlite3.connect(db_path, timeout=5)) as conn:
+            if not (force or _idle()):
+                return result
+            if _analyze_pending.is_set():
+                _analyze_pending.clear()
+                analyze(conn)
+                result["analyzed"] = True
+            else:
+                optimize(conn)
+
+            while force or _idle():
+                freed = vacuum_step(conn)
+                if not freed:
+                    break
+                result["pages_freed"] += freed
+        if result["pages_freed"]:
+            logger.info(f"Incremental vacuum freed {result['pages_freed']} page(s)")
+        return result
+    finally:
+        _maintenance_lock.release()
+
+
+def _maintenance_loop(interval_seconds, stop):
+    while not stop.wait(interval_seconds):
+        try:
+            run_maintenance()
+        except sqlite3.Error as e:
+            # Typically a busy database; try again next pass
+            logger.warning(f"Database maintenance skipped: {str(e)}")
+
+
+def start_maintenance_scheduler(interval_seconds=MAINTENANCE_INTERVAL_SECONDS):
+    """
+    Run `run_maintenance()` every `interval_seconds` on a daemon thread; no-op when 0.
+
+    Returns:
+        threading.Event: Set it to stop the scheduler, or None when disabled.
+    """
+    if interval_seconds <= 0:
+        return None
+    stop = threading.Event()
+    threading.Thread(target=_maintenance_loop, args=(interval_seconds, stop), name="db-maintenance",
+                     daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="SQLite maintenance for the league database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show page counts and free pages")
+    subparsers.add_parser("analyze", help="Run ANALYZE now")
+    subparsers.add_parser("vacuum-step", help="Reclaim free pages now (incremental auto-vacuum only)")
+    subparsers.add_parser("enable-incremental-vacuum", help="Switch to auto_vacuum=INCREMENTAL (full VACUUM)")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats = database_stats()
+        logger.info(f"{stats['file_size']} bytes, {stats['page_count']} pages of {stats['page_size']}, "
+                    f"{stats['freelist_count']} free; auto_vacuum={stats['auto_vacuum']}, "
+                    f"analyzed={stats['analyzed']}")
+        for name, pages in stats["tables"][:20]:
+            logger.info(f"  {name}: {pages} pages")
+    elif args.command == "analyze":
+        with closing(sqlite3.connect(DB_NAME)) as conn:
+            analyze(conn)
+    elif args.command == "vacuum-step":
+        logger.info(f"Freed {run_maintenance(force=True)['pages_freed']} page(s)")
+    elif args.command == "enable-incremental-vacuum":
+        if not enable_incremental_vacuum():
+            logger.info("Incremental auto-vacuum is already enabled")
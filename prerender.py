@@ -0,0 +1,306 @@
+"""
+prerender.py
+------------
+Static copies of the public standings pages, served by Apache without Python.
+
+`render_pages()` requests /overall, /factionstats and /elo_ratings for every
+active or archived season (`?year=<year>`, plus `?year=All` where the page
+supports it, and the bare URL for the default year) through the Flask app as
+an anonymous visitor and writes the HTML to `prerendered/<page>/<key>.html`.
+The .htaccess rules serve those files to GET requests without a session
+cookie and fall through to WSGI for everything else, so logged-in users,
+filtered views and pages not built yet always get a live render.
+
+`refresh_pages()` keeps the files current: it reads the change log since
+the sequence number the files were built at (recorded in
+`prerendered/manifest.json`) and re-renders only the seasons that changed,
+plus the 'All' and default pages; a change it cannot tie to one season
+(users, system memberships, deletes, a new season) rebuilds everything, as
+does a change log behind the manifest (the database was recreated, e.g. by
+init_db.py). A game counts for its own season and for the season whose
+dates contain its played_on, which is how the pages select games. The
+server calls it on a background thread every PRERENDER_INTERVAL_SECONDS and
+straight after any write request, once `python prerender.py build` has
+created the directory. Reference data (factions, locations, systems) is not
+in the change log: run `build` again after editing it.
+
+Usage:
+    python prerender.py build
+    python prerender.py refresh
+    python prerender.py clean
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import closing
+
+from changes import current_seq
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+PRERENDER_DIR = "prerendered"
+
+# Seconds between change checks on the server thread; 0 disables it
+PRERENDER_INTERVAL_SECONDS = int(os.getenv("PRERENDER_INTERVAL_SECONDS", "30"))
+
+# Page -> (URL, whether it has an 'All' years view)
+PRERENDER_PAGES = {
+    "overall": ("/overall", False),
+    "factionstats": ("/factionstats", True),
+    "elo_ratings": ("/elo_ratings", False),
+}
+
+# File key of the bare URL (default year)
+DEFAULT_KEY = "index"
+
+# A game counts towards its season and, on the pages, towards the season whose
+# dates contain played_on; /league files games under the latest season
+GAME_YEARS_QUERY = """
+    SELECT s.year FROM games g JOIN seasons s ON s.season_id = g.season_id WHERE g.game_id = ?1
+    UNION
+    SELECT s.year FROM games g JOIN seasons s ON g.played_on >= s.start_date AND g.played_on <= s.end_date
+    WHERE g.game_id = ?1
+"""
+
+# Change log table -> query for the season years of a changed row, by primary key
+CHANGE_YEAR_QUERIES = {
+    "games": GAME_YEARS_QUERY,
+    "game_participants": GAME_YEARS_QUERY,
+    "player_ratings": "SELECT year FROM seasons WHERE season_id = ?",
+    "club_memberships": """
+        SELECT s.year FROM club_memberships cm JOIN seasons s ON s.season_id = cm.season_id
+        WHERE cm.membership_id = ?
+    """,
+    "league_settings": """
+        SELECT s.year FROM league_settings ls JOIN seasons s ON s.season_id = ls.season_id
+        WHERE ls.setting_id = ?
+    """,
+}
+
+_refresh_requested = threading.Event()
+_refresh_lock = threading.Lock()
+
+
+def _manifest_path(output_dir):
+    return Path(output_dir) / "manifest.json"
+
+
+def _read_manifest(output_dir):
+    path = _manifest_path(output_dir)
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def _season_years(cursor):
+    """(year, status) of every active or archived season; a change means every page's year list changed."""
+    return [list(row) for row in cursor.execute(
+        "SELECT year, status FROM seasons WHERE status IN ('active','archived') ORDER BY year"
+    ).fetchall()]
+
+
+def page_keys(years):
+    """
+    Files to render for the given season years.
+
+    Yields:
+        tuple: (page, key, url)
+    """
+    for page, (url, has_all) in PRERENDER_PAGES.items():
+        yield page, DEFAULT_KEY, url
+        for year in years:
+            yield page, str(year), f"{url}?year={year}"
+        if has_all:
+            yield page, "All", f"{url}?year=All"
+
+
+def render_pages(app, years, output_dir=PRERENDER_DIR):
+    """
+    Render the pages for `years` (plus the 'All' and default pages) as an anonymous visitor.
+
+    A page that does not render with status 200 has its old file removed, so
+    Apache falls through to the live page.
+
+    Returns:
+        int: Number of files written.
+    """
+    client = app.test_client()
+    written = 0
+    for page, key, url in page_keys(years):
+        path = Path(output_dir) / page / f"{key}.html"
+        response = client.get(url)
+        if response.status_code != 200:
+            logger.warning(f"Not pre-rendering {url}: status {response.status_code}")
+            path.unlink(missing_ok=True)
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(response.get_data())
+        os.replace(tmp_path, path)
+        written += 1
+    return written
+
+
+def changed_years(cursor, since_seq, until_seq):
+    """
+    Season years touched by the change log entries in (since_seq, until_seq].
+
+    Returns:
+        set: Years, or None when some change cannot be tied to a season
+             (or the entries were pruned) and every page must be rebuilt.
+    """
+    oldest = cursor.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+    if oldest is not None and oldest > since_seq + 1:
+        return None
+
+    years = set()
+    changes = cursor.execute("""
+        SELECT DISTINCT table_name, row_key, operation FROM change_log WHERE seq > ? AND seq <= ?
+    """, (since_seq, until_seq)).fetchall()
+    for table, row_key, operation in changes:
+        query = CHANGE_YEAR_QUERIES.get(table)
+        if query is None:
+            return None
+        # Ratings are keyed by season; other rows are looked up, so a delete cannot be traced
+        if operation == "delete" and table != "player_ratings":
+            return None
+        rows = cursor.execute(query, (json.loads(row_key)[0],)).fetchall()
+        if not rows:
+            return None
+        years.update(row[0] for row in rows)
+    return years
+
+
+def build_pages(app, output_dir=PRERENDER_DIR, db_path=DB_NAME):
+    """
+    Render every page for every season and record the change log position.
+
+    Returns:
+        int: Number of files written.
+    """
+    with _refresh_lock:
+        return _build(app, output_dir, db_path)
+
+
+def _build(app, output_dir, db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        cursor = conn.cursor()
+        seq = current_seq(cursor)
+        seasons = _season_years(cursor)
+
+    output = Path(output_dir)
+    # Drop pages of seasons that no longer exist
+    keep = {f"{key}.html" for _, key, _ in page_keys(year for year, _ in seasons)}
+    for path in output.glob("*/*.html"):
+        if path.name not in keep:
+            path.unlink()
+
+    written = render_pages(app, [year for year, _ in seasons], output_dir)
+    _write_manifest(output_dir, seq, seasons)
+    logger.info(f"Pre-rendered {written} page(s) at change {seq}")
+    return written
+
+
+def _write_manifest(output_dir, seq, seasons):
+    path = _manifest_path(output_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({
+        "seq": seq,
+        "seasons": seasons,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+    }))
+    os.replace(tmp_path, path)
+
+
+def refresh_pages(app, output_dir=PRERENDER_DIR, db_path=DB_NAME):
+    """
+    Re-render the pages affected by changes since the last build; no-op
+    when nothing changed or the pages were never built.
+
+    Returns:
+        int: Number of files written.
+    """
+    with _refresh_lock:
+        manifest = _read_manifest(output_dir)
+        if manifest is None:
+            return 0
+        with closing(sqlite3.connect(db_path)) as conn:
+            cursor = conn.cursor()
+            seq = current_seq(cursor)
+            seasons = _season_years(cursor)
+            if seq == manifest["seq"] and seasons == manifest["seasons"]:
+                return 0
+            years = None
+            # A lower seq means the database (and its change log) was recreated
+            if seq > manifest["seq"] and seasons == manifest["seasons"]:
+                years = changed_years(cursor, manifest["seq"], seq)
+
+        if years is None:
+            return _build(app, output_dir, db_path)
+
+        written = render_pages(app, sorted(years), output_dir)
+        _write_manifest(output_dir, seq, seasons)
+        logger.info(f"Pre-rendered {written} page(s) for {sorted(years) or 'the default view'} at change {seq}")
+        return written
+
+
+def request_refresh():
+    """Ask the refresh thread to check for changes now, e.g. after a write request."""
+    _refresh_requested.set()
+
+
+def _refresh_loop(app, interval_seconds):
+    while True:
+        _refresh_requested.wait(interval_seconds)
+        _refresh_requested.clear()
+        try:
+            refresh_pages(app)
+        except Exception as e:
+            logger.error(f"Pre-rendering failed: {str(e)}")
+
+
+def start_prerender_worker(app, interval_seconds=PRERENDER_INTERVAL_SECONDS, output_dir=PRERENDER_DIR):
+    """
+    Run `refresh_pages()` every `interval_seconds`, or sooner after `request_refresh()`,
+    on a daemon thread. No-op when 0 or when the pages have never been built.
+
+    Returns:
+        threading.Thread: The worker, or None when disabled.
+    """
+    if interval_seconds <= 0 or not Path(output_dir).is_dir():
+        return None
+    worker = threading.Thread(target=_refresh_loop, args=(app, interval_seconds), name="prerender",
+                              daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Pre-render the public standings pages to static HTML.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Render every page for every season")
+    subparsers.add_parser("refresh", help="Re-render the pages changed since the last build")
+    subparsers.add_parser("clean", help="Delete the pre-rendered pages (Apache falls back to WSGI)")
+    args = parser.parse_args()
+
+    if args.command == "clean":
+        shutil.rmtree(PRERENDER_DIR, ignore_errors=True)
+        logger.info(f"Removed {PRERENDER_DIR}/")
+    else:
+        from server import app
+        if args.command == "build":
+            build_pages(app)
+        elif not refresh_pages(app):
+            logger.info("Pre-rendered pages are up to date")
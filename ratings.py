@@ -9,6 +9,8 @@ import sqlite3
 import math
 import logging
 
+from compaction import RATING_SCALE, EXPECTED_SCORE_SCALE
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,8 +25,9 @@ def update_ratings_for_season(season_id, system_id, category, connection):
         connection (sqlite3.Connection): Active database connection.
 
     Side effects:
-        - Updates `ratings` table with current_rating and games_played.
-        - Inserts rating changes into `rating_history`.
+        - Updates `player_ratings` with each player's final rating.
+        - Inserts rating changes into `rating_changes`.
+        Ratings and expected scores are stored as integers (see compaction.py).
     """
     cursor = connection.cursor()
 
@@ -70,7 +73,7 @@ def update_ratings_for_season(season_id, system_id, category, connection):
 
     # Clear rating history for this season/system
     cursor.execute("""
-        DELETE FROM rating_history
+        DELETE FROM rating_changes
         WHERE game_id IN (SELECT game_id FROM games WHERE season_id = ? AND system_id = ?)
     """, (season_id, system_id))
 
@@ -99,38 +102,28 @@ def update_ratings_for_season(season_id, system_id, category, connection):
         new_r1 = r1 + k_factor * (act1 - exp1)
         new_r2 = r2 + k_factor * (act2 - exp2)
 
-        # Insert into rating_history
-        cursor.execute("""
-            INSERT INTO rating_history (game_id, player_id, system_id,
-                                        old_rating, new_rating, k_factor_used,
-                                        expected_score, actual_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (game_id, p1_id, system_id, r1, new_r1, k_factor, exp1, act1))
-
-        cursor.execute("""
-            INSERT INTO rating_history (game_id, player_id, system_id,
-                                        old_rating, new_rating, k_factor_used,
-                                        expected_score, actual_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (game_id, p2_id, system_id, r2, new_r2, k_factor, exp2, act2))
+        # Insert into rating_changes; system and actual score come from the game
+        cursor.executemany("""
+            INSERT INTO rating_changes (game_id, player_id, old_rating, new_rating,
+                                        k_factor_used, expected_score)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (game_id, p1_id, round(r1 * RATING_SCALE), round(new_r1 * RATING_SCALE),
+             k_factor, round(exp1 * EXPECTED_SCORE_SCALE)),
+            (game_id, p2_id, round(r2 * RATING_SCALE), round(new_r2 * RATING_SCALE),
+             k_factor, round(exp2 * EXPECTED_SCORE_SCALE)),
+        ])
 
         current_ratings[p1_id] = new_r1
         current_ratings[p2_id] = new_r2
 
-    # Update ratings table
+    # Update player_ratings
     for player_id, rating in current_ratings.items():
-        games_played = cursor.execute("""
-            SELECT COUNT(*)
-            FROM game_participants gp
-            JOIN games g ON gp.game_id = g.game_id
-            WHERE gp.player_id = ? AND g.season_id = ? AND g.system_id = ?
-        """, (player_id, season_id, system_id)).fetchone()[0]
-
         cursor.execute("""
-            INSERT OR REPLACE INTO ratings (season_id, system_id, player_id,
-                                            current_rating, last_updated)
+            INSERT OR REPLACE INTO player_ratings (season_id, system_id, player_id,
+                                                   rating, last_updated)
             VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (season_id, system_id, player_id, rating))
+        """, (season_id, system_id, player_id, round(rating * RATING_SCALE)))
 
 
 def process_ratings(season_id, system_id):
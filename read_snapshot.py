@@ -0,0 +1,89 @@
+"""
+read_snapshot.py
+----------------
+Optional in-memory copy of GPTLeague.db for read-only routes.
+
+With READ_SNAPSHOT=1 each worker process loads the database into a named
+shared-cache in-memory database with the online backup API, and
+`read_connection()` returns connections to that copy, so page reads run at
+memory speed and never wait on a writer's lock on the file. Writes keep
+using `sqlite3.connect('GPTLeague.db')` as before.
+
+Before handing out a connection, `read_connection()` asks a long-lived file
+connection for PRAGMA data_version, which changes whenever another
+connection has committed to the file; while a writer holds the file lock
+to commit, the current copy is used. When it has changed, a new copy is
+loaded under a new name and swapped in; requests still reading the old copy
+keep it until they close their connections. A redirect after a write
+therefore always reads the new data. Without READ_SNAPSHOT,
+`read_connection()` is a plain file connection.
+
+Cold storage files are still attached from disk by `attach_archives()`.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import itertools
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "GPTLeague.db"
+
+READ_SNAPSHOT = os.getenv("READ_SNAPSHOT", "0") == "1"
+
+_lock = threading.Lock()
+_generations = itertools.count(1)
+_monitor = None        # file connection only used for PRAGMA data_version
+_holder = None         # keeps the current in-memory copy alive
+_snapshot_uri = None
+_data_version = None
+
+
+def _load_snapshot(db_path):
+    """Copy `db_path` into a new in-memory database. Returns (uri, holding connection)."""
+    uri = f"file:gptleague_{os.getpid()}_{next(_generations)}?mode=memory&cache=shared"
+    holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    with closing(sqlite3.connect(db_path)) as source:
+        source.backup(holder)
+    return uri, holder
+
+
+def current_snapshot(db_path=DB_NAME):
+    """
+    URI of an in-memory copy that includes every commit made to `db_path`
+    so far, reloading it first if the file changed.
+    """
+    global _monitor, _holder, _snapshot_uri, _data_version
+    with _lock:
+        if _monitor is None:
+            _monitor = sqlite3.connect(db_path, timeout=0, check_same_thread=False)
+        try:
+            # Read before copying, so a commit during the copy triggers another reload
+            version = _monitor.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.OperationalError:
+            # A writer is committing; until it finishes the current copy is the latest data
+            if _snapshot_uri is not None:
+                return _snapshot_uri
+            version = None
+        if _snapshot_uri is None or version != _data_version:
+            started = time.monotonic()
+            uri, holder = _load_snapshot(db_path)
+            if _holder is not None:
+                _holder.close()
+            _snapshot_uri, _holder, _data_version = uri, holder, version
+            logger.debug(f"Read snapshot reloaded in {(time.monotonic() - started) * 1000:.1f}ms")
+        return _snapshot_uri
+
+
+def read_connection(db_path=DB_NAME):
+    """
+    Connection for a read-only route: the in-memory copy with READ_SNAPSHOT,
+    otherwise `db_path` itself. Do not write through it.
+    """
+    if not READ_SNAPSHOT:
+        return sqlite3.connect(db_path)
+    return sqlite3.connect(current_snapshot(db_path), uri=True)
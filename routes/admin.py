@@ -2,14 +2,29 @@
 import sqlite3
 import csv
 import io
+import json
 import string
 import secrets
 import zipfile
+import tempfile
 import shutil
+import logging
+from pathlib import Path
+from contextlib import closing
 from datetime import datetime
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for, send_file
+from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, session, url_for, send_file
 from helpers import is_admin, login_required, CURRENT_YEAR, season, hash_password, is_valid_email
-from ratings import update_ratings_for_season
+from batch_import import (REQUIRED_COLUMNS, load_lookups, validate_row, validate_rows, row_errors, import_games,
+                          hash_passwords, import_users)
+from staging import (create_upload, stage_csv, get_upload, preview_page, error_rows, warning_count,
+                     iter_rows, finish_upload, PREVIEW_PAGE_SIZE, STAGED_CHUNK_SIZE)
+from jobs import submit_job, get_job, job_log_lines, recent_jobs
+from changes import CHANGE_FORMATS, changes_stream, current_seq
+from maintenance import analyze, database_stats, enable_incremental_vacuum, request_analyze, run_maintenance
+from exports import (csv_zip_stream, export_tables, snapshot_database, snapshot_archives, snapshot_zip_stream,
+                     write_sql_dump, archive_dump_name)
+
+logger = logging.getLogger(__name__)
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -403,27 +418,6 @@ def league_settings():
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
-        # Migrate from old schema if needed
-        try:
-            cursor.execute("SELECT setting_key FROM league_settings LIMIT 1")
-        except:
-            # Old table doesn't exist or has wrong schema, drop and recreate
-            cursor.execute("DROP TABLE IF EXISTS league_settings")
-        
-        # Create settings table with new schema
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS league_settings (
-                setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                season_id INTEGER,
-                setting_key TEXT NOT NULL,
-                setting_value TEXT NOT NULL,
-                description TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(season_id, setting_key),
-                FOREIGN KEY(season_id) REFERENCES seasons(season_id)
-            )
-        """)
-
         # Get list of seasons
         seasons = cursor.execute("SELECT season_id, year FROM seasons WHERE status IN ('active','archived') ORDER BY year DESC").fetchall()
         
@@ -510,9 +504,6 @@ def batch_upload():
             "SELECT location_id, name FROM locations ORDER BY name"
         ).fetchall()
 
-    preview_data = None
-    errors = []
-
     if request.method == "POST":
         if "file" not in request.files:
             flash("No file selected", "warning")
@@ -528,96 +519,53 @@ def batch_upload():
             return redirect(url_for("admin.batch_upload"))
 
         try:
-            stream = io.StringIO(file.stream.read().decode("utf-8"), newline=None)
-            csv_data = list(csv.DictReader(stream))
-            
-            if not csv_data:
-                flash("CSV file is empty", "warning")
-                return redirect(url_for("admin.batch_upload"))
-
-            # Required columns
-            if csv_data and csv_data[0]:
-                required = {"system_name", "date", "player_one", "player_two", "p1_faction", "p2_faction", "result", "location", "points_band"}
-                if not required.issubset(set(csv_data[0].keys())):
-                    flash(f"CSV missing required columns. Required: {', '.join(required)}", "warning")
-                    return redirect(url_for("admin.batch_upload"))
-
-            preview_data = []
-            year = CURRENT_YEAR()
-
-            for idx, row in enumerate(csv_data, 1):
-                preview_row = {"row": idx, "errors": []}
-
-                # Parse and validate each field
-                try:
-                    # System
-                    system_name = row.get("system_name", "").strip()
-                    system = next((s for s in systems if s["system_name"] == system_name), None)
-                    if not system:
-                        preview_row["errors"].append(f"System '{system_name}' not found")
-                    else:
-                        preview_row["system_name"] = system_name
-                        preview_row["system_id"] = system["system_id"]
-
-                    # Date
-                    date_str = row.get("date", "").strip()
-                    try:
-                        played_on = datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d 12:00:00")
-                        preview_row["date"] = date_str
-                    except ValueError:
-                        preview_row["errors"].append(f"Invalid date format: {date_str} (use YYYY-MM-DD)")
-
-                    # Players
-                    p1_name = row.get("player_one", "").strip()
-                    p2_name = row.get("player_two", "").strip()
-                    if p1_name == p2_name:
-                        preview_row["errors"].append("Player 1 and Player 2 cannot be the same")
-                    preview_row["player_one"] = p1_name
-                    preview_row["player_two"] = p2_name
-
-                    # Factions
-                    preview_row["p1_faction"] = row.get("p1_faction", "").strip()
-                    preview_row["p2_faction"] = row.get("p2_faction", "").strip()
-
-                    # Result
-                    result = row.get("result", "").strip()
-                    if result not in ["Player 1 Wins", "Player 2 Wins", "Drawn"]:
-                        preview_row["errors"].append(f"Invalid result: {result} (must be 'Player 1 Wins', 'Player 2 Wins', or 'Drawn')")
-                    preview_row["result"] = result
-
-                    # Location
-                    location_name = row.get("location", "").strip()
-                    location = next((l for l in locations if l["name"] == location_name), None)
-                    if not location:
-                        preview_row["errors"].append(f"Location '{location_name}' not found")
-                    else:
-                        preview_row["location"] = location_name
-                        preview_row["location_id"] = location["location_id"]
-
-                    # Points band
-                    points_band = row.get("points_band", "").strip()
-                    preview_row["points_band"] = points_band
-
-                    # Notes (optional)
-                    preview_row["notes"] = row.get("notes", "").strip()
-
-                except Exception as e:
-                    preview_row["errors"].append(str(e))
-
-                preview_data.append(preview_row)
-
-            # Store preview data in session for confirmation
-            session["batch_upload_preview"] = preview_data
-            session["batch_upload_csv_data"] = csv_data
+            # Parse, validate and stage the file chunk by chunk straight from the
+            # request stream; the session only carries the upload id
+            stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+            with sqlite3.connect("GPTLeague.db") as conn:
+                lookups = load_lookups(conn.cursor())
+                session["batch_upload_id"] = stage_csv(
+                    conn, "games", user_id, stream, REQUIRED_COLUMNS,
+                    lambda rows, first_row: validate_rows(rows, lookups, first_row)
+                )
             session.modified = True
-            
+        except ValueError as e:
+            flash(str(e), "warning")
         except Exception as e:
             flash(f"Error reading CSV: {str(e)}", "danger")
+        return redirect(url_for("admin.batch_upload"))
+
+    # Show one page of the pending upload, if any
+    upload = None
+    preview_data = None
+    upload_errors = []
+    page = max(request.args.get("page", 1, type=int), 1)
+    pages = 1
+    with sqlite3.connect("GPTLeague.db") as conn:
+        cursor = conn.cursor()
+        upload_id = session.get("batch_upload_id")
+        if request.args.get("cancel") and upload_id:
+            finish_upload(conn, upload_id, "cancelled")
+            session.pop("batch_upload_id", None)
             return redirect(url_for("admin.batch_upload"))
 
+        staged = get_upload(cursor, upload_id, "games", user_id)
+        if staged:
+            _, row_count, error_count = staged
+            upload = {"rows": row_count, "errors": error_count, "valid": row_count - error_count,
+                      "duplicates": warning_count(cursor, upload_id)}
+            pages = max((row_count + PREVIEW_PAGE_SIZE - 1) // PREVIEW_PAGE_SIZE, 1)
+            page = min(page, pages)
+            preview_data = preview_page(cursor, upload_id, page)
+            upload_errors = error_rows(cursor, upload_id)
+
     return render_template(
         "batch_upload.html",
         preview_data=preview_data,
+        upload=upload,
+        upload_errors=upload_errors,
+        page=page,
+        pages=pages,
         systems=systems,
         locations=locations
     )
@@ -626,139 +574,84 @@ def batch_upload():
 @admin_bp.route("/batch_upload_confirm", methods=["POST"])
 @login_required
 def batch_upload_confirm():
-    """Confirm and insert batch upload results."""
+    """Queue the import of a staged batch upload as a background job."""
     user_id = session["user_id"]
     if not is_admin(user_id):
         flash("You do not have permission to perform this action.", "danger")
         return redirect("/")
 
     try:
-        # Get data from session
-        csv_data = session.get("batch_upload_csv_data", [])
-        if not csv_data:
-            flash("No preview data found. Please upload a file again.", "warning")
-            return redirect(url_for("admin.batch_upload"))
-
         with sqlite3.connect("GPTLeague.db") as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
+            upload_id = session.get("batch_upload_id")
+            staged = get_upload(cursor, upload_id, "games", user_id)
+            if not staged:
+                flash("No preview data found. Please upload a file again.", "warning")
+                return redirect(url_for("admin.batch_upload"))
+
             year = CURRENT_YEAR()
             season_row = cursor.execute(
                 "SELECT season_id FROM seasons WHERE year = ?", (year,)
             ).fetchone()
             season_id = season_row["season_id"] if season_row else 1
 
-            # Get systems, locations, factions for lookups
-            systems = cursor.execute(
-                "SELECT system_id, system_name, category FROM systems"
-            ).fetchall()
-            locations = cursor.execute(
-                "SELECT location_id, name FROM locations"
-            ).fetchall()
-
-            games_added = 0
-            errors = []
-
-            for idx, row in enumerate(csv_data, 1):
-                try:
-                    # Get system
-                    system = next((s for s in systems if s["system_name"] == row["system_name"].strip()), None)
-                    if not system:
-                        errors.append(f"Row {idx}: System not found")
-                        continue
-
-                    # Get players by username or full_name
-                    player_one = cursor.execute(
-                        "SELECT user_id FROM users WHERE user_name = ? OR full_name = ?",
-                        (row["player_one"].strip(), row["player_one"].strip())
-                    ).fetchone()
-                    player_two = cursor.execute(
-                        "SELECT user_id FROM users WHERE user_name = ? OR full_name = ?",
-                        (row["player_two"].strip(), row["player_two"].strip())
-                    ).fetchone()
-
-                    if not player_one or not player_two:
-                        errors.append(f"Row {idx}: Player not found")
-                        continue
-
-                    # Get factions
-                    p1_faction = cursor.execute(
-                        "SELECT faction_id FROM factions WHERE faction_name = ? AND system_id = ?",
-                        (row["p1_faction"].strip(), system["system_id"])
-                    ).fetchone()
-                    p2_faction = cursor.execute(
-                        "SELECT faction_id FROM factions WHERE faction_name = ? AND system_id = ?",
-                        (row["p2_faction"].strip(), system["system_id"])
-                    ).fetchone()
-
-                    if not p1_faction or not p2_faction:
-                        errors.append(f"Row {idx}: Faction not found")
-                        continue
-
-                    # Get location
-                    location = next((l for l in locations if l["name"] == row["location"].strip()), None)
-                    if not location:
-                        errors.append(f"Row {idx}: Location not found")
-                        continue
-
-                    # Parse date
-                    played_on = datetime.strptime(row["date"].strip(), "%Y-%m-%d").strftime("%Y-%m-%d 12:00:00")
-
-                    # Create game entry
-                    conn.execute("BEGIN")
-                    cursor.execute(
-                        "INSERT INTO games (season_id, system_id, played_on, location_id, points_band, notes) VALUES (?,?,?,?,?,?)",
-                        (season_id, system["system_id"], played_on, location["location_id"], 
-                         row["points_band"].strip(), row.get("notes", "").strip())
-                    )
-                    game_id = cursor.lastrowid
-
-                    # Map result
-                    result = row["result"].strip()
-                    if result == "Player 1 Wins":
-                        p1_result, p2_result = "win", "loss"
-                    elif result == "Player 2 Wins":
-                        p1_result, p2_result = "loss", "win"
-                    else:  # Drawn
-                        p1_result, p2_result = "draw", "draw"
-
-                    # Add participants
-                    cursor.execute(
-                        "INSERT INTO game_participants (game_id, player_id, faction_id, result, painting_battle_ready) VALUES (?,?,?,?,?)",
-                        (game_id, player_one["user_id"], p1_faction["faction_id"], p1_result, 0)
-                    )
-                    cursor.execute(
-                        "INSERT INTO game_participants (game_id, player_id, faction_id, result, painting_battle_ready) VALUES (?,?,?,?,?)",
-                        (game_id, player_two["user_id"], p2_faction["faction_id"], p2_result, 0)
-                    )
-
-                    # Update ratings
-                    update_ratings_for_season(season_id, system["system_id"], system["category"], conn)
-                    conn.commit()
-                    games_added += 1
-
-                except Exception as e:
-                    conn.rollback()
-                    errors.append(f"Row {idx}: {str(e)}")
-                    continue
-
-            # Clear session data
-            session.pop("batch_upload_preview", None)
-            session.pop("batch_upload_csv_data", None)
-            session.modified = True
-
-            flash(f"✅ Successfully added {games_added} games", "success")
-            if errors:
-                error_msg = "; ".join(errors[:5])  # Show first 5 errors
-                if len(errors) > 5:
-                    error_msg += f"; ... and {len(errors) - 5} more"
-                flash(f"⚠️ Some rows had errors: {error_msg}", "warning")
+        job_id = submit_job(
+            "game_import", f"Import {staged['row_count']} uploaded game rows", user_id,
+            _game_import_job, upload_id, staged["row_count"], season_id,
+            include_duplicates=bool(request.form.get("include_duplicates"))
+        )
 
+        # Clear session data
+        session.pop("batch_upload_id", None)
+        session.modified = True
     except Exception as e:
         flash(f"Error processing batch upload: {str(e)}", "danger")
+        return redirect(url_for("admin.batch_upload"))
 
-    return redirect(url_for("admin.batch_upload"))
+    return redirect(url_for("admin.job_status", job_id=job_id))
+
+
+def _game_import_job(job, upload_id, row_count, season_id, include_duplicates=False):
+    """Background job: re-validate a staged game upload and import its valid rows."""
+    job.progress(0, row_count, "Validating rows")
+    with sqlite3.connect("GPTLeague.db") as conn:
+        # Stream the staged rows, re-validating against current data,
+        # and insert all valid rows at once
+        lookups = load_lookups(conn.cursor())
+        errors = []
+        duplicates = []
+
+        def validated_rows():
+            for row_number, data, _ in iter_rows(conn.cursor(), upload_id):
+                preview_row = validate_row(row_number, data, lookups)
+                errors.extend(row_errors([preview_row]))
+                if not preview_row["errors"] and preview_row["warnings"]:
+                    duplicates.append(f"Row {row_number}: {preview_row['warnings'][0]}")
+                if row_number % STAGED_CHUNK_SIZE == 0:
+                    job.progress(row_number)
+                yield preview_row
+
+        games_added = import_games(conn, validated_rows(), season_id,
+                                   skip_duplicates=not include_duplicates)
+        finish_upload(conn, upload_id)
+    request_analyze()
+
+    job.progress(row_count)
+    for error in errors[:100]:
+        job.log(error, "warning")
+    if len(errors) > 100:
+        job.log(f"... and {len(errors) - 100} more errors", "warning")
+    for duplicate in duplicates[:100]:
+        job.log(duplicate, "info" if include_duplicates else "warning")
+
+    message = f"Successfully added {games_added} games"
+    if errors:
+        message += f"; {len(errors)} row error(s) skipped"
+    if duplicates and not include_duplicates:
+        message += f"; {len(duplicates)} possible duplicate(s) skipped"
+    return message
 
 
 def generate_temp_password(length=12):
@@ -833,6 +726,7 @@ def batch_upload_users():
                     preview_row["errors"].append(f"Username '{username}' already exists")
                 else:
                     preview_row["username"] = username
+                    existing_usernames.add(username)
 
                 # Validate email
                 email = row.get("email", "").strip()
@@ -844,6 +738,7 @@ def batch_upload_users():
                     preview_row["errors"].append(f"Email '{email}' already exists")
                 else:
                     preview_row["email"] = email
+                    existing_emails.add(email)
 
                 # Validate full name
                 full_name = row.get("full_name", "").strip()
@@ -856,9 +751,9 @@ def batch_upload_users():
 
                 preview_data.append(preview_row)
 
-            # Store preview data in session for confirmation
-            session["batch_upload_users_preview"] = preview_data
-            session["batch_upload_users_csv_data"] = csv_data
+            # Stage the upload for confirmation; the session only carries the id
+            with sqlite3.connect("GPTLeague.db") as conn:
+                session["batch_upload_users_id"] = create_upload(conn, "users", user_id, csv_data, preview_data)
             session.modified = True
             
         except Exception as e:
@@ -871,24 +766,22 @@ def batch_upload_users():
 @admin_bp.route("/batch_upload_users_confirm", methods=["POST"])
 @login_required
 def batch_upload_users_confirm():
-    """Confirm and insert batch uploaded users."""
+    """Queue the creation of staged batch uploaded users as a background job."""
     user_id = session["user_id"]
     if not is_admin(user_id):
         flash("You do not have permission to perform this action.", "danger")
         return redirect("/")
 
     try:
-        # Get data from session
-        csv_data = session.get("batch_upload_users_csv_data", [])
-        preview_data = session.get("batch_upload_users_preview", [])
-        
-        if not csv_data or not preview_data:
-            flash("No preview data found. Please upload a file again.", "warning")
-            return redirect(url_for("admin.batch_upload_users"))
-
         with sqlite3.connect("GPTLeague.db") as conn:
             cursor = conn.cursor()
 
+            upload_id = session.get("batch_upload_users_id")
+            staged = get_upload(cursor, upload_id, "users", user_id)
+            if not staged:
+                flash("No preview data found. Please upload a file again.", "warning")
+                return redirect(url_for("admin.batch_upload_users"))
+
             # Get current season
             year = CURRENT_YEAR()
             season_row = cursor.execute(
@@ -896,76 +789,87 @@ def batch_upload_users_confirm():
             ).fetchone()
             season_id = season_row[0] if season_row else 1
 
-            users_added = 0
-            temp_passwords = []
+        job_id = submit_job(
+            "user_import", f"Create {staged[1] - staged[2]} uploaded user(s)", user_id,
+            _user_import_job, upload_id, staged[1], season_id
+        )
 
-            for idx, (preview_row, csv_row) in enumerate(zip(preview_data, csv_data)):
-                if preview_row.get("errors"):
-                    continue  # Skip rows with errors
+        # Clear session data
+        session.pop("batch_upload_users_id", None)
+        session.modified = True
+    except Exception as e:
+        flash(f"Error processing batch upload: {str(e)}", "danger")
+        return redirect(url_for("admin.batch_upload_users"))
 
-                try:
-                    username = preview_row.get("username")
-                    email = preview_row.get("email")
-                    full_name = preview_row.get("full_name")
-                    
-                    # Generate temporary password
-                    temp_password = generate_temp_password()
-                    password_hash = hash_password(temp_password)
-                    
-                    # Insert user
-                    cursor.execute(
-                        "INSERT INTO users (user_name, email, full_name, password_hash, is_active) VALUES (?,?,?,?,?)",
-                        (username, email, full_name, password_hash, 1)
-                    )
-                    new_user_id = cursor.lastrowid
-                    
-                    # Add as player role
-                    cursor.execute(
-                        "INSERT INTO user_roles (user_id, role) VALUES (?,?)",
-                        (new_user_id, 'player')
-                    )
-                    
-                    # Auto-enroll in current season
-                    cursor.execute(
-                        "INSERT INTO club_memberships (season_id, user_id, is_member) VALUES (?,?,?)",
-                        (season_id, new_user_id, 1)
-                    )
-                    
-                    # Store temp password for display
-                    temp_passwords.append({
-                        "username": username,
-                        "email": email,
-                        "full_name": full_name,
-                        "temp_password": temp_password
-                    })
-                    
-                    users_added += 1
+    return redirect(url_for("admin.job_status", job_id=job_id))
 
-                except Exception as e:
-                    flash(f"Row {idx + 1}: {str(e)}", "warning")
-                    conn.rollback()
-                    continue
 
-            conn.commit()
+def _user_import_job(job, upload_id, row_count, season_id):
+    """
+    Background job: create the valid users of a staged upload.
 
-            # Clear session data
-            session.pop("batch_upload_users_preview", None)
-            session.pop("batch_upload_users_csv_data", None)
-            session.modified = True
+    The temporary passwords are written to the job's output file, which
+    `batch_upload_users_complete` shows once and then deletes.
+    """
+    job.progress(0, row_count, "Checking rows")
+    with sqlite3.connect("GPTLeague.db") as conn:
+        cursor = conn.cursor()
 
-            if users_added > 0:
-                flash(f"✅ Successfully added {users_added} user(s)", "success")
-                # Store temp passwords in session to display
-                session["batch_upload_temp_passwords"] = temp_passwords
-                session.modified = True
-                return redirect(url_for("admin.batch_upload_users_complete"))
-            else:
-                flash("No valid users to add", "warning")
-                return redirect(url_for("admin.batch_upload_users"))
+        # Re-check duplicates against the current users and earlier rows
+        existing_usernames = set(
+            row[0] for row in cursor.execute("SELECT user_name FROM users").fetchall()
+        )
+        existing_emails = set(
+            row[0] for row in cursor.execute("SELECT email FROM users").fetchall()
+        )
 
-    except Exception as e:
-        flash(f"Error processing batch upload: {str(e)}", "danger")
-        return redirect(url_for("admin.batch_upload_users"))
+        users = []
+        for row_number, csv_row, preview_row in iter_rows(conn.cursor(), upload_id):
+            if preview_row.get("errors"):
+                continue  # Skip rows with errors
+
+            username = preview_row.get("username")
+            email = preview_row.get("email")
+            if username in existing_usernames:
+                job.log(f"Row {row_number}: Username '{username}' already exists", "warning")
+                continue
+            if email in existing_emails:
+                job.log(f"Row {row_number}: Email '{email}' already exists", "warning")
+                continue
+            existing_usernames.add(username)
+            existing_emails.add(email)
+
+            users.append({
+                "username": username,
+                "email": email,
+                "full_name": preview_row.get("full_name"),
+                "temp_password": generate_temp_password()
+            })
+
+        # Hash the temporary passwords in parallel
+        job.progress(0, len(users), "Hashing temporary passwords")
+        for done, (user, password_hash) in enumerate(
+                zip(users, hash_passwords(user["temp_password"] for user in users)), 1):
+            user["password_hash"] = password_hash
+            if done % 10 == 0:
+                job.progress(done)
+
+        job.progress(len(users), message="Creating users")
+        users_added = import_users(conn, users, season_id)
+        finish_upload(conn, upload_id)
+    request_analyze()
+
+    if not users_added:
+        return "No valid users to add"
+
+    # Store temp passwords for display
+    temp_passwords = [
+        {key: user[key] for key in ("username", "email", "full_name", "temp_password")}
+        for user in users
+    ]
+    with open(job.output_path("temp_passwords.json"), "w", encoding="utf-8") as f:
+        json.dump(temp_passwords, f)
+    return f"Successfully added {users_added} user(s)"
 
 
 @admin_bp.route("/batch_upload_users_complete")
@@ -977,8 +881,15 @@ def batch_upload_users_complete():
         flash("You do not have permission to access this page.", "danger")
         return redirect("/")
 
-    temp_passwords = session.pop("batch_upload_temp_passwords", [])
-    
+    job = get_job(request.args.get("job_id", type=int))
+    temp_passwords = []
+    if job and job["kind"] == "user_import" and job["created_by"] == user_id and job["result_file"]:
+        result_file = Path(job["result_file"])
+        if result_file.exists():
+            temp_passwords = json.loads(result_file.read_text(encoding="utf-8"))
+            # Shown once only
+            result_file.unlink()
+
     if not temp_passwords:
         flash("No temp passwords to display", "warning")
         return redirect(url_for("admin.batch_upload_users"))
@@ -989,67 +900,112 @@ def batch_upload_users_complete():
 @admin_bp.route("/export_data", methods=["GET", "POST"])
 @login_required
 def export_data():
-    """Export database as SQL dump or CSV files in a ZIP archive."""
+    """Export the database as a snapshot, SQL dump (background job) or CSV files in a ZIP archive."""
     user_id = session["user_id"]
     if not is_admin(user_id):
         flash("You do not have permission to access this page.", "danger")
         return redirect("/")
-    
+
     if request.method == "GET":
-        return render_template("export_data.html")
-    
-    # POST - perform export
+        with sqlite3.connect("GPTLeague.db") as conn:
+            change_seq = current_seq(conn.cursor())
+        return render_template("export_data.html", change_seq=change_seq)
+
+    # POST - the SQL dump is queued and downloaded from the job page; the others stream directly
     export_format = request.form.get("export_format")
-    
-    if export_format == "sql":
-        return _export_sql_dump(user_id)
+
+    if export_format == "snapshot":
+        return _export_snapshot(user_id, bool(request.form.get("include_sql")))
+    elif export_format == "sql":
+        job_id = submit_job("export_sql", "SQL dump export", user_id, _export_sql_dump, user_id)
     elif export_format == "csv":
         return _export_csv_zip(user_id)
     else:
         flash("Invalid export format", "danger")
         return redirect(url_for("admin.export_data"))
 
+    return redirect(url_for("admin.job_status", job_id=job_id))
+
+
+def _export_sql_dump(job, user_id):
+    """Background job: export a snapshot of the database and its cold storage files as SQL dumps in a ZIP file."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"dtc_league_backup_sql_{timestamp}.zip"
+    dump_name = f"dtc_league_dump_{timestamp}.sql"
+    snapshot_path = job.output_path(f"snapshot_{timestamp}.db")
 
-def _export_sql_dump(user_id):
-    """Export entire database as SQL dump in a ZIP file."""
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"dtc_league_backup_sql_{timestamp}.zip"
-        
-        # Create in-memory zip file
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Read SQLite database
-            with sqlite3.connect("GPTLeague.db") as conn:
-                cursor = conn.cursor()
-                
-                # Get SQL dump from sqlite3
-                sql_dump = "\n".join(conn.iterdump())
-                
-                # Add schema info
+        with tempfile.TemporaryDirectory(prefix="export_") as tmp:
+            # Dump from a consistent snapshot rather than the live database
+            job.progress(0, message="Taking snapshot")
+            snapshot_database(snapshot_path)
+            archives = snapshot_archives(snapshot_path, tmp)
+            dumps = [(dump_name, snapshot_path)]
+            dumps += [(archive_dump_name(file_name), archive_snapshot) for file_name, archive_snapshot in archives]
+
+            rows = []
+            for _, path in dumps:
+                with closing(sqlite3.connect(path)) as conn:
+                    cursor = conn.cursor()
+                    rows.append(sum(cursor.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                                    for table in export_tables(cursor)))
+            total = sum(rows)
+            job.progress(0, total, "Dumping database")
+
+            with zipfile.ZipFile(job.output_path(zip_filename), 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                # Add schema info, then stream each dump into the archive
                 schema_info = f"""-- DTC Warhammer 40k League Database Backup
 -- Exported: {datetime.now().isoformat()}
 -- Format: SQL (SQLite)
 -- Use: sqlite3 new_database.db < backup.sql
 
-{sql_dump}
 """
-                
-                # Add to zip
-                zip_file.writestr(f"dtc_league_dump_{timestamp}.sql", schema_info)
-                
+                done = 0
+                for (entry_name, path), dump_rows in zip(dumps, rows):
+                    for count in write_sql_dump(zip_file, entry_name, path, schema_info):
+                        job.progress(min(done + count, total))
+                    done += dump_rows
+
                 # Also add a README
-                readme = f"""DTC Warhammer 40k League - Database Backup
+                zip_file.writestr("README.txt", _sql_readme(dump_name, [file_name for file_name, _ in archives]))
+    finally:
+        Path(snapshot_path).unlink(missing_ok=True)
+
+    job.progress(total)
+    logger.info(f"Database SQL backup created by admin {user_id}")
+    return f"Export ready: {zip_filename}"
+
+
+def _archives_readme(archive_files, dumped=False):
+    """README section for the seasons in cold storage (archive.py), empty when there are none."""
+    if not archive_files:
+        return ""
+    if dumped:
+        steps = "\n".join(f"- sqlite3 {name} < {archive_dump_name(name)}" for name in archive_files)
+        return f"""
+SEASONS IN COLD STORAGE:
+Games of archived seasons are kept in separate files. Recreate each one beside GPTLeague.db:
+{steps}
+"""
+    return f"""
+SEASONS IN COLD STORAGE:
+Games of archived seasons are kept in separate files. Restore them with the database, at the
+same paths beside GPTLeague.db:
+{chr(10).join([f"- {name}" for name in archive_files])}
+"""
+
+
+def _sql_readme(dump_name, archive_files=()):
+    return f"""DTC Warhammer 40k League - Database Backup
 
 Backup Date: {datetime.now().isoformat()}
 Format: SQL Dump (SQLite)
 
 RESTORE INSTRUCTIONS:
 1. Create a new SQLite database: sqlite3 GPTLeague.db
-2. Import the dump: sqlite3 GPTLeague.db < dtc_league_dump_{timestamp}.sql
+2. Import the dump: sqlite3 GPTLeague.db < {dump_name}
 3. Verify the import was successful
-
+{_archives_readme(archive_files, dumped=True)}
 CONTENTS:
 - Complete database schema
 - All user data
@@ -1058,87 +1014,62 @@ CONTENTS:
 
 Backup size represents a point-in-time snapshot.
 """
-                zip_file.writestr("README.txt", readme)
-        
-        zip_buffer.seek(0)
-        
-        logger.info(f"Database SQL backup created by admin {user_id}")
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
-    
-    except Exception as e:
-        logger.error(f"Error exporting SQL dump: {str(e)}")
-        flash(f"Error creating SQL dump: {str(e)}", "danger")
-        return redirect(url_for("admin.export_data"))
+
+
+def _export_snapshot(user_id, include_sql):
+    """Stream a consistent snapshot of the database and cold storage files, and optionally SQL dumps, in a ZIP archive."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"dtc_league_backup_snapshot_{timestamp}.zip"
+    dump_name = f"dtc_league_dump_{timestamp}.sql" if include_sql else None
+
+    def readme(entries, archive_files):
+        text = f"""DTC Warhammer 40k League - Database Backup
+
+Backup Date: {datetime.now().isoformat()}
+Format: SQLite database snapshot
+
+RESTORE INSTRUCTIONS:
+1. Stop the server
+2. Replace GPTLeague.db with GPTLeague.db from this archive{" and copy archives/ beside it" if archive_files else ""}
+3. Start the server
+{_archives_readme(archive_files)}
+CONTENTS:
+{chr(10).join([f"- {name}" for name in entries])}
+
+The database files are consistent point-in-time copies taken with the SQLite online backup API.
+"""
+        if dump_name:
+            text += f"\nThe SQL dump was generated from the same snapshot: sqlite3 new_database.db < {dump_name}\n"
+            text += "".join(f"Its cold storage files likewise: sqlite3 {name} < {archive_dump_name(name)}\n"
+                            for name in archive_files)
+        return text
+
+    logger.info(f"Database snapshot backup started by admin {user_id}")
+    return Response(
+        snapshot_zip_stream(readme, "GPTLeague.db", dump_name),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+    )
 
 
 def _export_csv_zip(user_id):
-    """Export all tables as CSV files in a ZIP archive."""
-    try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"dtc_league_backup_csv_{timestamp}.zip"
-        
-        # Create in-memory zip file
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            with sqlite3.connect("GPTLeague.db") as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # Get all table names
-                tables = cursor.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-                ).fetchall()
-                
-                for table in tables:
-                    table_name = table["name"]
-                    
-                    # Skip internal sqlite tables
-                    if table_name.startswith("sqlite_"):
-                        continue
-                    
-                    try:
-                        # Get all rows from table
-                        rows = cursor.execute(f"SELECT * FROM {table_name}").fetchall()
-                        
-                        if rows:
-                            # Create CSV in memory
-                            csv_buffer = io.StringIO()
-                            csv_writer = csv.writer(csv_buffer)
-                            
-                            # Write header
-                            headers = [description[0] for description in cursor.description]
-                            csv_writer.writerow(headers)
-                            
-                            # Write data rows
-                            for row in rows:
-                                csv_writer.writerow([row[col] for col in headers])
-                            
-                            # Add to zip
-                            csv_content = csv_buffer.getvalue()
-                            zip_file.writestr(f"{table_name}.csv", csv_content)
-                    
-                    except Exception as e:
-                        logger.warning(f"Error exporting table {table_name}: {str(e)}")
-                        continue
-                
-                # Add README
-                readme = f"""DTC Warhammer 40k League - Database Backup
+    """Stream all tables as CSV files in a ZIP archive as the response."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"dtc_league_backup_csv_{timestamp}.zip"
+
+    def readme(tables):
+        return f"""DTC Warhammer 40k League - Database Backup
 
 Backup Date: {datetime.now().isoformat()}
 Format: CSV Files (comma-separated values)
 
 CONTENTS:
-{chr(10).join([f"- {table['name']}.csv" for table in tables if not table['name'].startswith('sqlite_')])}
+{chr(10).join([f"- {table_name}.csv" for table_name in tables])}
 
 USAGE:
 - Open CSV files in Excel, Google Sheets, or any spreadsheet application
 - Each file represents one database table
+- games, game_participants and rating_changes include the seasons in cold storage (archives/)
 - Headers show column names
 - Useful for data analysis, reporting, and manual review
 
@@ -1147,19 +1078,143 @@ RESTORE (Advanced):
 - Ensure you maintain referential integrity when importing
 - System admin accounts (is_system_only=1) should be handled carefully
 """
-                zip_file.writestr("README.txt", readme)
-        
-        zip_buffer.seek(0)
-        
-        logger.info(f"Database CSV backup created by admin {user_id}")
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
-    
-    except Exception as e:
-        logger.error(f"Error exporting CSV files: {str(e)}")
-        flash(f"Error creating CSV export: {str(e)}", "danger")
+
+    logger.info(f"Database CSV backup started by admin {user_id}")
+    return Response(
+        csv_zip_stream(readme),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+    )
+
+
+@admin_bp.route("/admin/changes")
+@login_required
+def export_changes():
+    """Rows changed since ?since=<seq>, as NDJSON or CSV (?format=); X-Change-Seq is the next cursor."""
+    user_id = session["user_id"]
+    if not is_admin(user_id):
+        flash("You do not have permission to access this page.", "danger")
+        return redirect("/")
+
+    since = request.args.get("since", type=int)
+    output_format = request.args.get("format", "ndjson")
+    if since is None or since < 0 or output_format not in CHANGE_FORMATS:
+        flash("Choose a sequence number and format", "warning")
         return redirect(url_for("admin.export_data"))
+
+    with sqlite3.connect("GPTLeague.db") as conn:
+        until = current_seq(conn.cursor())
+
+    logger.info(f"Change export {since + 1}..{until} by admin {user_id}")
+    return Response(
+        changes_stream(since, until, output_format),
+        mimetype="text/csv" if output_format == "csv" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f"attachment; filename=dtc_league_changes_{since}_{until}.{output_format}",
+            "X-Change-Seq": str(until),
+        }
+    )
+
+
+@admin_bp.route("/admin/database", methods=["GET", "POST"])
+@login_required
+def admin_database():
+    """Database size, free pages and planner statistics, with manual maintenance actions."""
+    user_id = session["user_id"]
+    if not is_admin(user_id):
+        flash("You do not have permission to access this page.", "danger")
+        return redirect("/")
+
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "analyze":
+            with closing(sqlite3.connect("GPTLeague.db")) as conn:
+                analyze(conn)
+            flash("Planner statistics refreshed", "success")
+        elif action == "vacuum":
+            freed = run_maintenance(force=True)["pages_freed"]
+            flash(f"Reclaimed {freed} free page(s)", "success")
+        elif action == "enable_incremental_vacuum":
+            job_id = submit_job(
+                "enable_incremental_vacuum", "Enable incremental auto-vacuum", user_id,
+                lambda job: "Incremental auto-vacuum enabled" if enable_incremental_vacuum()
+                else "Incremental auto-vacuum was already enabled"
+            )
+            return redirect(url_for("admin.job_status", job_id=job_id))
+        else:
+            flash("Unknown action", "warning")
+        return redirect(url_for("admin.admin_database"))
+
+    return render_template("admin_database.html", stats=database_stats())
+
+
+@admin_bp.route("/admin/jobs")
+@login_required
+def admin_jobs():
+    """List recent background jobs."""
+    user_id = session["user_id"]
+    if not is_admin(user_id):
+        flash("You do not have permission to access this page.", "danger")
+        return redirect("/")
+
+    jobs = recent_jobs()
+    with sqlite3.connect("GPTLeague.db") as conn:
+        user_names = dict(conn.execute("SELECT user_id, user_name FROM users").fetchall())
+
+    return render_template("admin_jobs.html", jobs=jobs, user_names=user_names)
+
+
+@admin_bp.route("/admin/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    """Progress page for one background job; polls `job_status_json`."""
+    user_id = session["user_id"]
+    if not is_admin(user_id):
+        flash("You do not have permission to access this page.", "danger")
+        return redirect("/")
+
+    job = get_job(job_id)
+    if not job:
+        flash("Job not found", "warning")
+        return redirect(url_for("admin.admin_jobs"))
+
+    return render_template("admin_job.html", job=job, logs=job_log_lines(job_id))
+
+
+@admin_bp.route("/admin/jobs/<int:job_id>/status")
+@login_required
+def job_status_json(job_id):
+    """Current state of a job plus log lines newer than ?after=<log_id>."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Not authorized"}), 403
+
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    job["logs"] = job_log_lines(job_id, request.args.get("after", 0, type=int))
+    job.pop("result_file", None)
+    return jsonify(job)
+
+
+@admin_bp.route("/admin/jobs/<int:job_id>/download")
+@login_required
+def job_download(job_id):
+    """Download the archive produced by a finished export job."""
+    user_id = session["user_id"]
+    if not is_admin(user_id):
+        flash("You do not have permission to access this page.", "danger")
+        return redirect("/")
+
+    job = get_job(job_id)
+    if (not job or not job["kind"].startswith("export_") or job["status"] != "succeeded"
+            or not job["result_file"] or not Path(job["result_file"]).exists()):
+        flash("Export file not available", "warning")
+        return redirect(url_for("admin.admin_jobs"))
+
+    return send_file(
+        Path(job["result_file"]).resolve(),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=Path(job["result_file"]).name.split("_", 2)[2]
+    )
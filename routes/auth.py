@@ -4,7 +4,9 @@ import secrets
 import logging
 from datetime import datetime, timedelta
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
-from helpers import apology, hash_password, check_password, check_account, CURRENT_YEAR, validate_password_strength, is_admin
+from helpers import apology, hash_password, check_password, authenticate, CURRENT_YEAR, validate_password_strength, is_admin
+from archive import archive_season
+from login_throttle import bcrypt_slot, BcryptBusy, throttle_wait, record_attempt
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +25,24 @@ def login():
             elif not password:
                 return apology("must provide password", 400)
 
-            with sqlite3.connect('GPTLeague.db') as connection:
-                cursor = connection.cursor()
-                row = cursor.execute("SELECT user_id FROM users WHERE user_name = ?", (username,)).fetchone()
-
-            if not row or check_account(username, password) == False:
+            # Reject throttled clients before spending any bcrypt time
+            wait = throttle_wait(username, request.remote_addr)
+            if wait:
+                body, code = apology(f"too many attempts, try again in {wait} seconds", 429)
+                return body, code, {"Retry-After": str(wait)}
+
+            try:
+                with bcrypt_slot():
+                    with sqlite3.connect('GPTLeague.db') as connection:
+                        user = authenticate(connection, username, password)
+            except BcryptBusy:
+                return apology("server busy, please try again", 503)
+
+            record_attempt(username, request.remote_addr, user is not None)
+            if not user:
                 return apology("incorrect username or password", 400)
 
-            session["user_id"] = row[0]
+            session["user_id"] = user["user_id"]
             logger.info(f"User {username} logged in successfully")
             return redirect("/")
         
@@ -173,9 +185,15 @@ def reset_password():
                     flash(f'Password validation failed: {message}', 'warning')
                     return redirect("reset_password.html")
 
+                try:
+                    with bcrypt_slot():
+                        hashed_password = hash_password(password)
+                except BcryptBusy:
+                    flash('The server is busy, please try again', 'warning')
+                    return redirect("reset_password.html")
+
                 with sqlite3.connect('GPTLeague.db') as connection:
                     cursor = connection.cursor()
-                    hashed_password = hash_password(password)
                     cursor.execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (hashed_password, user_id))
                     connection.commit()
                     logger.info(f"Password reset for user_id {user_id}")
@@ -242,6 +260,15 @@ def endseason():
                     connection.commit()
                     logger.info(f"Season {current_year} archived and new season {next_year} created by admin {user_id}")
                     flash(f'Season {current_year} archived. New season {next_year} has been created.', 'success')
+
+                # Optionally move the archived season's games into cold storage
+                if request.form.get("cold_storage"):
+                    try:
+                        moved = archive_season(current_year)
+                        flash(f'{moved} games from season {current_year} moved to cold storage.', 'success')
+                    except Exception as e:
+                        logger.error(f"Error moving season {current_year} to cold storage: {str(e)}")
+                        flash(f'Season {current_year} could not be moved to cold storage: {str(e)}', 'warning')
                 
                 return redirect("/profile")
         except Exception as e:
@@ -265,6 +292,11 @@ def claim_account():
                 flash("All fields are required", "warning")
                 return redirect("/claim_account")
 
+            wait = throttle_wait(username, request.remote_addr)
+            if wait:
+                flash(f"Too many attempts, try again in {wait} seconds", "warning")
+                return redirect("/claim_account")
+
             with sqlite3.connect('GPTLeague.db') as connection:
                 connection.row_factory = sqlite3.Row
                 cursor = connection.cursor()
@@ -276,6 +308,7 @@ def claim_account():
                 ).fetchone()
 
                 if not user:
+                    record_attempt(username, request.remote_addr, False)
                     flash("Username not found", "warning")
                     return redirect("/claim_account")
 
@@ -284,7 +317,10 @@ def claim_account():
                     return redirect("/login")
 
                 # Verify temporary password
-                if not check_password(temp_password, user["password_hash"]):
+                with bcrypt_slot():
+                    temp_password_ok = check_password(temp_password, user["password_hash"])
+                record_attempt(username, request.remote_addr, temp_password_ok)
+                if not temp_password_ok:
                     logger.warning(f"Failed claim attempt for user {username} - incorrect temp password")
                     flash("Incorrect temporary password", "warning")
                     return redirect("/claim_account")
@@ -300,7 +336,8 @@ def claim_account():
                     return redirect("/claim_account")
 
                 # Update password and mark as claimed
-                hashed_new_password = hash_password(new_password)
+                with bcrypt_slot():
+                    hashed_new_password = hash_password(new_password)
                 cursor.execute(
                     "UPDATE users SET password_hash = ?, is_provisional = 0 WHERE user_id = ?",
                     (hashed_new_password, user["user_id"])
@@ -311,6 +348,9 @@ def claim_account():
             flash("Account claimed successfully! You can now log in with your new password.", "success")
             return redirect("/login")
 
+        except BcryptBusy:
+            flash("The server is busy, please try again", "warning")
+            return redirect("/claim_account")
         except Exception as e:
             logger.error(f"Error claiming account for user {request.form.get('username', 'unknown')}: {str(e)}")
             flash("An error occurred claiming your account", "warning")
@@ -5,6 +5,11 @@ from datetime import datetime
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 from helpers import apology, is_admin, login_required, CURRENT_YEAR, season
 from ratings import update_ratings_for_season
+from archive import attach_archives
+from read_snapshot import read_connection
+from aggregates import record_game, find_duplicate_games
+from jobs import submit_job
+from maintenance import request_analyze
 
 logger = logging.getLogger(__name__)
 
@@ -107,6 +112,47 @@ def league():
                     flash("You do not have permission to input results", "danger")
                     return redirect("/league")
 
+                # Result mapping
+                if result == "Player 1 Wins":
+                    p1_result, p2_result = 'win', 'loss'
+                elif result == "Player 2 Wins":
+                    p1_result, p2_result = 'loss', 'win'
+                elif result == "Drawn":
+                    p1_result = p2_result = 'draw'
+
+                # Ask before recording what looks like the same game twice
+                if not request.form.get("confirm_duplicate"):
+                    duplicates = find_duplicate_games(
+                        cursor, system_id, played_on_str, player_one, player_two, p1_result
+                    )
+                    if duplicates:
+                        # The form posts without ?system, so reload the posted system's options
+                        posted_system = next(
+                            (s for s in systems if str(s["system_id"]) == system_id),
+                            selected_system
+                        )
+                        posted_factions = cursor.execute(
+                            "SELECT faction_id AS id, faction_name FROM factions WHERE system_id = ? ORDER BY faction_name",
+                            (system_id,)
+                        ).fetchall()
+                        posted_points_bands = cursor.execute(
+                            "SELECT DISTINCT points_band FROM elo_rules WHERE category = ? ORDER BY points_band",
+                            (system_category,)
+                        ).fetchall()
+                        return render_template(
+                            "league.html",
+                            users=users,
+                            factions=posted_factions,
+                            locations=locations,
+                            points_bands=posted_points_bands,
+                            systems=systems,
+                            selected_system_id=system_id,
+                            system_name=posted_system["system_name"],
+                            today=raw_date,
+                            duplicates=duplicates,
+                            resubmit=request.form
+                        )
+
                 try:
                     connection.execute("BEGIN")
 
@@ -117,14 +163,6 @@ def league():
                     game_id = cursor.lastrowid
                     logger.debug(f"Game created with ID {game_id}")
 
-                    # Result mapping
-                    if result == "Player 1 Wins":
-                        p1_result, p2_result = 'win', 'loss'
-                    elif result == "Player 2 Wins":
-                        p1_result, p2_result = 'loss', 'win'
-                    elif result == "Drawn":
-                        p1_result = p2_result = 'draw'
-
                     # Player 1
                     cursor.execute(
                         "INSERT INTO game_participants (game_id, player_id, faction_id, result, painting_battle_ready) VALUES (?,?,?,?,?)",
@@ -139,6 +177,9 @@ def league():
                     )
                     logger.debug(f"Player 2 ({player_two}) inserted into game {game_id}")
 
+                    # Update pre-aggregated stats
+                    record_game(game_id, connection)
+
                     # Update ratings
                     update_ratings_for_season(season_id, system_id, system_category, connection)
                     connection.commit()
@@ -182,7 +223,7 @@ def gamesPlayed(system_id):
     year = CURRENT_YEAR()
 
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
@@ -219,15 +260,17 @@ def gamesPlayed(system_id):
                 start_date = '0000-01-01'
                 end_date = cursor.execute("SELECT DATE('now')").fetchone()[0]
 
+            attach_archives(connection, start_date, end_date)
+
             # Query games
             gameslist_result = cursor.execute("""
                 SELECT g.game_id, g.played_on, g.score, g.ignored,
                     gp1.player_id, u1.full_name,
                     gp2.player_id, u2.full_name,
                     l.name                          
-                FROM games g
-                JOIN game_participants gp1 ON g.game_id = gp1.game_id
-                JOIN game_participants gp2 ON g.game_id = gp2.game_id
+                FROM league_games g
+                JOIN league_game_participants gp1 ON g.game_id = gp1.game_id
+                JOIN league_game_participants gp2 ON g.game_id = gp2.game_id
                 JOIN users u1 ON gp1.player_id = u1.user_id
                 JOIN users u2 ON gp2.player_id = u2.user_id
                 JOIN seasons s ON g.season_id = s.season_id
@@ -299,7 +342,7 @@ def gamesPlayed(system_id):
             # Fetch all rating history in one query
             all_history = cursor.execute(f"""
                 SELECT game_id, player_id, old_rating, new_rating
-                FROM rating_history
+                FROM league_rating_history
                 WHERE system_id = ? AND game_id IN ({game_placeholders})
             """, [system_id] + all_game_ids).fetchall()
             history_lookup = {(row[0], row[1]): (row[2], row[3]) for row in all_history}
@@ -307,7 +350,7 @@ def gamesPlayed(system_id):
             # Fetch all winners in one query
             all_winners = cursor.execute(f"""
                 SELECT game_id, player_id
-                FROM game_participants
+                FROM league_game_participants
                 WHERE game_id IN ({game_placeholders}) AND result = 'win'
             """, all_game_ids).fetchall()
             winners_lookup = {row[0]: row[1] for row in all_winners}
@@ -390,8 +433,6 @@ def recalc_ratings():
         season_id = int(season_id)
         system_id = int(system_id)
 
-        process_ratings(season_id, system_id)
-
         with sqlite3.connect("GPTLeague.db") as conn:
             cursor = conn.cursor()
             sys_row = cursor.execute(
@@ -400,11 +441,22 @@ def recalc_ratings():
             ).fetchone()
             system_name = sys_row[0] if sys_row else f"System {system_id}"
 
-        flash(f"Ratings recalculated successfully for season {season_id}, {system_name}!", "success")
+        def recalculate(job):
+            job.progress(0, 1, "Replaying games")
+            process_ratings(season_id, system_id)
+            request_analyze()
+            job.progress(1)
+            return f"Ratings recalculated successfully for season {season_id}, {system_name}!"
+
+        job_id = submit_job(
+            "recalculate_ratings", f"Recalculate ratings for season {season_id}, {system_name}",
+            user_id, recalculate
+        )
     except Exception as e:
         flash(f"Error recalculating ratings: {e}", "danger")
+        return redirect(url_for("leagues.gamesPlayed", system_id=system_id))
 
-    return redirect(url_for("leagues.gamesPlayed", system_id=system_id))
+    return redirect(url_for("admin.job_status", job_id=job_id))
 
 
 @leagues_bp.route("/toggleIgnored", methods=["POST"])
@@ -2,7 +2,10 @@
 import sqlite3
 import logging
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for, send_file
-from helpers import apology, login_required, hash_password, CURRENT_YEAR, all_seasons
+from helpers import apology, login_required, hash_password, CURRENT_YEAR, season, all_seasons
+from archive import attach_archives
+from read_snapshot import read_connection
+from aggregates import unplayed_opponents
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +21,7 @@ def home():
 @main_bp.route("/elo_ratings", methods=["GET", "POST"])
 def elo_ratings():
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
@@ -26,10 +29,10 @@ def elo_ratings():
             latest_year_row = cursor.execute("SELECT MAX(year) AS latest_year FROM seasons").fetchone()
             latest_year = latest_year_row["latest_year"] if latest_year_row else CURRENT_YEAR()
 
-            # Handle year selection
-            if request.method == "POST":
-                selected_year = request.form.get("year")
-                if selected_year and selected_year.isnumeric():
+            # Handle year selection (?year= links are served pre-rendered, see prerender.py)
+            if request.values.get("year"):
+                selected_year = request.values.get("year")
+                if selected_year.isnumeric():
                     selected_year = int(selected_year)
             else:
                 selected_year = latest_year
@@ -38,6 +41,11 @@ def elo_ratings():
             user_stats = None
             if 'user_id' in session:
                 user_id = session["user_id"]
+                season_range = season(selected_year)
+                if season_range:
+                    attach_archives(connection, *season_range)
+                else:
+                    attach_archives(connection, '0000-01-01', '9999-12-31')
                 user_stats = cursor.execute("""
                     SELECT 
                         u.full_name,
@@ -49,8 +57,8 @@ def elo_ratings():
                         AVG(r.current_rating) as avg_rating,
                         COUNT(DISTINCT f.system_id) as systems_played
                     FROM users u
-                    LEFT JOIN game_participants gp ON u.user_id = gp.player_id
-                    LEFT JOIN games g ON gp.game_id = g.game_id
+                    LEFT JOIN league_game_participants gp ON u.user_id = gp.player_id
+                    LEFT JOIN league_games g ON gp.game_id = g.game_id
                     LEFT JOIN ratings r ON u.user_id = r.player_id
                     LEFT JOIN factions f ON gp.faction_id = f.faction_id
                     WHERE u.user_id = ? AND g.season_id = (SELECT season_id FROM seasons WHERE year = ?)
@@ -143,12 +151,15 @@ def profile():
                 from helpers import is_admin
                 is_user_admin = is_admin(user_id)
                 
+                # Profile stats are all-time, so include every season in cold storage
+                attach_archives(connection, '0000-01-01', '9999-12-31')
+
                 # Get armies (factions) played by user
                 armies_played = cursor.execute("""
                     SELECT f.faction_name, s.system_name, COUNT(*) as game_count
-                    FROM game_participants gp
+                    FROM league_game_participants gp
                     JOIN factions f ON gp.faction_id = f.faction_id
-                    JOIN games g ON gp.game_id = g.game_id
+                    JOIN league_games g ON gp.game_id = g.game_id
                     JOIN systems s ON g.system_id = s.system_id
                     WHERE gp.player_id = ?
                     GROUP BY f.faction_id, s.system_id
@@ -158,8 +169,8 @@ def profile():
                 # Get favorite store (most played location)
                 favorite_store = cursor.execute("""
                     SELECT l.name, l.city, COUNT(*) as game_count
-                    FROM games g
-                    JOIN game_participants gp ON g.game_id = gp.game_id
+                    FROM league_games g
+                    JOIN league_game_participants gp ON g.game_id = gp.game_id
                     JOIN locations l ON g.location_id = l.location_id
                     WHERE gp.player_id = ?
                     GROUP BY g.location_id
@@ -167,6 +178,23 @@ def profile():
                     LIMIT 1
                 """, (user_id,)).fetchone()
                 
+                # Opponent coverage for the current season: club members not yet played
+                coverage = None
+                season_row = cursor.execute(
+                    "SELECT season_id FROM seasons WHERE year = ?", (year,)
+                ).fetchone()
+                if season_row:
+                    members = cursor.execute("""
+                        SELECT COUNT(*) FROM club_memberships
+                        WHERE season_id = ? AND is_member = 1 AND user_id != ?
+                    """, (season_row["season_id"], user_id)).fetchone()[0]
+                    unplayed = unplayed_opponents(cursor, user_id, season_row["season_id"])
+                    coverage = {
+                        "members": members,
+                        "played": members - len(unplayed),
+                        "unplayed": unplayed
+                    }
+
                 # Get all users for admin dropdown (if user is admin)
                 users_list = []
                 if is_user_admin:
@@ -186,6 +214,7 @@ def profile():
                                        is_user_admin=is_user_admin,
                                        armies_played=armies_played,
                                        favorite_store=favorite_store,
+                                       coverage=coverage,
                                        CURRENT_YEAR=year)
             else:
                 from helpers import is_admin
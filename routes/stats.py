@@ -5,8 +5,12 @@ import logging
 import plotly
 import plotly.graph_objs as go
 from datetime import datetime
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, session, url_for
 from helpers import apology, login_required, CURRENT_YEAR, season, all_seasons
+from archive import attach_archives
+from read_snapshot import read_connection
+from aggregates import (faction_rollup, faction_matchups, head_to_head, opponent_records,
+                        unplayed_opponents, player_window_totals, location_window_totals)
 
 logger = logging.getLogger(__name__)
 
@@ -17,64 +21,71 @@ stats_bp = Blueprint('stats', __name__)
 def factionstats():
     selected_year = CURRENT_YEAR()
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
-            if request.method == "POST":
-                selected_year = request.form.get("year")
+            selected_band = None
+            selected_location = None
+            selected_month = None
+            if request.values.get("year"):
+                selected_year = request.values.get("year")
                 if selected_year != 'All':
                     selected_year = int(selected_year)
+                selected_band = request.values.get("points_band") or None
+                if request.values.get("location"):
+                    selected_location = int(request.values.get("location"))
+                selected_month = request.values.get("month") or None
 
             if selected_year != 'All':
                 start_date, end_date = season(selected_year)                
             else:
                 start_date = '0000-01-01'
                 end_date = cursor.execute("SELECT DATE('now')").fetchone()[0]      
-          
-            factions_stats = cursor.execute("""
-                                            SELECT 
-                                                CASE 
-                                                WHEN gp.result = 'win' THEN 1  
-                                                WHEN gp.result = 'loss' THEN 0 
-                                                WHEN gp.result = 'draw' THEN 2 
-                                            END AS win, 
-                                            gp.faction_id AS faction, 
-                                            f.faction_id AS id, 
-                                            f.faction_name, 
-                                            s.system_name, 
-                                            gp.painting_battle_ready AS painted 
-                                            FROM game_participants gp 
-                                            JOIN factions f ON f.faction_id = gp.faction_id
-                                            JOIN games g ON g.game_id = gp.game_id 
-                                            JOIN systems s ON s.system_id = f.system_id
-                                            WHERE g.played_on >= ? AND g.played_on <= ? 
-                                            ORDER BY s.system_name, f.faction_name
-                                        """, (start_date, end_date)).fetchall()
-            
-            factions = {}    
-            if factions_stats:
-                for row in factions_stats:
-                    system = row["system_name"]
-                    faction = row["faction_name"]
-
-                    if system not in factions:
-                        factions[system] = {}
-
-                    if faction not in factions[system]:
-                        factions[system][faction] = {
-                            "games": 0, "wins": 0, "losses": 0, "draws": 0, "battle_ready": 0
-                        }
-
-                    factions[system][faction]["games"] += 1
-                    if row["painted"]:
-                        factions[system][faction]["battle_ready"] += 1
-                    if row["win"] == 1:
-                        factions[system][faction]["wins"] += 1
-                    elif row["win"] == 2:
-                        factions[system][faction]["draws"] += 1
-                    elif row["win"] == 0:
-                        factions[system][faction]["losses"] += 1
+
+            # Seasons start and end on month boundaries, so a month range over the
+            # pre-aggregated cube matches a season's date range exactly. 'All' ends
+            # today, part way through a month: that month is counted up to today
+            # from the games themselves.
+            start_month, end_month = start_date[:7], end_date[:7]
+            factions_stats = faction_rollup(
+                cursor, start_month, end_month,
+                points_band=selected_band,
+                location_id=selected_location,
+                month=selected_month,
+                end_date=end_date if selected_year == 'All' else None
+            )
+
+            factions = {}
+            for row in factions_stats:
+                factions.setdefault(row["system_name"], {})[row["faction_name"]] = {
+                    "games": row["games"],
+                    "wins": row["wins"],
+                    "losses": row["losses"],
+                    "draws": row["draws"],
+                    "battle_ready": row["battle_ready"]
+                }
+
+            # Faction-vs-faction matrix per system (season totals, or every season for 'All')
+            season_id = None
+            if selected_year != 'All':
+                season_row = cursor.execute(
+                    "SELECT season_id FROM seasons WHERE year = ?", (selected_year,)
+                ).fetchone()
+                season_id = season_row["season_id"] if season_row else -1
+            matchups = build_matchup_matrix(faction_matchups(cursor, season_id))
+
+            # Filter options
+            points_bands = cursor.execute(
+                "SELECT DISTINCT points_band FROM elo_rules ORDER BY points_band"
+            ).fetchall()
+            locations = cursor.execute(
+                "SELECT location_id, name FROM locations ORDER BY name"
+            ).fetchall()
+            months = cursor.execute(
+                "SELECT DISTINCT month FROM faction_cube WHERE month BETWEEN ? AND ? ORDER BY month",
+                (start_month, end_month)
+            ).fetchall()
 
             graphs = {}
             for system, system_factions in factions.items():
@@ -91,7 +102,14 @@ def factionstats():
                  factions=factions, 
                  graphs=graphs, 
                  years=years_seasons, 
-                 selected_year=selected_year
+                 selected_year=selected_year,
+                 points_bands=points_bands,
+                 locations=locations,
+                 months=months,
+                 selected_band=selected_band,
+                 selected_location=selected_location,
+                 selected_month=selected_month,
+                 matchups=matchups
                 )
     except Exception as e:
         logger.error(f"Error in factionstats: {str(e)}")
@@ -99,13 +117,102 @@ def factionstats():
         return apology("An error occurred loading faction stats", 400)
 
 
+def build_matchup_matrix(rows):
+    """Arrange faction_matchups rows into {system_name: {"factions": [...], "cells": {...}}}."""
+    matrix = {}
+    for row in rows:
+        system = matrix.setdefault(row["system_name"], {"factions": set(), "cells": {}})
+        system["factions"].update((row["faction_name"], row["opponent_name"]))
+        system["cells"][(row["faction_name"], row["opponent_name"])] = {
+            "games": row["games"],
+            "wins": row["wins"],
+            "draws": row["draws"],
+            "losses": row["losses"]
+        }
+    for system in matrix.values():
+        system["factions"] = sorted(system["factions"])
+    return matrix
+
+
+def custom_date_range():
+    """
+    Read an optional custom window from the `from_date` / `to_date` fields.
+
+    Returns:
+        tuple: (start_date, end_date) as 'YYYY-MM-DD', or None when no valid range was given.
+    """
+    from_date = request.values.get("from_date", "").strip()
+    to_date = request.values.get("to_date", "").strip()
+    if not from_date and not to_date:
+        return None
+    try:
+        for value in (from_date, to_date):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format", "warning")
+        return None
+    start_date = from_date or '0000-01-01'
+    end_date = to_date or datetime.now().strftime("%Y-%m-%d")
+    if start_date > end_date:
+        flash("The start date must be before the end date", "warning")
+        return None
+    return start_date, end_date
+
+
+@stats_bp.route("/factionstats/matchups.json", methods=["GET"])
+def faction_matchups_json():
+    """Faction-vs-faction matrix as JSON. Optional args: year (or 'All'), system."""
+    selected_year = request.args.get("year") or CURRENT_YEAR()
+    system_id = request.args.get("system", type=int)
+    try:
+        with read_connection() as connection:
+            connection.row_factory = sqlite3.Row
+            cursor = connection.cursor()
+
+            season_id = None
+            if selected_year != 'All':
+                selected_year = int(selected_year)
+                season_row = cursor.execute(
+                    "SELECT season_id FROM seasons WHERE year = ?", (selected_year,)
+                ).fetchone()
+                if not season_row:
+                    return jsonify({"error": f"Season {selected_year} not found"}), 404
+                season_id = season_row["season_id"]
+
+            rows = faction_matchups(cursor, season_id, system_id)
+
+        return jsonify({
+            "year": selected_year,
+            "system_id": system_id,
+            "matchups": [
+                {
+                    "system_id": row["system_id"],
+                    "system_name": row["system_name"],
+                    "faction_id": row["faction_id"],
+                    "faction_name": row["faction_name"],
+                    "opponent_faction_id": row["opponent_faction_id"],
+                    "opponent_name": row["opponent_name"],
+                    "games": row["games"],
+                    "wins": row["wins"],
+                    "draws": row["draws"],
+                    "losses": row["losses"]
+                }
+                for row in rows
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error in faction_matchups_json: {str(e)}")
+        return jsonify({"error": "An error occurred loading faction matchups"}), 400
+
+
 @stats_bp.route("/playerstats", methods=["GET", "POST"])
 @login_required
 def playerstats():
     year = CURRENT_YEAR()
     user_id = session["user_id"]
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
@@ -124,6 +231,14 @@ def playerstats():
                 start_date = '0000-01-01'
                 end_date = cursor.execute("SELECT DATE('now')").fetchone()[0]
 
+            custom_range = custom_date_range()
+            if custom_range:
+                start_date, end_date = custom_range
+                # Games up to and including the last day of the window
+                end_date = f"{end_date} 23:59:59"
+
+            attach_archives(connection, start_date, end_date)
+
             users_results = cursor.execute("SELECT user_name,user_id FROM users").fetchall()
             active = cursor.execute("SELECT user_name,user_id FROM users WHERE user_id=?", (player,)).fetchone()
             
@@ -145,10 +260,10 @@ def playerstats():
                     f.faction_name,                                       
                     gp.game_id,
                     gp.painting_battle_ready AS battle_ready
-                FROM game_participants gp
+                FROM league_game_participants gp
                 JOIN users u ON u.user_id = gp.player_id
                 JOIN factions f ON f.faction_id = gp.faction_id
-                JOIN games g ON g.game_id = gp.game_id
+                JOIN league_games g ON g.game_id = gp.game_id
                 JOIN systems s ON s.system_id = g.system_id
                 WHERE gp.player_id = ? AND g.played_on BETWEEN ? AND ?
                 ORDER BY s.system_name,f.faction_name
@@ -195,9 +310,9 @@ def playerstats():
                     u2.user_name AS opponent_name,
                     l.name AS location,
                     s.system_name
-                FROM games g
-                JOIN game_participants gp ON g.game_id = gp.game_id
-                LEFT JOIN game_participants gp2 ON g.game_id = gp2.game_id AND gp2.player_id != gp.player_id
+                FROM league_games g
+                JOIN league_game_participants gp ON g.game_id = gp.game_id
+                LEFT JOIN league_game_participants gp2 ON g.game_id = gp2.game_id AND gp2.player_id != gp.player_id
                 LEFT JOIN users u2 ON gp2.player_id = u2.user_id
                 LEFT JOIN factions f ON gp.faction_id = f.faction_id
                 LEFT JOIN locations l ON g.location_id = l.location_id
@@ -206,6 +321,23 @@ def playerstats():
                 ORDER BY g.played_on DESC
             """, (player, start_date, end_date)).fetchall()
                          
+            # Head-to-head records and opponent coverage from the pairwise index
+            season_id = None
+            if selected_year != 'All':
+                season_row = cursor.execute(
+                    "SELECT season_id FROM seasons WHERE year = ?", (selected_year,)
+                ).fetchone()
+                season_id = season_row["season_id"] if season_row else -1
+            system_totals = {
+                row["system_name"]: row
+                for row in player_window_totals(cursor, start_date, end_date, player)
+            }
+            opponents = opponent_records(cursor, player, season_id)
+            unplayed = unplayed_opponents(cursor, player, season_id) if season_id else []
+            my_record = None
+            if int(player) != user_id:
+                my_record = head_to_head(cursor, user_id, player, season_id)
+
             years_seasons = all_seasons()
 
             return render_template(
@@ -216,7 +348,12 @@ def playerstats():
                 graphs=graphs,
                 years=years_seasons,
                 selected_year=selected_year,
-                player_games=player_games
+                player_games=player_games,
+                opponents=opponents,
+                unplayed=unplayed,
+                my_record=my_record,
+                system_totals=system_totals,
+                custom_range=custom_range
             )
         
     except Exception as e:
@@ -232,14 +369,14 @@ def store_reports():
     year = CURRENT_YEAR()
 
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
             # Handle year selection
-            if request.method == "POST":
-                selected_year = request.form.get("year")
-                if selected_year and selected_year != 'All':
+            if request.values.get("year"):
+                selected_year = request.values.get("year")
+                if selected_year != 'All':
                     selected_year = int(selected_year)
                 else:
                     selected_year = year
@@ -253,15 +390,21 @@ def store_reports():
                 start_date = '0000-01-01'
                 end_date = cursor.execute("SELECT DATE('now')").fetchone()[0]
 
+            attach_archives(connection, start_date, end_date)
+            custom_range = custom_date_range()
+
             # Query: count games per store for ALL systems
-            if selected_year == 'All':
+            if custom_range:
+                # Difference of two prefix-sum lookups, no scan of the games table
+                all_systems_stores = location_window_totals(cursor, *custom_range)
+            elif selected_year == 'All':
                 all_systems_stores = cursor.execute("""
                     SELECT 
                         s.system_id,
                         s.system_name,
                         l.name AS store_name, 
                         COUNT(g.game_id) AS games_played
-                    FROM games g
+                    FROM league_games g
                     JOIN locations l ON g.location_id = l.location_id
                     JOIN systems s ON g.system_id = s.system_id
                     WHERE g.played_on BETWEEN ? AND ?
@@ -275,7 +418,7 @@ def store_reports():
                         s.system_name,
                         l.name AS store_name, 
                         COUNT(g.game_id) AS games_played
-                    FROM games g
+                    FROM league_games g
                     JOIN locations l ON g.location_id = l.location_id
                     JOIN seasons se ON g.season_id = se.season_id
                     JOIN systems s ON g.system_id = s.system_id
@@ -311,6 +454,7 @@ def store_reports():
                 systems_data=systems_data,
                 years=years_seasons,
                 selected_year=selected_year,
+                custom_range=custom_range,
                 CURRENT_YEAR=year
             )
 
@@ -326,35 +470,14 @@ def overall():
     year = CURRENT_YEAR()
     
     try:
-        with sqlite3.connect('GPTLeague.db') as connection:
+        with read_connection() as connection:
             connection.row_factory = sqlite3.Row
             cursor = connection.cursor()
 
-            # Migrate from old schema if needed
-            try:
-                cursor.execute("SELECT setting_key FROM league_settings LIMIT 1")
-            except:
-                # Old table doesn't exist or has wrong schema, drop and recreate
-                cursor.execute("DROP TABLE IF EXISTS league_settings")
-            
-            # Create settings table with new schema
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS league_settings (
-                    setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    season_id INTEGER,
-                    setting_key TEXT NOT NULL,
-                    setting_value TEXT NOT NULL,
-                    description TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(season_id, setting_key),
-                    FOREIGN KEY(season_id) REFERENCES seasons(season_id)
-                )
-            """)
-
             # Handle year selection
-            if request.method == "POST":
-                selected_year = request.form.get("year")
-                if selected_year and selected_year != 'All':
+            if request.values.get("year"):
+                selected_year = request.values.get("year")
+                if selected_year != 'All':
                     selected_year = int(selected_year)
                 else:
                     selected_year = year
@@ -368,6 +491,10 @@ def overall():
                 start_date = '0000-01-01'
                 end_date = cursor.execute("SELECT DATE('now')").fetchone()[0]
 
+            custom_range = custom_date_range()
+            if not custom_range:
+                attach_archives(connection, start_date, end_date)
+
             # Get opponent limit for the selected year
             season_row = cursor.execute("SELECT season_id FROM seasons WHERE year = ?", (selected_year,)).fetchone()
             opponent_limit = 3  # default
@@ -389,7 +516,7 @@ def overall():
             season_id = selected_season["season_id"] if selected_season else None
 
             # Fetch all games with details for the selected year (no membership filter)
-            if season_id:
+            if season_id and not custom_range:
                 games = cursor.execute("""
                     SELECT 
                         g.game_id,
@@ -405,9 +532,9 @@ def overall():
                         u2.user_name AS p2_name,
                         u2.full_name AS p2_full_name,
                         gp2.result AS p2_result
-                    FROM games g
-                    JOIN game_participants gp1 ON g.game_id = gp1.game_id
-                    JOIN game_participants gp2 ON g.game_id = gp2.game_id
+                    FROM league_games g
+                    JOIN league_game_participants gp1 ON g.game_id = gp1.game_id
+                    JOIN league_game_participants gp2 ON g.game_id = gp2.game_id
                     JOIN users u1 ON gp1.player_id = u1.user_id
                     JOIN users u2 ON gp2.player_id = u2.user_id
                     JOIN systems s ON g.system_id = s.system_id
@@ -427,6 +554,16 @@ def overall():
                 """, (season_id,)).fetchall()
                 club_members = {row["user_id"] for row in member_rows}
 
+            if custom_range:
+                # Members of any season overlapping the window
+                member_rows = cursor.execute("""
+                    SELECT DISTINCT cm.user_id
+                    FROM club_memberships cm
+                    JOIN seasons se ON se.season_id = cm.season_id
+                    WHERE cm.is_member = 1 AND se.start_date <= ? AND se.end_date >= ?
+                """, (f"{custom_range[1]} 23:59:59", custom_range[0])).fetchall()
+                club_members = {row["user_id"] for row in member_rows}
+
             # Calculate points using Option A scoring with opponent limit
             systems_leaderboards = {}
             
@@ -490,6 +627,19 @@ def overall():
                     players[game["p2_id"]]["games"] += 1
                     players[game["p2_id"]]["opponent_games"][game["p1_id"]] += 1
             
+            # Custom windows come straight from the prefix-sum tables (no opponent limit)
+            if custom_range:
+                for row in player_window_totals(cursor, *custom_range):
+                    board = systems_leaderboards.setdefault(
+                        row["system_name"], {"system_id": row["system_id"], "players": {}}
+                    )
+                    board["players"][row["player_id"]] = {
+                        "name": row["user_name"],
+                        "full_name": row["full_name"],
+                        "points": row["points"],
+                        "games": row["games"]
+                    }
+
             # Sort players by points within each system, only showing club members
             for system_name in systems_leaderboards:
                 players_list = list(systems_leaderboards[system_name]["players"].items())
@@ -506,6 +656,7 @@ def overall():
                 years=years_seasons,
                 selected_year=selected_year,
                 opponent_limit=opponent_limit,
+                custom_range=custom_range,
                 CURRENT_YEAR=year
             )
 
@@ -5,6 +5,9 @@
 -- HeidiSQL Version:             12.6.0.6765
 -- --------------------------------------------------------
 
+-- Free pages are reclaimed in steps by maintenance.py; must precede the first table
+PRAGMA auto_vacuum = INCREMENTAL;
+
 /*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
 /*!40101 SET NAMES  */;
 /*!40103 SET @OLD_TIME_ZONE=@@TIME_ZONE */;
@@ -13,6 +16,18 @@
 /*!40101 SET @OLD_SQL_MODE=@@SQL_MODE, SQL_MODE='NO_AUTO_VALUE_ON_ZERO' */;
 /*!40111 SET @OLD_SQL_NOTES=@@SQL_NOTES, SQL_NOTES=0 */;
 
+-- Dumping structure for table GPTLeague.change_log
+-- Filled by triggers on the tracked tables, created by changes.ensure_change_log()
+CREATE TABLE IF NOT EXISTS change_log (
+    seq                INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name         TEXT NOT NULL,
+    row_key            TEXT NOT NULL,           -- JSON array of primary key values
+    operation          TEXT NOT NULL CHECK (operation IN ('insert','update','delete')),
+    changed_at         TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Data exporting was unselected.
+
 -- Dumping structure for table GPTLeague.club_memberships
 CREATE TABLE IF NOT EXISTS club_memberships (
     membership_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,6 +53,40 @@ CREATE TABLE IF NOT EXISTS elo_rules (
 
 -- Data exporting was unselected.
 
+-- Dumping structure for table GPTLeague.faction_cube
+CREATE TABLE IF NOT EXISTS faction_cube (
+    season_id          INTEGER NOT NULL,
+    system_id          INTEGER NOT NULL,
+    faction_id         INTEGER NOT NULL,
+    points_band        TEXT NOT NULL,
+    location_id        INTEGER NOT NULL DEFAULT 0,   -- 0 when the game has no location
+    month              TEXT NOT NULL,                -- 'YYYY-MM' of played_on
+    games              INTEGER NOT NULL DEFAULT 0,
+    wins               INTEGER NOT NULL DEFAULT 0,
+    draws              INTEGER NOT NULL DEFAULT 0,
+    losses             INTEGER NOT NULL DEFAULT 0,
+    battle_ready       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (season_id, system_id, faction_id, points_band, location_id, month)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_faction_cube_month ON faction_cube(month, system_id);
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.faction_matchups
+CREATE TABLE IF NOT EXISTS faction_matchups (
+    season_id          INTEGER NOT NULL,
+    system_id          INTEGER NOT NULL,
+    faction_id         INTEGER NOT NULL,
+    opponent_faction_id INTEGER NOT NULL,
+    games              INTEGER NOT NULL DEFAULT 0,
+    wins               INTEGER NOT NULL DEFAULT 0,  -- from faction_id's point of view
+    draws              INTEGER NOT NULL DEFAULT 0,
+    losses             INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (season_id, system_id, faction_id, opponent_faction_id)
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
 -- Dumping structure for table GPTLeague.factions
 CREATE TABLE IF NOT EXISTS factions (
     faction_id         INTEGER PRIMARY KEY,
@@ -49,6 +98,19 @@ CREATE TABLE IF NOT EXISTS factions (
 
 -- Data exporting was unselected.
 
+-- Dumping structure for table GPTLeague.game_fingerprints
+CREATE TABLE IF NOT EXISTS game_fingerprints (
+    system_id          INTEGER NOT NULL,
+    day                TEXT NOT NULL,           -- 'YYYY-MM-DD' of played_on
+    player_low         INTEGER NOT NULL,        -- lower player_id of the pair
+    player_high        INTEGER NOT NULL,
+    low_result         TEXT NOT NULL,           -- player_low's result
+    game_id            INTEGER NOT NULL,
+    PRIMARY KEY (system_id, day, player_low, player_high, low_result, game_id)
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
 -- Dumping structure for table GPTLeague.games
 CREATE TABLE IF NOT EXISTS games (
     game_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -79,10 +141,52 @@ CREATE TABLE IF NOT EXISTS game_participants (
     FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE,
     FOREIGN KEY (player_id) REFERENCES users(user_id) ON DELETE CASCADE,
     FOREIGN KEY (faction_id) REFERENCES factions(faction_id) ON DELETE SET NULL
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.head_to_head
+CREATE TABLE IF NOT EXISTS head_to_head (
+    season_id          INTEGER NOT NULL,
+    system_id          INTEGER NOT NULL,
+    player_id          INTEGER NOT NULL,
+    opponent_id        INTEGER NOT NULL,
+    games              INTEGER NOT NULL DEFAULT 0,
+    wins               INTEGER NOT NULL DEFAULT 0,  -- from player_id's point of view
+    draws              INTEGER NOT NULL DEFAULT 0,
+    losses             INTEGER NOT NULL DEFAULT 0,
+    last_played        TEXT,
+    PRIMARY KEY (season_id, system_id, player_id, opponent_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_head_to_head_player ON head_to_head(player_id, season_id);
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.league_settings
+CREATE TABLE IF NOT EXISTS league_settings (
+    setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    season_id INTEGER,
+    setting_key TEXT NOT NULL,
+    setting_value TEXT NOT NULL,
+    description TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(season_id, setting_key),
+    FOREIGN KEY(season_id) REFERENCES seasons(season_id)
 );
 
 -- Data exporting was unselected.
 
+-- Dumping structure for table GPTLeague.location_daily_totals
+CREATE TABLE IF NOT EXISTS location_daily_totals (
+    system_id          INTEGER NOT NULL,
+    location_id        INTEGER NOT NULL,
+    day                TEXT NOT NULL,               -- cumulative games up to and including this day
+    games              INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (system_id, location_id, day)
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
 -- Dumping structure for table GPTLeague.locations
 CREATE TABLE IF NOT EXISTS locations (
     location_id        INTEGER PRIMARY KEY,
@@ -107,38 +211,69 @@ CREATE TABLE IF NOT EXISTS password_reset_tokens (
 
 -- Data exporting was unselected.
 
--- Dumping structure for table GPTLeague.ratings
-CREATE TABLE IF NOT EXISTS ratings (
-    player_id INTEGER NOT NULL,
+-- Dumping structure for table GPTLeague.player_daily_totals
+CREATE TABLE IF NOT EXISTS player_daily_totals (
+    system_id          INTEGER NOT NULL,
+    player_id          INTEGER NOT NULL,
+    day                TEXT NOT NULL,               -- cumulative totals up to and including this day
+    points             INTEGER NOT NULL DEFAULT 0,  -- Option A points, no opponent limit
+    games              INTEGER NOT NULL DEFAULT 0,
+    wins               INTEGER NOT NULL DEFAULT 0,
+    draws              INTEGER NOT NULL DEFAULT 0,
+    losses             INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (system_id, player_id, day)
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.player_ratings
+CREATE TABLE IF NOT EXISTS player_ratings (
     season_id INTEGER NOT NULL,
     system_id INTEGER NOT NULL,
-    current_rating INTEGER NOT NULL, last_updated TEXT,
-    PRIMARY KEY (player_id, season_id, system_id),
-    FOREIGN KEY (player_id) REFERENCES users(user_id),
+    player_id INTEGER NOT NULL,
+    rating INTEGER NOT NULL,                  -- hundredths of a rating point
+    last_updated TEXT,
+    PRIMARY KEY (season_id, system_id, player_id),
     FOREIGN KEY (season_id) REFERENCES seasons(season_id),
-    FOREIGN KEY (system_id) REFERENCES systems(system_id)
-);
+    FOREIGN KEY (system_id) REFERENCES systems(system_id),
+    FOREIGN KEY (player_id) REFERENCES users(user_id)
+) WITHOUT ROWID;
 
 -- Data exporting was unselected.
 
--- Dumping structure for table GPTLeague.rating_history
-CREATE TABLE IF NOT EXISTS rating_history (
+-- Dumping structure for view GPTLeague.ratings
+CREATE VIEW IF NOT EXISTS ratings AS
+SELECT player_id, season_id, system_id,
+       rating / 100.0 AS current_rating, last_updated
+FROM player_ratings;
+
+-- Dumping structure for table GPTLeague.rating_changes
+CREATE TABLE IF NOT EXISTS rating_changes (
     game_id INTEGER NOT NULL,
     player_id INTEGER NOT NULL,
-    system_id INTEGER NOT NULL,
-    old_rating INTEGER NOT NULL,
-    new_rating INTEGER NOT NULL,
+    old_rating INTEGER NOT NULL,             -- hundredths of a rating point
+    new_rating INTEGER NOT NULL,             -- hundredths of a rating point
     k_factor_used INTEGER NOT NULL,
-    expected_score REAL NOT NULL,
-    actual_score REAL NOT NULL,
-    PRIMARY KEY (game_id, player_id, system_id),
+    expected_score INTEGER NOT NULL,         -- ten-thousandths
+    PRIMARY KEY (game_id, player_id),
     FOREIGN KEY (game_id) REFERENCES games(game_id),
-    FOREIGN KEY (player_id) REFERENCES users(user_id),
-    FOREIGN KEY (system_id) REFERENCES systems(system_id)
-);
+    FOREIGN KEY (player_id) REFERENCES users(user_id)
+) WITHOUT ROWID;
 
 -- Data exporting was unselected.
 
+-- Dumping structure for view GPTLeague.rating_history
+CREATE VIEW IF NOT EXISTS rating_history AS
+SELECT rc.game_id, rc.player_id, g.system_id,
+       rc.old_rating / 100.0 AS old_rating,
+       rc.new_rating / 100.0 AS new_rating,
+       rc.k_factor_used,
+       rc.expected_score / 10000.0 AS expected_score,
+       CASE gp.result WHEN 'win' THEN 1.0 WHEN 'loss' THEN 0.0 ELSE 0.5 END AS actual_score
+FROM rating_changes rc
+JOIN games g ON g.game_id = rc.game_id
+LEFT JOIN game_participants gp ON gp.game_id = rc.game_id AND gp.player_id = rc.player_id;
+
 -- Dumping structure for table GPTLeague.seasons
 CREATE TABLE IF NOT EXISTS seasons (
     season_id          INTEGER PRIMARY KEY,
@@ -151,6 +286,47 @@ CREATE TABLE IF NOT EXISTS seasons (
 
 -- Data exporting was unselected.
 
+-- Dumping structure for table GPTLeague.season_archives
+CREATE TABLE IF NOT EXISTS season_archives (
+    season_id          INTEGER PRIMARY KEY,
+    file_name          TEXT NOT NULL,           -- e.g., "archives/season_2025.db"
+    first_played       TEXT,
+    last_played        TEXT,
+    games              INTEGER NOT NULL DEFAULT 0,
+    archived_at        TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (season_id) REFERENCES seasons(season_id)
+);
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.staged_uploads
+CREATE TABLE IF NOT EXISTS staged_uploads (
+    upload_id          TEXT PRIMARY KEY,
+    kind               TEXT NOT NULL,           -- 'games' or 'users'
+    created_by         INTEGER NOT NULL,
+    status             TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','confirmed','cancelled')),
+    row_count          INTEGER NOT NULL DEFAULT 0,
+    error_count        INTEGER NOT NULL DEFAULT 0,
+    created_at         TEXT NOT NULL DEFAULT (datetime('now')),
+    expires_at         TEXT NOT NULL,
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Data exporting was unselected.
+
+-- Dumping structure for table GPTLeague.staged_upload_rows
+CREATE TABLE IF NOT EXISTS staged_upload_rows (
+    upload_id          TEXT NOT NULL,
+    row_number         INTEGER NOT NULL,
+    data               TEXT NOT NULL,           -- JSON of the raw CSV row
+    preview            TEXT NOT NULL,           -- JSON of the validated preview row
+    has_errors         INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (upload_id, row_number),
+    FOREIGN KEY (upload_id) REFERENCES staged_uploads(upload_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Data exporting was unselected.
+
 -- Dumping structure for table GPTLeague.systems
 CREATE TABLE IF NOT EXISTS systems (
     system_id          INTEGER PRIMARY KEY,
@@ -184,6 +360,8 @@ CREATE TABLE IF NOT EXISTS users (
     is_active      INTEGER NOT NULL DEFAULT 1,
     created_at     TEXT NOT NULL DEFAULT (datetime('now'))
 , "full_name" TEXT NOT NULL, is_provisional INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS idx_users_user_name ON users(user_name);
+CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name);
 
 -- Data exporting was unselected.
 
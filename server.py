@@ -5,9 +5,21 @@ Main Flask application entry point and configuration.
 import os
 import sqlite3
 import logging
-from flask import Flask, session
-from flask_session import Session
+from flask import Flask, current_app, request, session
 from routes import register_blueprints
+from archive import ensure_archive_table
+from compaction import ensure_compact_storage
+from aggregates import ensure_aggregate_tables
+from batch_import import ensure_import_indexes
+from staging import ensure_staging_tables
+from jobs import ensure_job_tables
+from session_store import SqliteSessionInterface, ensure_session_table
+from backups import start_backup_scheduler
+from changes import ensure_change_log
+from helpers import ensure_league_settings_table
+from maintenance import note_activity, start_maintenance_scheduler
+from prerender import request_refresh, start_prerender_worker
+from read_snapshot import read_connection
 
 # Configure logging
 logging.basicConfig(
@@ -24,10 +36,18 @@ MAXVALUE_GENERALSHIP = 40
 MAXVALUE_GAMESPLAYED = 10
 MAXVALUE_UNIQUE = 30
 
+# Public pages whose anonymous GET responses may be cached by browsers and proxies
+PUBLIC_ENDPOINTS = {
+    "main.elo_ratings", "main.about", "main.league_formats", "main.documents",
+    "main.events", "main.people", "main.contact",
+    "stats.overall", "stats.factionstats", "stats.faction_matchups_json",
+}
+PUBLIC_CACHE_SECONDS = 60
+
 
 def inject_systems():
     """Inject available systems into template context."""
-    with sqlite3.connect("GPTLeague.db") as conn:
+    with read_connection() as conn:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         systems_list = cursor.execute("SELECT system_id, system_name FROM systems").fetchall()
@@ -36,8 +56,9 @@ def inject_systems():
 
 def inject_current_user():
     """Inject current user info into template context."""
-    if 'user_id' in session:
-        with sqlite3.connect("GPTLeague.db") as conn:
+    # Anonymous visitors have no session cookie; skip the session and user lookups
+    if request.cookies.get(session_cookie_name()) and 'user_id' in session:
+        with read_connection() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             user = cursor.execute(
@@ -59,28 +80,71 @@ def inject_current_user():
     return dict(current_user=None)
 
 
+_user_count = 0
+
+
 def inject_user_count():
-    """Inject total user count for registration visibility."""
+    """Inject total user count for registration visibility.
+
+    Templates only check whether any user exists, so once one does the count
+    is cached and later requests skip the query.
+    """
+    global _user_count
+    if _user_count:
+        return dict(user_count=_user_count)
     try:
         with sqlite3.connect("GPTLeague.db") as conn:
             cursor = conn.cursor()
-            user_count = cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-            return dict(user_count=user_count)
+            _user_count = cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            return dict(user_count=_user_count)
     except:
         return dict(user_count=0)
 
 
+def session_cookie_name():
+    """Name of the session cookie."""
+    return current_app.session_interface.get_cookie_name(current_app)
+
+
+def ensure_tables():
+    """Create tables added after the original schema on existing databases."""
+    try:
+        with sqlite3.connect("GPTLeague.db") as conn:
+            cursor = conn.cursor()
+            ensure_archive_table(cursor)
+            ensure_compact_storage(conn)
+            ensure_import_indexes(cursor)
+            ensure_staging_tables(cursor)
+            ensure_aggregate_tables(conn)
+            # Before the change log, which adds triggers to it
+            ensure_league_settings_table(cursor)
+            ensure_change_log(cursor)
+        ensure_job_tables()
+        ensure_session_table()
+    except Exception as e:
+        logger.error(f"Error creating application tables: {str(e)}")
+
+
 def create_app():
     """Create and configure the Flask application."""
     app = Flask(__name__)
     
-    # Configure session
-    app.config["SESSION_PERMANENT"] = False
-    app.config["SESSION_TYPE"] = "filesystem"
-    Session(app)
+    # Configure session: server-side, stored in sessions.db
+    app.session_interface = SqliteSessionInterface()
+
+    ensure_tables()
+
+    # Periodic backups, when BACKUP_INTERVAL_MINUTES is set
+    start_backup_scheduler()
+
+    # ANALYZE / incremental vacuum while the site is idle
+    start_maintenance_scheduler()
     
     # Register blueprints
     register_blueprints(app)
+
+    # Keep the pages served statically by Apache current, once they have been built
+    start_prerender_worker(app)
     
     # Register context processors
     app.context_processor(inject_systems)
@@ -90,7 +154,17 @@ def create_app():
     # Register after_request handler
     @app.after_request
     def after_request(response):
-        """Ensure responses aren't cached"""
+        """Ensure responses aren't cached, except anonymous views of public pages"""
+        note_activity()
+        if request.method != "GET":
+            request_refresh()
+        if (request.method == "GET" and request.endpoint in PUBLIC_ENDPOINTS
+                and response.status_code == 200
+                and not request.cookies.get(session_cookie_name()) and not session):
+            response.headers["Cache-Control"] = f"public, max-age={PUBLIC_CACHE_SECONDS}"
+            response.vary.add("Cookie")
+            return response
+
         response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         response.headers["Expires"] = 0
         response.headers["Pragma"] = "no-cache"
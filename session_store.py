@@ -0,0 +1,158 @@
+"""
+session_store.py
+----------------
+Server-side sessions stored in a SQLite table.
+
+The cookie only carries a random session id; the session dict is kept in the
+`sessions` table of a sidecar database (`SESSIONS_DB`) keyed by that id and
+serialized with Flask's tagged JSON serializer. Rows are only written when
+the session was modified, or when less than half of its lifetime is left so
+an active user's session does not expire. Expired rows are swept at most
+every SESSION_SWEEP_SECONDS. Requests without a session cookie never touch
+the database.
+"""
+
+import time
+import secrets
+import sqlite3
+import logging
+import threading
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DB = "sessions.db"
+
+# How often expired rows are deleted
+SESSION_SWEEP_SECONDS = 15 * 60
+
+_serializer = TaggedJSONSerializer()
+_local = threading.local()
+
+
+def _connection():
+    """Per-thread connection to SESSIONS_DB, opened on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SESSIONS_DB, timeout=30, isolation_level=None)
+        _local.conn = conn
+    return conn
+
+
+def ensure_session_table():
+    """Create the sessions table and drop rows that have already expired."""
+    conn = _connection()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,                          -- tagged JSON of the session dict
+            expires_at INTEGER NOT NULL                  -- unix time
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+    sweep_expired()
+
+
+def sweep_expired():
+    """Delete expired sessions."""
+    deleted = _connection().execute(
+        "DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),)
+    ).rowcount
+    if deleted:
+        logger.info(f"Swept {deleted} expired session(s)")
+
+
+def clear_sessions():
+    """Delete every stored session, logging everyone out."""
+    _connection().execute("DELETE FROM sessions")
+
+
+class SqliteSession(SecureCookieSession):
+    """Session dict that remembers its id and stored expiry."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Flask session interface backed by the `sessions` table."""
+
+    def __init__(self):
+        self._last_sweep = 0
+        self._sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return SqliteSession()
+
+        row = _connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE session_id = ? AND expires_at > ?",
+            (sid, int(time.time()))
+        ).fetchone()
+        if not row:
+            return SqliteSession()
+        return SqliteSession(_serializer.loads(row[0]), sid=sid, expires_at=row[1])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # An emptied session is deleted along with its cookie
+        if not session:
+            if session.modified and session.sid:
+                _connection().execute("DELETE FROM sessions WHERE session_id = ?", (session.sid,))
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly
+                )
+                response.vary.add("Cookie")
+            return
+
+        now = int(time.time())
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        refresh = session.expires_at is not None and session.expires_at - now < lifetime // 2
+        if session.modified or refresh or not session.sid:
+            new_session = not session.sid
+            if new_session:
+                session.sid = secrets.token_urlsafe(32)
+            _connection().execute("""
+                INSERT INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            """, (session.sid, _serializer.dumps(dict(session)), now + lifetime))
+
+            if new_session or session.permanent:
+                response.set_cookie(
+                    name,
+                    session.sid,
+                    expires=self.get_expiration_time(app, session),
+                    httponly=httponly,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    samesite=samesite,
+                )
+                response.vary.add("Cookie")
+
+        self._maybe_sweep(now)
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep < SESSION_SWEEP_SECONDS or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            sweep_expired()
+        except sqlite3.Error as e:
+            logger.warning(f"Session sweep failed: {e}")
+        finally:
+            self._sweep_lock.release()
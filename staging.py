@@ -0,0 +1,248 @@
+"""
+staging.py
+----------
+Database staging area for uploaded CSVs.
+
+Batch uploads are parsed and validated on the preview request and stored in
+`staged_uploads` / `staged_upload_rows` under a random upload id; only that
+id is kept in the session. The confirm request streams the rows back from the
+table in row order, so upload size does not affect session size and any
+worker can confirm an upload.
+
+`stage_csv()` reads the uploaded file incrementally and validates and stores
+it one chunk at a time, so memory stays flat regardless of file size.
+"""
+
+import csv
+import json
+import secrets
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Unconfirmed uploads are discarded after this many hours
+STAGED_UPLOAD_TTL_HOURS = 24
+
+# Rows parsed, validated and read back per chunk
+STAGED_CHUNK_SIZE = 500
+
+# Rows shown per preview page
+PREVIEW_PAGE_SIZE = 100
+
+
+def ensure_staging_tables(cursor):
+    """Create the staging tables if they do not exist yet."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_uploads (
+            upload_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,                          -- 'games' or 'users'
+            created_by INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'confirmed', 'cancelled')),
+            row_count INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at TEXT NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_upload_rows (
+            upload_id TEXT NOT NULL,
+            row_number INTEGER NOT NULL,
+            data TEXT NOT NULL,                          -- JSON of the raw CSV row
+            preview TEXT NOT NULL,                       -- JSON of the validated preview row
+            has_errors INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (upload_id, row_number),
+            FOREIGN KEY (upload_id) REFERENCES staged_uploads(upload_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+
+def purge_expired(cursor):
+    """Delete expired uploads and the rows of uploads that are no longer pending."""
+    cursor.execute("""
+        DELETE FROM staged_upload_rows
+        WHERE upload_id IN (
+            SELECT upload_id FROM staged_uploads
+            WHERE status != 'pending' OR expires_at <= datetime('now')
+        )
+    """)
+    cursor.execute("DELETE FROM staged_uploads WHERE expires_at <= datetime('now')")
+
+
+def create_upload(connection, kind, created_by, rows=(), previews=()):
+    """
+    Stage a parsed upload, replacing the user's previous pending upload of the same kind.
+
+    Args:
+        connection (sqlite3.Connection): Active database connection.
+        kind (str): 'games' or 'users'.
+        created_by (int): Admin user id.
+        rows (list): Raw CSV row dicts; more can be added with `append_rows()`.
+        previews (list): Validated preview dicts (same order), each with an `errors` list.
+
+    Returns:
+        str: The new upload id.
+    """
+    cursor = connection.cursor()
+    purge_expired(cursor)
+    cursor.execute("""
+        UPDATE staged_uploads SET status = 'cancelled'
+        WHERE kind = ? AND created_by = ? AND status = 'pending'
+    """, (kind, created_by))
+
+    upload_id = secrets.token_hex(16)
+    cursor.execute("""
+        INSERT INTO staged_uploads (upload_id, kind, created_by, expires_at)
+        VALUES (?, ?, ?, datetime('now', ?))
+    """, (upload_id, kind, created_by, f"+{STAGED_UPLOAD_TTL_HOURS} hours"))
+    append_rows(cursor, upload_id, rows, previews)
+    connection.commit()
+    return upload_id
+
+
+def stage_csv(connection, kind, created_by, text_stream, required_columns, validate,
+              chunk_size=STAGED_CHUNK_SIZE):
+    """
+    Parse a CSV stream chunk by chunk, validating and staging each chunk as it is read.
+
+    Args:
+        connection (sqlite3.Connection): Active database connection.
+        kind (str): 'games' or 'users'.
+        created_by (int): Admin user id.
+        text_stream (io.TextIOBase): The uploaded file, decoded lazily.
+        required_columns (set): Header names the file must contain.
+        validate (callable): validate(rows, first_row_number) -> list of preview dicts.
+        chunk_size (int): Rows per chunk.
+
+    Returns:
+        str: The upload id.
+
+    Raises:
+        ValueError: The file is empty or misses required columns.
+    """
+    reader = csv.DictReader(text_stream)
+    if not reader.fieldnames:
+        raise ValueError("CSV file is empty")
+    if not set(required_columns).issubset(reader.fieldnames):
+        raise ValueError(f"CSV missing required columns. Required: {', '.join(required_columns)}")
+
+    upload_id = create_upload(connection, kind, created_by)
+    cursor = connection.cursor()
+    next_row = 1
+    try:
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            append_rows(cursor, upload_id, rows, validate(rows, next_row))
+            connection.commit()
+            next_row += len(rows)
+    except Exception:
+        connection.rollback()
+        finish_upload(connection, upload_id, "cancelled")
+        raise
+
+    if next_row == 1:
+        finish_upload(connection, upload_id, "cancelled")
+        raise ValueError("CSV file is empty")
+    logger.info(f"Staged {kind} upload {upload_id}: {next_row - 1} rows")
+    return upload_id
+
+
+def append_rows(cursor, upload_id, rows, previews):
+    """Add validated rows to a staged upload and update its counters."""
+    staged = [
+        (upload_id, preview["row"], json.dumps(row), json.dumps(preview), 1 if preview["errors"] else 0)
+        for row, preview in zip(rows, previews)
+    ]
+    cursor.executemany("""
+        INSERT INTO staged_upload_rows (upload_id, row_number, data, preview, has_errors)
+        VALUES (?, ?, ?, ?, ?)
+    """, staged)
+    cursor.execute("""
+        UPDATE staged_uploads
+        SET row_count = row_count + ?, error_count = error_count + ?
+        WHERE upload_id = ?
+    """, (len(staged), sum(row[4] for row in staged), upload_id))
+
+
+def get_upload(cursor, upload_id, kind, created_by):
+    """
+    Return the staged_uploads row when it is pending, unexpired and owned by created_by.
+
+    Returns:
+        tuple: (upload_id, row_count, error_count), or None.
+    """
+    if not upload_id:
+        return None
+    return cursor.execute("""
+        SELECT upload_id, row_count, error_count
+        FROM staged_uploads
+        WHERE upload_id = ? AND kind = ? AND created_by = ?
+          AND status = 'pending' AND expires_at > datetime('now')
+    """, (upload_id, kind, created_by)).fetchone()
+
+
+def preview_page(cursor, upload_id, page=1, page_size=PREVIEW_PAGE_SIZE):
+    """Return one page of validated preview dicts; row numbers are contiguous from 1."""
+    first_row = (page - 1) * page_size + 1
+    return [
+        json.loads(row[0]) for row in cursor.execute("""
+            SELECT preview FROM staged_upload_rows
+            WHERE upload_id = ? AND row_number BETWEEN ? AND ?
+            ORDER BY row_number
+        """, (upload_id, first_row, first_row + page_size - 1)).fetchall()
+    ]
+
+
+def error_rows(cursor, upload_id, limit=50):
+    """Return the first `limit` preview dicts that have validation errors."""
+    return [
+        json.loads(row[0]) for row in cursor.execute("""
+            SELECT preview FROM staged_upload_rows
+            WHERE upload_id = ? AND has_errors = 1
+            ORDER BY row_number
+            LIMIT ?
+        """, (upload_id, limit)).fetchall()
+    ]
+
+
+def warning_count(cursor, upload_id):
+    """Number of staged rows whose preview carries warnings (e.g. possible duplicates)."""
+    return cursor.execute("""
+        SELECT COUNT(*) FROM staged_upload_rows
+        WHERE upload_id = ? AND has_errors = 0 AND json_array_length(preview, '$.warnings') > 0
+    """, (upload_id,)).fetchone()[0]
+
+
+def iter_rows(cursor, upload_id, chunk_size=STAGED_CHUNK_SIZE):
+    """
+    Stream a staged upload in row order, one chunk per query.
+
+    Yields:
+        tuple: (row_number, raw CSV row dict, preview dict)
+    """
+    last_row = 0
+    while True:
+        chunk = cursor.execute("""
+            SELECT row_number, data, preview FROM staged_upload_rows
+            WHERE upload_id = ? AND row_number > ?
+            ORDER BY row_number
+            LIMIT ?
+        """, (upload_id, last_row, chunk_size)).fetchall()
+        if not chunk:
+            return
+        for row_number, data, preview in chunk:
+            yield row_number, json.loads(data), json.loads(preview)
+        last_row = chunk[-1][0]
+
+
+def finish_upload(connection, upload_id, status="confirmed"):
+    """Mark an upload as confirmed or cancelled and drop its staged rows."""
+    cursor = connection.cursor()
+    cursor.execute("UPDATE staged_uploads SET status = ? WHERE upload_id = ?", (status, upload_id))
+    cursor.execute("DELETE FROM staged_upload_rows WHERE upload_id = ?", (upload_id,))
+    connection.commit()